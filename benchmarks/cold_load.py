@@ -0,0 +1,56 @@
+"""Measure the cold-load time of the packaged data.
+
+Each measurement loads the data files in a fresh interpreter, either from
+the precompiled snapshots or by parsing the JSON files. Build the
+snapshots with ``make snapshot`` and run from the repository root::
+
+    python -m benchmarks.cold_load --repeat 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+LOADER = """
+import time
+from dpres_file_formats import json_handler
+json_handler.USE_SNAPSHOTS = {use_snapshots}
+start = time.perf_counter()
+json_handler.shared_file_formats_json()
+json_handler.shared_container_streams_json()
+print(time.perf_counter() - start)
+"""
+
+CASES = {
+    "snapshot": True,
+    "json": False,
+}
+
+
+def measure(use_snapshots, repeat):
+    """Return the load times in seconds, each measured in a new
+    interpreter.
+    """
+    code = LOADER.format(use_snapshots=use_snapshots)
+    return [
+        float(subprocess.run([sys.executable, "-c", code], check=True,
+                             capture_output=True, text=True).stdout)
+        for _ in range(repeat)
+    ]
+
+
+def main(argv=None):
+    """Print the median and minimum load time of each path."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Number of interpreters to start per path")
+    args = parser.parse_args(argv)
+
+    for name, use_snapshots in CASES.items():
+        times = measure(use_snapshots, args.repeat)
+        print(f"{name:10} median {statistics.median(times) * 1000:7.2f} ms"
+              f"   min {min(times) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Measure grading of multi-track AV container files.
+
+The inputs are MXF and Matroska files with many audio and video tracks,
+graded with ContainerStreamsGrader alone and with the full grade()
+pipeline. Run from the repository root::
+
+    python -m benchmarks.container_grading
+"""
+import argparse
+import timeit
+
+from dpres_file_formats.graders import ContainerStreamsGrader, grade
+
+
+def _streams(container, tracks):
+    streams = {0: {"mimetype": container[0], "version": container[1]}}
+    for index, track in enumerate(tracks, start=1):
+        streams[index] = {"mimetype": track[0], "version": track[1]}
+    return streams
+
+
+UNAP = "(:unap)"
+
+CASES = {
+    "MXF, 1 video + 16 LPCM audio": (
+        "application/mxf", UNAP,
+        _streams(("application/mxf", UNAP),
+                 [("video/jpeg2000", UNAP)]
+                 + [(f"audio/L{bits}", UNAP)
+                    for bits in (8, 16, 20, 24)] * 4)),
+    "MXF, mixed grades, 8 tracks": (
+        "application/mxf", UNAP,
+        _streams(("application/mxf", UNAP),
+                 [("video/h264", UNAP), ("video/mpeg", "2"),
+                  ("audio/aac", UNAP), ("audio/mpeg", "1"),
+                  ("audio/mpeg", "2"), ("audio/L16", UNAP),
+                  ("audio/L24", UNAP), ("video/dv", UNAP)])),
+    "Matroska, 2 video + 12 audio": (
+        "video/x-matroska", "4",
+        _streams(("video/x-matroska", "4"),
+                 [("video/x-ffv", "3"), ("video/h265", UNAP)]
+                 + [("audio/flac", UNAP), ("audio/L24", UNAP),
+                    ("audio/L16", UNAP)] * 4)),
+    "Matroska, unacceptable last track": (
+        "video/x-matroska", "4",
+        _streams(("video/x-matroska", "4"),
+                 [("video/x-ffv", "3")] + [("audio/flac", UNAP)] * 10
+                 + [("audio/unknown", UNAP)])),
+}
+
+
+def main(argv=None):
+    """Print the time per graded file for each case."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000,
+                        help="Number of files to grade per case")
+    args = parser.parse_args(argv)
+
+    for name, (mimetype, version, streams) in CASES.items():
+        grader = ContainerStreamsGrader(mimetype, version, streams)
+        grader_time = min(timeit.repeat(
+            grader.grade, number=args.number, repeat=3)) / args.number
+        grade_time = min(timeit.repeat(
+            lambda: grade(mimetype, version, streams),
+            number=args.number, repeat=3)) / args.number
+        print(f"{name:36} grader {grader_time * 1e6:6.2f} us"
+              f"   grade() {grade_time * 1e6:6.2f} us"
+              f"   {grader.grade()}")
+
+
+if __name__ == "__main__":
+    main()
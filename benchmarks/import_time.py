@@ -0,0 +1,59 @@
+"""Measure the startup cost of the package.
+
+Each measurement runs in a fresh interpreter, so that nothing is cached
+between the runs. Run from the repository root::
+
+    python -m benchmarks.import_time --repeat 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+CASES = {
+    "import dpres_file_formats": "import dpres_file_formats",
+    "import dpres_file_formats.defaults":
+        "import dpres_file_formats.defaults",
+    "import and grade one file": (
+        "from dpres_file_formats import grade; "
+        "grade('application/pdf', 'A-1a', {})"
+    ),
+}
+
+TIMER = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(code, repeat):
+    """Return the run times of the code in seconds, each measured in a new
+    interpreter.
+    """
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", TIMER.format(code=code)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        times.append(float(output))
+    return times
+
+
+def main(argv=None):
+    """Print the median and minimum time of each case."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Number of interpreters to start per case")
+    args = parser.parse_args(argv)
+
+    for name, code in CASES.items():
+        times = measure(code, args.repeat)
+        print(f"{name:40} median {statistics.median(times) * 1000:7.2f} ms"
+              f"   min {min(times) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
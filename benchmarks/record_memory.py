@@ -0,0 +1,69 @@
+"""Compare the memory used by the registry as dicts and as records.
+
+The memory retained by each representation of the packaged data is
+measured with tracemalloc, after the parsed JSON used to build it has been
+released. Run from the repository root::
+
+    python -m benchmarks.record_memory
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from importlib.resources import files
+
+from dpres_file_formats.records import ContainerRule, FileFormat
+
+
+def _load(resource_name):
+    data_file = files("dpres_file_formats.data") / resource_name
+    return json.loads(data_file.read_bytes())["file_formats"]
+
+
+def dicts():
+    """Nested dicts as parsed from JSON, and flattened version dicts."""
+    formats = _load("file_formats.json")
+    flattened = []
+    for format_dict in formats:
+        format_keys = {key: value for key, value in format_dict.items()
+                       if key not in ("versions", "_id")}
+        flattened.extend({**format_keys, **version_dict}
+                         for version_dict in format_dict["versions"])
+    return formats, flattened, _load("av_container_grading.json")
+
+
+def records():
+    """File format and container records."""
+    formats = [FileFormat.from_dict(format_dict)
+               for format_dict in _load("file_formats.json")]
+    containers = [ContainerRule.from_dict(container)
+                  for container in _load("av_container_grading.json")]
+    return formats, containers
+
+
+def retained_memory(build):
+    """Return the number of bytes retained by the result of build."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main(argv=None):
+    """Print the memory retained by each representation."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.parse_args(argv)
+
+    dict_size = retained_memory(dicts)
+    record_size = retained_memory(records)
+    print(f"{'dicts':10} {dict_size / 1024:8.1f} KiB")
+    print(f"{'records':10} {record_size / 1024:8.1f} KiB"
+          f"   ({record_size / dict_size:.0%} of dicts)")
+
+
+if __name__ == "__main__":
+    main()
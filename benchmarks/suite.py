@@ -0,0 +1,432 @@
+"""Run the benchmark suite and compare the results with a baseline.
+
+The suite measures importing the package, ``file_formats()`` with each
+filter combination, ``grade()`` for the different kinds of files,
+``grade_many()`` on a synthetic corpus, the lookups of the ``query``
+module, comparing spec versions with the ``diff`` module and the
+functions updating the registry. The updating functions are run on
+temporary copies of the data files. Times are seconds per call.
+
+The times of one process can differ from those of another by tens of
+percent, so the suite is run in several new interpreters and their
+measurements are pooled. A benchmark counts as a regression only when its
+median is slower than the baseline by more than the tolerance and its
+interquartile range lies above that of the baseline, so that the noise of
+the measurements does not fail the comparison. Run from the repository
+root::
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json
+
+The committed baseline is updated with::
+
+    python -m benchmarks.suite --output benchmarks/baseline.json
+"""
+import argparse
+import contextlib
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+from importlib.resources import files
+from itertools import count, product
+from pathlib import Path
+
+from benchmarks import container_grading, import_time, unacceptable_corpus
+from dpres_file_formats import (
+    add_av_container,
+    add_format,
+    add_version_to_format,
+    diff,
+    graders,
+    json_handler,
+    query,
+    read_file_formats,
+    replace_format,
+)
+from dpres_file_formats.registry import REGISTRY
+
+RESULTS_VERSION = 2
+
+# Minimum time of one measurement in seconds
+MIN_MEASUREMENT_TIME = 0.2
+
+UNAP = "(:unap)"
+
+GRADE_CASES = {
+    "mime": ("application/pdf", "A-1a", {}),
+    "text": ("text/plain", UNAP,
+             {0: {"mimetype": "text/plain", "version": UNAP,
+                  "charset": "UTF-8"}}),
+    "container": container_grading.CASES["MXF, 1 video + 16 LPCM audio"],
+    "container_unacceptable": container_grading.CASES[
+        "Matroska, unacceptable last track"],
+    "non_container": ("image/png", "1.2",
+                      {0: {"mimetype": "image/png", "version": "1.2"}}),
+    "non_container_unacceptable": (
+        "image/png", "1.2",
+        {0: {"mimetype": "image/png", "version": "1.2"},
+         1: {"mimetype": "image/png", "version": "1.2"}}),
+    "unknown": ("application/x-msdownload", UNAP, {}),
+}
+
+IMPORT_CASES = {
+    "package": import_time.CASES["import dpres_file_formats"],
+    "grade_one_file": import_time.CASES["import and grade one file"],
+}
+
+
+def time_call(function, repeat):
+    """Return the times of calling the function in seconds per call.
+
+    The number of calls per measurement is chosen so that one measurement
+    takes at least :data:`MIN_MEASUREMENT_TIME` seconds.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < MIN_MEASUREMENT_TIME:
+        number *= 2
+    return [total / number for total in timer.repeat(repeat, number)]
+
+
+@contextlib.contextmanager
+def temporary_data():
+    """Make the package read and write temporary copies of the data
+    files.
+    """
+    original_resource_path = json_handler.resource_path
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {}
+        for resource_name in (json_handler.FILE_FORMATS_NAME,
+                              json_handler.CONTAINERS_STREAMS_NAME):
+            paths[resource_name] = Path(directory) / resource_name
+            with (files(json_handler.DATA_MODULE_NAME)
+                  / resource_name).open("rb") as source, \
+                    paths[resource_name].open("wb") as target:
+                shutil.copyfileobj(source, target)
+
+        @contextlib.contextmanager
+        def resource_path(_module, resource_name):
+            yield paths[resource_name]
+
+        json_handler.resource_path = resource_path
+        REGISTRY.reset()
+        try:
+            yield
+        finally:
+            json_handler.resource_path = original_resource_path
+            REGISTRY.reset()
+
+
+def import_benchmarks(repeat):
+    """Yield the names and times of the import benchmarks."""
+    for name, code in IMPORT_CASES.items():
+        yield f"import/{name}", import_time.measure(code, repeat)
+
+
+def file_formats_benchmarks(repeat):
+    """Yield the names and times of the file_formats benchmarks."""
+    for deprecated, unofficial, versions_separately in product(
+            (False, True), repeat=3):
+        options = [option for option, enabled in (
+            ("deprecated", deprecated), ("unofficial", unofficial),
+            ("flat", versions_separately)) if enabled]
+        name = "file_formats/" + ("-".join(options) or "nested")
+        yield name, time_call(
+            lambda d=deprecated, u=unofficial, v=versions_separately:
+            read_file_formats.file_formats(
+                deprecated=d, unofficial=u, versions_separately=v),
+            repeat)
+    yield "file_formats/views", time_call(
+        lambda: read_file_formats.file_formats(views=True), repeat)
+    yield "file_formats/records", time_call(
+        lambda: read_file_formats.file_formats(records=True), repeat)
+    yield "file_formats/views_as_of", time_call(
+        lambda: read_file_formats.file_formats(views=True, as_of="1.10.0"),
+        repeat)
+    yield "av_container_grading", time_call(
+        read_file_formats.av_container_grading, repeat)
+
+
+def grade_benchmarks(repeat):
+    """Yield the names and times of the grading benchmarks."""
+    for name, (mimetype, version, streams) in GRADE_CASES.items():
+        yield f"grade/{name}", time_call(
+            lambda m=mimetype, v=version, s=streams: graders.grade(m, v, s),
+            repeat)
+
+    mimetype, version, streams = GRADE_CASES["mime"]
+    yield "grade/mime_as_of", time_call(
+        lambda: graders.grade(mimetype, version, streams, as_of="1.10.0"),
+        repeat)
+
+    corpus = unacceptable_corpus.corpus(10000, 0.5)
+    yield "grade/corpus_per_file", [
+        total / len(corpus) for total in timeit.repeat(
+            lambda: [graders.grade(*file) for file in corpus],
+            number=1, repeat=repeat)
+    ]
+    yield "grade_many/corpus_per_file", [
+        total / len(corpus) for total in timeit.repeat(
+            lambda: list(graders.grade_many(corpus)),
+            number=1, repeat=repeat)
+    ]
+
+    yield "grade_by_puid/fmt_199", time_call(
+        lambda: graders.grade_by_puid("fmt/199"), repeat)
+
+    # The scan and grading of each version that the PUID index replaces
+    yield "grade_by_puid/scan", time_call(
+        lambda: graders.weakest_grade([
+            graders.grade(version["mimetype"], version["version"],
+                          {0: {"mimetype": version["mimetype"],
+                               "version": version["version"]}})
+            for version in read_file_formats.file_formats(
+                deprecated=True, unofficial=True, views=True)
+            if "fmt/199" in query.split_puids(
+                version["format_registry_key"])
+            and version["active"]]),
+        repeat)
+
+
+def query_benchmarks(repeat):
+    """Yield the names and times of the query benchmarks."""
+    for name, function, argument in (
+            ("by_puid", query.by_puid, "fmt/199"),
+            ("by_extension", query.by_extension, ".pdf"),
+            ("by_content_type", query.by_content_type, "video"),
+            ("by_version_id", query.by_version_id, "FI_DPRES_PDF_1_1.7"),
+            ("by_mimetype", query.by_mimetype, "application/pdf")):
+        yield f"query/{name}", time_call(
+            lambda f=function, a=argument: f(a), repeat)
+
+    # The scan that the PUID index replaces
+    yield "query/by_puid_scan", time_call(
+        lambda: [version for version in read_file_formats.file_formats(
+            deprecated=True, unofficial=True, views=True)
+            if version["format_registry_key"] == "fmt/199"],
+        repeat)
+
+    yield "query/diff_specs", time_call(
+        lambda: diff.diff_specs("1.11.0", "1.12.0"), repeat)
+
+
+def update_benchmarks(repeat):
+    """Yield the names and times of the registry update benchmarks."""
+    names = count()
+
+    def new_format():
+        return add_format(mimetype="application/x-benchmark",
+                          content_type="TEXT",
+                          format_name_long="Benchmark format",
+                          format_name_short=f"BENCH{next(names)}")
+
+    with temporary_data():
+        yield "add_format", time_call(new_format, repeat)
+
+    with temporary_data():
+        format_id = new_format()
+        versions = count()
+        yield "add_version_to_format", time_call(
+            lambda: add_version_to_format(
+                format_id=format_id, grade="RECOMMENDED",
+                support_in_dps_ingest=True, active=True,
+                version=str(next(versions))),
+            repeat)
+
+    with temporary_data():
+        superseded_format = new_format()
+        superseding_format = new_format()
+        yield "replace_format", time_call(
+            lambda: replace_format(superseded_format, superseding_format,
+                                   "V13"),
+            repeat)
+
+    with temporary_data():
+        yield "add_av_container", time_call(
+            lambda: add_av_container(
+                version_id="FI_DPRES_MXF_1_UNAP", grade="RECOMMENDED",
+                video_streams=["FI_DPRES_AVC_1_UNAP"],
+                audio_streams=["FI_DPRES_AAC_1_UNAP"]),
+            repeat)
+
+
+GROUPS = {
+    "import": import_benchmarks,
+    "file_formats": file_formats_benchmarks,
+    "grade": grade_benchmarks,
+    "query": query_benchmarks,
+    "update": update_benchmarks,
+}
+
+
+def measure(groups, repeat):
+    """Run the benchmarks in this process.
+
+    :param groups: Names of the benchmark groups to run
+    :param repeat: Number of measurements per benchmark
+    :returns: Dict of the times of each benchmark
+    """
+    return {name: times
+            for group in groups
+            for name, times in GROUPS[group](repeat)}
+
+
+def measure_in_processes(groups, repeat, runs):
+    """Run the benchmarks in new interpreters and pool their times.
+
+    :param groups: Names of the benchmark groups to run
+    :param repeat: Number of measurements per benchmark in each run
+    :param runs: Number of interpreters to run the benchmarks in
+    :returns: Dict of the pooled times of each benchmark
+    """
+    pooled = {}
+    with tempfile.TemporaryDirectory() as directory:
+        output = Path(directory) / "results.json"
+        for run_number in range(1, runs + 1):
+            print(f"Run {run_number}/{runs}", flush=True)
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.suite", "--runs", "1",
+                 "--repeat", str(repeat), "--output", str(output)]
+                + [f"--group={group}" for group in groups],
+                check=True, stdout=subprocess.DEVNULL)
+            results = json.loads(output.read_text(encoding="utf-8"))
+            for name, result in results["results"].items():
+                pooled.setdefault(name, []).extend(result["times"])
+    return pooled
+
+
+def run(groups, repeat, runs=1):
+    """Run the benchmarks and return the results.
+
+    :param groups: Names of the benchmark groups to run
+    :param repeat: Number of measurements per benchmark in each run
+    :param runs: Number of new interpreters to run the benchmarks in, or
+        1 to run them in this process
+    :returns: Results dict, as written to the results file
+    """
+    if runs == 1:
+        times_by_name = measure(groups, repeat)
+    else:
+        times_by_name = measure_in_processes(groups, repeat, runs)
+
+    results = {}
+    for name, times in times_by_name.items():
+        first_quartile, median, third_quartile = statistics.quantiles(
+            times, n=4)
+        results[name] = {
+            "min": min(times),
+            "q1": first_quartile,
+            "median": median,
+            "q3": third_quartile,
+            "repeat": len(times),
+            "times": times,
+        }
+        print(f"{name:45} median {_format_time(median)}"
+              f"   IQR {_format_time(first_quartile)} - "
+              f"{_format_time(third_quartile)}",
+              flush=True)
+    return {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Compare the results with the baseline.
+
+    A benchmark is slower than allowed when its median is slower than the
+    median of the baseline by more than the tolerance, and its first
+    quartile is slower than the third quartile of the baseline, so that a
+    change within the noise of the measurements is not reported.
+
+    :param results: Results dict of this run
+    :param baseline: Results dict of the baseline
+    :param tolerance: Allowed slowdown, as a fraction of the baseline
+    :returns: Names of the benchmarks slower than allowed
+    :raises ValueError: if the baseline was written by another version
+        of the suite
+    """
+    if baseline.get("version") != RESULTS_VERSION:
+        raise ValueError("The baseline was written by another version of "
+                         "the suite, write it again")
+    regressions = []
+    print(f"\n{'benchmark':45} {'baseline':>10} {'current':>10}  change")
+    for name, result in results["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            print(f"{name:45} {'-':>10} {_format_time(result['median'])}")
+            continue
+        ratio = result["median"] / baseline_result["median"]
+        flag = ""
+        if ratio > 1 + tolerance \
+                and result["q1"] > baseline_result["q3"]:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:45} {_format_time(baseline_result['median'])} "
+              f"{_format_time(result['median'])}  {ratio - 1:+7.1%}{flag}")
+    return regressions
+
+
+def _format_time(seconds):
+    """Return the time formatted with a unit."""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:7.2f} {unit:2}"
+    return f"{seconds / 1e-9:7.2f} ns"
+
+
+def main(argv=None):
+    """Run the suite, write the results and compare them with a
+    baseline.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--group", action="append", choices=GROUPS,
+                        help="Benchmark group to run, can be given many "
+                             "times (default: all)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of measurements per benchmark in "
+                             "each run, at least 2 (default: 5)")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="Number of new interpreters to run the "
+                             "suite in, or 1 to run it in this process "
+                             "(default: 3)")
+    parser.add_argument("--output", type=Path,
+                        help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, metavar="BASELINE",
+                        help="Compare the results with this results file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown compared to the baseline, "
+                             "as a fraction (default: 0.25)")
+    args = parser.parse_args(argv)
+    if args.runs < 1:
+        parser.error("--runs must be positive")
+    if args.repeat < 2:
+        parser.error("--repeat must be at least 2")
+
+    results = run(args.group or list(GROUPS), args.repeat, args.runs)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=4) + "\n",
+                               encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        try:
+            regressions = compare(results, baseline, args.tolerance)
+        except ValueError as error:
+            parser.error(f"{args.compare}: {error}")
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks slower than the "
+                  f"baseline by more than {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Measure grading of a corpus of mostly unacceptable files.
+
+The corpus imitates pre-screening user uploads: most files have an
+unknown mimetype or version, too many streams, a wrong charset or a
+disallowed stream in an AV container, and only a few are acceptable.
+Run from the repository root::
+
+    python -m benchmarks.unacceptable_corpus --unacceptable 0.9
+"""
+import argparse
+import random
+import timeit
+from collections import Counter
+
+from dpres_file_formats.defaults import Grades
+from dpres_file_formats.graders import grade, grade_many
+
+UNAP = "(:unap)"
+
+UNACCEPTABLE = [
+    # Unknown mimetype
+    ("application/x-msdownload", UNAP, {}),
+    # Unknown version
+    ("application/pdf", "0.9", {}),
+    ("image/png", "0.1", {0: {"mimetype": "image/png", "version": "0.1"}}),
+    # Too many streams for a non-container format
+    ("image/png", "1.2", {0: {"mimetype": "image/png", "version": "1.2"},
+                          1: {"mimetype": "image/png", "version": "1.2"}}),
+    ("text/plain", UNAP,
+     {0: {"mimetype": "text/plain", "version": UNAP, "charset": "UTF-8"},
+      1: {"mimetype": "text/plain", "version": UNAP, "charset": "UTF-8"}}),
+    # Unknown version of a text format
+    ("text/csv", "2", {0: {"mimetype": "text/csv", "version": "2",
+                           "charset": "UTF-8"}}),
+    # Charset not allowed
+    ("text/plain", UNAP, {0: {"mimetype": "text/plain", "version": UNAP,
+                              "charset": "EBCDIC"}}),
+    # Stream not allowed in the container
+    ("video/x-matroska", "4",
+     {0: {"mimetype": "video/x-matroska", "version": "4"},
+      1: {"mimetype": "video/x-ffv", "version": "3"},
+      2: {"mimetype": "audio/unknown", "version": UNAP}}),
+]
+
+ACCEPTABLE = [
+    ("application/pdf", "A-1a", {}),
+    ("text/plain", UNAP, {0: {"mimetype": "text/plain", "version": UNAP,
+                              "charset": "UTF-8"}}),
+    ("video/x-matroska", "4",
+     {0: {"mimetype": "video/x-matroska", "version": "4"},
+      1: {"mimetype": "video/x-ffv", "version": "3"},
+      2: {"mimetype": "audio/flac", "version": UNAP}}),
+]
+
+
+def corpus(size, unacceptable, seed=0):
+    """Return a list of files to grade.
+
+    :param size: Number of files
+    :param unacceptable: Share of unacceptable files
+    :param seed: Seed of the random generator
+    """
+    rng = random.Random(seed)
+    return [
+        rng.choice(UNACCEPTABLE if rng.random() < unacceptable
+                   else ACCEPTABLE)
+        for _ in range(size)
+    ]
+
+
+def main(argv=None):
+    """Print the time per graded file with grade() and grade_many()."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=20000,
+                        help="Number of files in the corpus")
+    parser.add_argument("--unacceptable", type=float, default=0.9,
+                        help="Share of unacceptable files in the corpus")
+    args = parser.parse_args(argv)
+
+    files = corpus(args.size, args.unacceptable)
+    grades = Counter(grade(*file) for file in files)
+    print(f"{grades[Grades.UNACCEPTABLE] / len(files):.0%} of "
+          f"{len(files)} files unacceptable")
+
+    grade_time = min(timeit.repeat(
+        lambda: [grade(*file) for file in files],
+        number=1, repeat=5)) / len(files)
+    grade_many_time = min(timeit.repeat(
+        lambda: list(grade_many(files)),
+        number=1, repeat=5)) / len(files)
+    print(f"{'grade()':14} {grade_time * 1e6:6.2f} us per file")
+    print(f"{'grade_many()':14} {grade_many_time * 1e6:6.2f} us per file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Measure how editing the registry scales with the size of the registry.
+
+A synthetic registry with the given number of versions is written to
+temporary data files. Then one transaction adds an AV container with a
+video and an audio stream and a version of an existing format for every
+hundred versions in the registry, so that the number of edits grows with
+the registry. With linear lookups, the time per version grows with the
+size of the registry; with indexed lookups, it stays about the same. Run
+from the repository root::
+
+    python -m benchmarks.update_scaling --versions 1000 10000 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.suite import temporary_data
+from dpres_file_formats import edit_registry
+from dpres_file_formats.defaults import ContentTypes, Grades
+from dpres_file_formats.json_handler import (
+    update_file_formats_json,
+    write_container_streams_json,
+)
+
+VERSIONS_PER_FORMAT = 10
+VERSIONS_PER_EDIT = 100
+
+CONTENT_TYPES = (ContentTypes.VIDEOCONTAINER, ContentTypes.VIDEO,
+                 ContentTypes.AUDIO)
+
+
+def synthetic_file_formats(versions):
+    """Return a list of format dicts with the given number of versions.
+
+    The formats are containers, video and audio formats in turn.
+    """
+    file_formats = []
+    for number in range(versions // VERSIONS_PER_FORMAT):
+        format_id = f"FI_DPRES_SYNTHETIC{number}_1"
+        file_formats.append({
+            "_id": format_id,
+            "mimetype": f"application/x-synthetic-{number}",
+            "content_type": CONTENT_TYPES[number % len(CONTENT_TYPES)].value,
+            "format_name_long": f"Synthetic format {number}",
+            "format_name_short": f"SYNTHETIC{number}",
+            "typical_extensions": [],
+            "required_metadata": "",
+            "charsets": [],
+            "relations": [],
+            "versions": [
+                {
+                    "_id": f"{format_id}_{version}",
+                    "version": str(version),
+                    "grade": Grades.RECOMMENDED.value,
+                    "format_registry_key": "",
+                    "support_in_dps_ingest": True,
+                    "active": True,
+                    "added_in_dps_spec": "",
+                    "removed_in_dps_spec": "",
+                    "format_sources": [],
+                }
+                for version in range(VERSIONS_PER_FORMAT)
+            ],
+        })
+    return file_formats
+
+
+def edit(file_formats, edits, seed=0):
+    """Add the AV containers and versions in one transaction.
+
+    :param file_formats: The synthetic format dicts in the registry
+    :param edits: Number of AV containers and of versions to add
+    :param seed: Seed of the random generator
+    """
+    rng = random.Random(seed)
+    by_type = {content_type.value: [] for content_type in CONTENT_TYPES}
+    for format_dict in file_formats:
+        by_type[format_dict["content_type"]].append(format_dict)
+
+    def random_version_id(content_type):
+        format_dict = rng.choice(by_type[content_type.value])
+        return rng.choice(format_dict["versions"])["_id"]
+
+    with edit_registry() as registry:
+        for number in range(edits):
+            registry.add_av_container(
+                version_id=random_version_id(ContentTypes.VIDEOCONTAINER),
+                grade="RECOMMENDED",
+                video_streams=[random_version_id(ContentTypes.VIDEO)],
+                audio_streams=[random_version_id(ContentTypes.AUDIO)])
+            registry.add_version_to_format(
+                format_id=rng.choice(file_formats)["_id"],
+                grade="ACCEPTABLE", support_in_dps_ingest=True,
+                active=True, version=f"new{number}")
+
+
+def measure(versions):
+    """Return the seconds taken by the transaction on a registry with the
+    given number of versions.
+    """
+    file_formats = synthetic_file_formats(versions)
+    with temporary_data():
+        update_file_formats_json(file_formats=file_formats)
+        write_container_streams_json(container_streams=[])
+        start = time.perf_counter()
+        edit(file_formats, versions // VERSIONS_PER_EDIT)
+        return time.perf_counter() - start
+
+
+def main(argv=None):
+    """Print the time of the transaction for each registry size."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", type=int, nargs="+",
+                        default=[1000, 10000, 100000],
+                        help="Numbers of versions in the synthetic registry")
+    args = parser.parse_args(argv)
+
+    print(f"{'versions':>9} {'edits':>7} {'total':>10} {'per version':>12}")
+    for versions in args.versions:
+        seconds = measure(versions)
+        print(f"{versions:9} {versions // VERSIONS_PER_EDIT * 2:7} "
+              f"{seconds:8.2f} s {seconds / versions * 1e6:9.2f} us")
+
+
+if __name__ == "__main__":
+    main()
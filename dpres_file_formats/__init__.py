@@ -14,13 +14,24 @@ from dpres_file_formats.update_file_formats import (
     add_av_container,
     add_format,
     add_version_to_format,
+    edit_registry,
     replace_format)
-from dpres_file_formats.graders import grade
+from dpres_file_formats.changeset import import_changeset
+from dpres_file_formats.graders import (
+    grade,
+    grade_by_puid,
+    grade_many,
+    grade_many_by_puid)
 
 __all__ = ["file_formats",
            "av_container_grading",
            "add_av_container",
            "add_format",
            "add_version_to_format",
+           "edit_registry",
+           "import_changeset",
            "replace_format",
-           "grade"]
+           "grade",
+           "grade_by_puid",
+           "grade_many",
+           "grade_many_by_puid"]
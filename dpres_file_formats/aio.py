@@ -0,0 +1,247 @@
+"""Grading and file format access for asyncio applications.
+
+The registry is loaded in a worker thread on first use, and again when
+the data files change, so that reading and parsing the data files does
+not block the event loop. After that, single files are graded directly
+in the event loop, and large batches are graded in a thread pool with a
+limited number of threads.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice, product
+from typing import Any
+
+from dpres_file_formats import graders, json_handler, read_file_formats
+from dpres_file_formats.defaults import (
+    CONTAINERS_STREAMS_NAME,
+    FILE_FORMATS_NAME,
+)
+from dpres_file_formats.registry import (
+    REGISTRY,
+    Registry,
+    _current_registry,
+)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_BATCH_SIZE = 1000
+
+_max_workers = DEFAULT_MAX_WORKERS
+_batch_size = DEFAULT_BATCH_SIZE
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+_load_lock = threading.Lock()
+
+
+def configure(
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> None:
+    """Set the limits of grading in the thread pool.
+
+    The thread pool is shut down and started again with the new number of
+    threads on next use.
+
+    :param max_workers: Maximum number of batches graded at the same time
+    :param batch_size: Number of files graded at a time in the thread pool.
+        Smaller batches are graded in the event loop.
+    :raises ValueError: if max_workers or batch_size is not positive
+    """
+    # pylint: disable=global-statement
+    global _max_workers, _batch_size, _executor
+    if max_workers < 1:
+        raise ValueError("Number of workers must be positive")
+    if batch_size < 1:
+        raise ValueError("Batch size must be positive")
+
+    with _executor_lock:
+        _max_workers = max_workers
+        _batch_size = batch_size
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Return the thread pool, starting it on first use."""
+    global _executor  # pylint: disable=global-statement
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_max_workers,
+                thread_name_prefix="dpres-file-formats")
+        return _executor
+
+
+async def _run(function, *args, **kwargs) -> Any:
+    """Run the function in the thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(), partial(function, *args, **kwargs))
+
+
+def _load(registry: Registry) -> None:
+    """Load the registry and build the lookup tables used by the graders
+    and :func:`file_formats`.
+    """
+    token = _current_registry.set(registry)
+    try:
+        # pylint: disable=pointless-statement
+        graders.dispatch_table()
+        graders.ContainerStreamsGrader.stream_grades
+        if REGISTRY.backend is not None:
+            # The views would decode the whole memory-mapped registry
+            return
+        for deprecated, unofficial, versions_separately in product(
+                (False, True), repeat=3):
+            read_file_formats.file_formats(
+                deprecated=deprecated, unofficial=unofficial,
+                versions_separately=versions_separately, views=True,
+                as_of=registry.as_of)
+    finally:
+        _current_registry.reset(token)
+
+
+def _load_once(registry: Registry) -> None:
+    """Load the registry unless another thread has already loaded it."""
+    with _load_lock:
+        if REGISTRY.backend is None:
+            # Reading the data files changed by another process makes
+            # the registry build its lookup tables again
+            json_handler.shared_file_formats_json()
+            json_handler.shared_container_streams_json()
+        registry.derived("aio._load", partial(_load, registry))
+
+
+def _data_current() -> bool:
+    """Return True if the data files have not changed since they were
+    read, checking it without reading them.
+    """
+    return REGISTRY.backend is not None or all(
+        json_handler.current_shared_data(name) is not None
+        for name in (FILE_FORMATS_NAME, CONTAINERS_STREAMS_NAME))
+
+
+def _grade_batch(
+    files: list[tuple[str, str, dict[int, dict[str, str]]]],
+    as_of: str | None = None,
+) -> list[str]:
+    """Grade a batch of files."""
+    return list(graders.grade_many(files, as_of=as_of))
+
+
+async def load_registry(as_of: str | None = None) -> None:
+    """Load the registry in the thread pool, unless it is already loaded.
+
+    The registry is loaded again after the data files are written or
+    changed by another process. Other functions of this module call this
+    automatically.
+
+    :param as_of: DPS spec version whose registry to load, see
+        ``file_formats(as_of=...)``, or None for the current registry
+    :raises ValueError: if the spec version is unknown
+    """
+    registry = REGISTRY if as_of is None else REGISTRY.for_spec(as_of)
+    if not (registry.is_built("aio._load") and _data_current()):
+        await _run(_load_once, registry)
+
+
+async def grade(
+    mimetype: str,
+    version: str,
+    streams: dict[int, dict[str, str]],
+    as_of: str | None = None,
+) -> str:
+    """Return digital preservation grade.
+
+    See :func:`dpres_file_formats.graders.grade`.
+    """
+    await load_registry(as_of)
+    return graders.grade(mimetype, version, streams, as_of=as_of)
+
+
+async def grade_many(
+    files: Iterable[tuple[str, str, dict[int, dict[str, str]]]],
+    as_of: str | None = None,
+) -> list[str]:
+    """Return digital preservation grades for many files.
+
+    The files are graded in batches, see :func:`configure`. A batch
+    smaller than the batch size is graded in the event loop, larger
+    inputs are graded in the thread pool.
+
+    :param files: Iterable of ``(mimetype, version, streams)`` tuples,
+        where the items are given as to :func:`grade`.
+    :param as_of: DPS spec version to grade the files by, see
+        :func:`dpres_file_formats.graders.grade`
+    :returns: List of grades in the same order as the files
+    """
+    await load_registry(as_of)
+    batch_size = _batch_size
+    files = iter(files)
+    first_batch = list(islice(files, batch_size))
+    if len(first_batch) < batch_size:
+        return _grade_batch(first_batch, as_of)
+
+    # Keep at most one batch per worker waiting, so that the batches of
+    # a lazy iterable are not all read into memory at once.
+    grades: list[str] = []
+    pending: list[asyncio.Future] = []
+    batch = first_batch
+    try:
+        while batch:
+            pending.append(
+                asyncio.ensure_future(_run(_grade_batch, batch, as_of)))
+            if len(pending) >= _max_workers:
+                grades.extend(await pending.pop(0))
+            batch = list(islice(files, batch_size))
+        while pending:
+            grades.extend(await pending.pop(0))
+    finally:
+        for future in pending:
+            future.cancel()
+    return grades
+
+
+async def file_formats(**kwargs: Any) -> list[Mapping]:
+    """Return file formats.
+
+    The arguments are given as keyword arguments as to
+    :func:`dpres_file_formats.read_file_formats.file_formats`. Views of
+    the built-in data are returned directly when they have already been
+    built from the current data. Everything else, such as copying the
+    dicts and building records or the file formats of a spec version, is
+    done in the thread pool.
+    """
+    try:
+        await load_registry(kwargs.get("as_of"))
+    except ValueError:
+        # The error is raised again from the thread pool
+        pass
+    if _views_built(kwargs):
+        return read_file_formats.file_formats(**kwargs)
+    return await _run(read_file_formats.file_formats, **kwargs)
+
+
+def _views_built(kwargs: dict[str, Any]) -> bool:
+    """Return True if the file formats requested with the arguments are
+    views already built from the current built-in data.
+    """
+    if (not kwargs.get("views") or kwargs.get("records")
+            or kwargs.get("data")
+            or not kwargs.keys() <= {"deprecated", "unofficial",
+                                     "versions_separately", "views",
+                                     "records", "data", "as_of"}):
+        return False
+    try:
+        return read_file_formats.views_built(
+            kwargs.get("deprecated", False),
+            kwargs.get("unofficial", False),
+            kwargs.get("versions_separately", True),
+            kwargs.get("as_of"))
+    except ValueError:
+        return False
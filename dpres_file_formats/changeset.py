@@ -0,0 +1,431 @@
+"""Import changes to the registry from a changeset file.
+
+A changeset describes new file formats, versions, supersessions and AV
+container rules, for example all changes of a new DPS specification
+version. The whole changeset is validated before anything is changed, and
+it is applied in one transaction, which writes the data files once.
+
+A JSON changeset is an object with the lists ``formats``, ``versions``,
+``supersessions`` and ``av_containers``. The items are objects with the
+arguments of :meth:`~dpres_file_formats.update_file_formats.RegistryEditor.
+add_format`, ``add_version_to_format``, ``replace_format`` and
+``add_av_container`` respectively::
+
+    {
+        "formats": [
+            {"mimetype": "image/x-example", "content_type": "IMAGE",
+             "format_name_long": "Example image",
+             "format_name_short": "EXAMPLE"}
+        ],
+        "versions": [
+            {"format_id": "FI_DPRES_EXAMPLE_1", "version": "1.0",
+             "grade": "RECOMMENDED", "support_in_dps_ingest": true,
+             "active": true, "added_in_dps_spec": "V14"}
+        ]
+    }
+
+A CSV changeset has a header row and one row per item. The ``record``
+column is ``format``, ``version``, ``supersession`` or ``av_container``,
+and the other columns are the arguments. Empty cells are left out, Boolean
+cells are ``true`` or ``false``, and lists, like ``typical_extensions`` or
+``video_streams``, are separated by whitespace.
+
+The formats are added first, then the versions, the supersessions and the
+AV container rules. The IDs of new formats and versions are created as in
+:func:`~dpres_file_formats.update_file_formats.add_format` and
+:func:`~dpres_file_formats.update_file_formats.add_version_to_format`,
+and later items of the changeset can refer to them.
+"""
+from __future__ import annotations
+
+import csv
+import json
+from collections import Counter
+from collections.abc import Iterable
+from enum import Enum
+from os import PathLike
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from dpres_file_formats.defaults import (
+    ContentTypes,
+    DpsSpecVersions,
+    Grades,
+    TechMetadata,
+    UnknownValue
+)
+from dpres_file_formats.update_file_formats import (
+    FORMAT_ID,
+    VERSION_ID,
+    edit_registry
+)
+
+SECTIONS = ("formats", "versions", "supersessions", "av_containers")
+
+# Values of the record column of CSV changesets for each section
+CSV_RECORDS = {
+    "format": "formats",
+    "version": "versions",
+    "supersession": "supersessions",
+    "av_container": "av_containers",
+}
+
+# Fields of the items in each section, with their types and whether they
+# are required
+FIELDS: dict[str, dict[str, tuple[type, bool]]] = {
+    "formats": {
+        "mimetype": (str, True),
+        "content_type": (str, True),
+        "format_name_long": (str, True),
+        "format_name_short": (str, True),
+        "typical_extensions": (list, False),
+        "required_metadata": (str, False),
+        "charsets": (bool, False),
+    },
+    "versions": {
+        "format_id": (str, True),
+        "grade": (str, True),
+        "support_in_dps_ingest": (bool, True),
+        "active": (bool, True),
+        "version": (str, False),
+        "format_registry_key": (str, False),
+        "added_in_dps_spec": (str, False),
+        "removed_in_dps_spec": (str, False),
+        "format_source_pid": (str, False),
+        "format_source_url": (str, False),
+        "format_source_reference": (str, False),
+    },
+    "supersessions": {
+        "superseded_format": (str, True),
+        "superseding_format": (str, True),
+        "dps_spec_version": (str, True),
+    },
+    "av_containers": {
+        "version_id": (str, True),
+        "grade": (str, True),
+        "video_streams": (list, False),
+        "audio_streams": (list, False),
+    },
+}
+
+# Controlled vocabularies of the fields, given by the names of the members
+VOCABULARIES: dict[str, type[Enum]] = {
+    "content_type": ContentTypes,
+    "required_metadata": TechMetadata,
+    "grade": Grades,
+    "added_in_dps_spec": DpsSpecVersions,
+    "removed_in_dps_spec": DpsSpecVersions,
+    "dps_spec_version": DpsSpecVersions,
+}
+
+CONTAINER_TYPES = (ContentTypes.AUDIOCONTAINER.value,
+                   ContentTypes.VIDEOCONTAINER.value)
+
+
+class ChangesetError(ValueError):
+    """Invalid changeset.
+
+    :ivar errors: Descriptions of all errors found in the changeset
+    """
+
+    def __init__(self, errors: list[str]) -> None:
+        """Initialize the error with the descriptions of the errors."""
+        super().__init__(
+            f"Invalid changeset, {len(errors)} errors:\n"
+            + "\n".join(errors))
+        self.errors = errors
+
+
+class ChangesetItem(NamedTuple):
+    """Item of a changeset.
+
+    :ivar location: Position of the item in the changeset file, used in
+        error messages
+    :ivar fields: Arguments of the item
+    """
+
+    location: str
+    fields: dict[str, Any]
+
+
+class Changeset(NamedTuple):
+    """Parsed changeset, with the items of each section in order."""
+
+    formats: list[ChangesetItem]
+    versions: list[ChangesetItem]
+    supersessions: list[ChangesetItem]
+    av_containers: list[ChangesetItem]
+
+    def validate(self, index: Any) -> list[str]:
+        """Validate the changeset against the controlled vocabularies and
+        the registry.
+
+        All items are checked in one pass, with the new formats and
+        versions added to the lookups as they are checked, so that later
+        items can refer to them.
+
+        :param index: ID index of the registry, see
+            :meth:`~dpres_file_formats.update_file_formats.RegistryEditor.
+            apply_changeset`
+        :returns: IDs of the new formats
+        :raises ChangesetError: if the changeset has errors
+        """
+        return _Validator(index).validate(self)
+
+
+def parse_json_changeset(text: str) -> Changeset:
+    """Parse a JSON changeset.
+
+    :param text: Content of the changeset file
+    :returns: The parsed changeset
+    :raises ChangesetError: if the changeset is not valid JSON or not an
+        object of lists of objects
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as error:
+        raise ChangesetError([f"Invalid JSON: {error}"]) from error
+    if not isinstance(data, dict):
+        raise ChangesetError(["Changeset is not a JSON object"])
+
+    errors = [f"Unknown section {name!r}" for name in data
+              if name not in SECTIONS]
+    sections: dict[str, list[ChangesetItem]] = {}
+    for section in SECTIONS:
+        items = data.get(section, [])
+        if not isinstance(items, list):
+            errors.append(f"{section}: not a list")
+            continue
+        sections[section] = []
+        for number, fields in enumerate(items):
+            location = f"{section}[{number}]"
+            if not isinstance(fields, dict):
+                errors.append(f"{location}: not an object")
+                continue
+            sections[section].append(ChangesetItem(location, fields))
+    if errors:
+        raise ChangesetError(errors)
+    return Changeset(**sections)
+
+
+def parse_csv_changeset(lines: Iterable[str]) -> Changeset:
+    """Parse a CSV changeset.
+
+    :param lines: Lines of the changeset file
+    :returns: The parsed changeset
+    :raises ChangesetError: if a row has an unknown record type or an
+        invalid Boolean value
+    """
+    errors = []
+    sections: dict[str, list[ChangesetItem]] = {
+        section: [] for section in SECTIONS}
+    reader = csv.DictReader(lines)
+    for row in reader:
+        location = f"line {reader.line_num}"
+        record = row.pop("record", None)
+        section = CSV_RECORDS.get(record or "")
+        if section is None:
+            errors.append(f"{location}: unknown record {record!r}")
+            continue
+
+        fields: dict[str, Any] = {}
+        for name, value in row.items():
+            if not value:
+                continue
+            field_type = FIELDS[section].get(name, (str, False))[0]
+            if field_type is list:
+                fields[name] = value.split()
+            elif field_type is bool:
+                if value.lower() not in ("true", "false"):
+                    errors.append(f"{location}: {name} is not true or "
+                                  "false")
+                    continue
+                fields[name] = value.lower() == "true"
+            else:
+                fields[name] = value
+        sections[section].append(ChangesetItem(location, fields))
+    if errors:
+        raise ChangesetError(errors)
+    return Changeset(**sections)
+
+
+def read_changeset(path: str | PathLike) -> Changeset:
+    """Read a changeset file.
+
+    :param path: Path of a ``.json`` or ``.csv`` changeset file
+    :returns: The parsed changeset
+    :raises ChangesetError: if the changeset cannot be parsed
+    :raises ValueError: if the file suffix is not ``.json`` or ``.csv``
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".json":
+        return parse_json_changeset(path.read_text(encoding="utf-8"))
+    if suffix == ".csv":
+        with path.open(encoding="utf-8", newline="") as changeset_file:
+            return parse_csv_changeset(changeset_file)
+    raise ValueError(f"Unknown changeset file type: {path.name}")
+
+
+def import_changeset(changeset: Changeset | str | PathLike) -> list[str]:
+    """Validate a changeset and apply it to the registry in one
+    transaction.
+
+    Nothing is changed if the changeset has errors.
+
+    :param changeset: Parsed changeset or path of a changeset file
+    :returns: IDs of the new formats
+    :raises ChangesetError: if the changeset has errors
+    """
+    if not isinstance(changeset, Changeset):
+        changeset = read_changeset(changeset)
+    with edit_registry() as registry:
+        return registry.apply_changeset(changeset)
+
+
+class _Validator:
+    """Single pass validation of a changeset.
+
+    Keeps the formats and versions of the changeset checked so far, so
+    that later items can refer to them.
+    """
+
+    def __init__(self, index: Any) -> None:
+        """Initialize the validator with no items checked."""
+        self.index = index
+        self.errors: list[str] = []
+        self.short_names: Counter[str] = Counter()
+        # New formats by ID: content type and version names
+        self.new_formats: dict[str, tuple[str, list[str]]] = {}
+        # Version names added to existing formats by format ID
+        self.new_version_names: dict[str, list[str]] = {}
+        # Content types of the new versions by version ID
+        self.new_versions: dict[str, str] = {}
+
+    def validate(self, changeset: Changeset) -> list[str]:
+        """Check the items in the order they are applied, see
+        :meth:`Changeset.validate`.
+        """
+        format_ids = []
+        for section, check in (("formats", self.check_format),
+                               ("versions", self.check_version),
+                               ("supersessions", self.check_supersession),
+                               ("av_containers", self.check_av_container)):
+            for item in getattr(changeset, section):
+                if self.check_fields(section, item):
+                    format_id = check(item.location, item.fields)
+                    if format_id:
+                        format_ids.append(format_id)
+        if self.errors:
+            raise ChangesetError(self.errors)
+        return format_ids
+
+    def error(self, location: str, message: str) -> None:
+        """Add an error of the item at the location."""
+        self.errors.append(f"{location}: {message}")
+
+    def check_fields(self, section: str, item: ChangesetItem) -> bool:
+        """Check the field names, types and vocabularies of an item.
+
+        :returns: True if the item can be checked against the registry
+        """
+        errors = len(self.errors)
+        fields = FIELDS[section]
+        for name in item.fields.keys() - fields.keys():
+            self.error(item.location, f"unknown field {name!r}")
+        for name, (field_type, required) in fields.items():
+            value = item.fields.get(name)
+            # An empty string is missing like in CSV changesets, and the
+            # updating functions ignore empty optional values
+            if value is None or value == "":
+                if required:
+                    self.error(item.location, f"missing field {name!r}")
+                continue
+            if not isinstance(value, field_type) or (
+                    field_type is list
+                    and not all(isinstance(part, str) for part in value)):
+                self.error(item.location,
+                           f"{name} is not of type {field_type.__name__}")
+                continue
+            vocabulary = VOCABULARIES.get(name)
+            if vocabulary and value not in vocabulary.__members__:
+                self.error(item.location,
+                           f"{name} {value!r} is not one of "
+                           f"{', '.join(vocabulary.__members__)}")
+        return len(self.errors) == errors
+
+    def format_exists(self, format_id: str) -> bool:
+        """Return True if the format exists or is added earlier."""
+        return (format_id in self.index.formats
+                or format_id in self.new_formats)
+
+    def version_content_type(self, version_id: str) -> str | None:
+        """Return the content type of the format of a version, or None if
+        the version doesn't exist and is not added earlier.
+        """
+        if version_id in self.new_versions:
+            return self.new_versions[version_id]
+        try:
+            format_dict, _ = self.index.versions[version_id]
+        except KeyError:
+            return None
+        return format_dict["content_type"]
+
+    def check_format(self, _location: str, fields: dict) -> str:
+        """Add a new format and return its ID."""
+        short_name = fields["format_name_short"]
+        self.short_names[short_name] += 1
+        format_id = FORMAT_ID.format(
+            format_name_short=short_name,
+            name_count=(self.index.short_names[short_name]
+                        + self.short_names[short_name]))
+        self.new_formats[format_id] = (
+            ContentTypes[fields["content_type"]].value, [])
+        return format_id
+
+    def check_version(self, location: str, fields: dict) -> None:
+        """Check that the format exists and the version is new."""
+        format_id = fields["format_id"]
+        if format_id in self.new_formats:
+            content_type, version_names = self.new_formats[format_id]
+        elif format_id in self.index.formats:
+            format_dict = self.index.formats[format_id]
+            content_type = format_dict["content_type"]
+            version_names = self.new_version_names.setdefault(
+                format_id, [versions_dict["version"] for versions_dict
+                            in format_dict.get("versions", [])])
+        else:
+            self.error(location, f"file format {format_id} doesn't exist")
+            return
+
+        # The same check as in add_version_to_format
+        version = fields.get("version") or UnknownValue.UNAP
+        if any(version in name for name in version_names):
+            self.error(location, f"version {version} for file format "
+                                 f"{format_id} already exists")
+            return
+        version_names.append(version)
+        self.new_versions[VERSION_ID.format(
+            format_id=format_id, version_name=version)] = content_type
+
+    def check_supersession(self, location: str, fields: dict) -> None:
+        """Check that both formats exist."""
+        for name in ("superseded_format", "superseding_format"):
+            if not self.format_exists(fields[name]):
+                self.error(location,
+                           f"file format {fields[name]} doesn't exist")
+
+    def check_av_container(self, location: str, fields: dict) -> None:
+        """Check the content types of the container and its streams."""
+        version_id = fields["version_id"]
+        if self.version_content_type(version_id) not in CONTAINER_TYPES:
+            self.error(location, f"file format version {version_id} "
+                                 "doesn't exist or is not an AV container "
+                                 "type")
+        for name, content_type in (("video_streams", ContentTypes.VIDEO),
+                                   ("audio_streams", ContentTypes.AUDIO)):
+            for stream_id in fields.get(name) or []:
+                if self.version_content_type(stream_id) != content_type:
+                    self.error(location,
+                               f"stream version {stream_id} doesn't exist "
+                               f"or is not a {content_type.value} stream")
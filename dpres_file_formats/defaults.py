@@ -8,6 +8,12 @@ DATA_MODULE_NAME = "dpres_file_formats.data"
 FILE_FORMATS_NAME = "file_formats.json"
 # Name of the file formats json file
 CONTAINERS_STREAMS_NAME = "av_container_grading.json"
+# Suffix of the precompiled snapshots of the JSON files
+SNAPSHOT_SUFFIX = ".marshal"
+# Suffix of the lock file held while updating the JSON files
+LOCK_SUFFIX = ".lock"
+# Suffix of the change journals of the JSON files
+JOURNAL_SUFFIX = ".journal"
 
 # Allowed charsets
 ALLOWED_CHARSETS = ["ISO-8859-15", "UTF-8", "UTF-16", "UTF-32"]
@@ -0,0 +1,482 @@
+"""Compare two versions of the file format registry.
+
+The registries are compared on the IDs of the file formats and versions,
+so that the differences are found in one pass over each registry however
+the items have been reordered or reformatted. Two DPS spec versions of
+the registry can be compared with :func:`diff_specs`, and two copies of
+the data files with :func:`diff_files` or :func:`diff_registries`. The
+registry does not record earlier grades, so only the differences of
+copies of the data files have regraded versions and containers.
+
+The ``dpres-diff`` command prints the differences as text or JSON::
+
+    dpres-diff 1.9.0 1.10.0
+    dpres-diff --json old/file_formats.json new/file_formats.json \\
+        --containers old/av_container_grading.json \\
+        new/av_container_grading.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections.abc import Container, Iterable, Iterator, Mapping
+from os import PathLike
+from typing import Any, NamedTuple, TextIO
+
+from dpres_file_formats.defaults import RelationshipTypes
+from dpres_file_formats.graders import GRADE_TO_NUMERIC_QUALITY
+from dpres_file_formats.json_handler import read_data_file
+from dpres_file_formats.read_file_formats import (
+    av_container_grading,
+    file_formats,
+    spec_key,
+    spec_version,
+)
+
+# Fields compared separately from the other fields of the items
+_FORMAT_IGNORED = frozenset(["_id", "versions", "relations"])
+_VERSION_IGNORED = frozenset(["_id", "grade"])
+_CONTAINER_IGNORED = frozenset(["grade"])
+_SUPERSESSION_IGNORED = frozenset(
+    ["superseded_format", "superseding_format"])
+
+_STREAM_KEYS = ("audio_streams", "video_streams")
+
+
+class SectionDiff(NamedTuple):
+    """Differences of the items of one section of the registry.
+
+    :ivar added: Summaries of the items only in the new registry
+    :ivar removed: Summaries of the items only in the old registry
+    :ivar regraded: Summaries of the items whose grade changed, with the
+        ``old_grade`` and ``new_grade``, or None if the grades are not
+        compared, as in the differences of DPS spec versions
+    :ivar changed: IDs of the items whose other fields changed, with the
+        ``old`` and ``new`` value of each changed field in ``fields``
+    """
+
+    added: list[dict]
+    removed: list[dict]
+    regraded: list[dict] | None
+    changed: list[dict]
+
+    def __bool__(self) -> bool:
+        return any((self.added, self.removed, self.regraded, self.changed))
+
+    def to_dict(self) -> dict[str, list[dict]]:
+        """Return the differences as a dict of lists, without the
+        regraded items if the grades are not compared.
+        """
+        return {change: items for change, items in self._asdict().items()
+                if items is not None}
+
+
+class RegistryDiff(NamedTuple):
+    """Differences between two registries.
+
+    The supersessions are the ``is superseded by`` relations of the file
+    formats, so a file format superseded in the new registry is in
+    ``supersessions.added``. Other changes of the relations are not
+    reported.
+
+    The AV container rules are compared on the pairs of a container
+    version and a stream version allowed in it, with the best grade the
+    rules give to the stream in the container, like in the grading.
+    Containers allowed without streams are compared with a stream version
+    ID of None.
+    """
+
+    formats: SectionDiff
+    versions: SectionDiff
+    supersessions: SectionDiff
+    av_containers: SectionDiff
+
+    def __bool__(self) -> bool:
+        return any(self)
+
+    def to_dict(self) -> dict[str, dict[str, list[dict]]]:
+        """Return the differences as a dict, which can be serialized as
+        JSON.
+        """
+        return {name: section.to_dict()
+                for name, section in self._asdict().items()}
+
+
+# An item to compare: its ID, its fields and its summary
+_Item = tuple[Any, Mapping, dict]
+
+
+def _diff_section(
+    old_items: Iterable[_Item],
+    new_items: Iterable[_Item],
+    id_key: str,
+    ignored: frozenset[str],
+    regrades: bool = True,
+) -> SectionDiff:
+    """Return the differences of the items of a section.
+
+    The old items are indexed by their IDs, and each new item is looked up
+    in the index and removed from it, so the items left in the index are
+    the removed ones.
+
+    :param old_items: Items of the old registry
+    :param new_items: Items of the new registry
+    :param id_key: Key of the ID in the changed items
+    :param ignored: Fields left out of the changed fields, in addition to
+        the grade
+    :param regrades: Compare the grades of the items, or leave the
+        regraded items out as None
+    :returns: The differences, with the items in registry order
+    """
+    old_by_id = {item_id: (fields, summary)
+                 for item_id, fields, summary in old_items}
+    added, regraded, changed = [], [], []
+    for item_id, fields, summary in new_items:
+        old = old_by_id.pop(item_id, None)
+        if old is None:
+            added.append(summary)
+            continue
+        old_fields, old_summary = old
+        if regrades and old_fields.get("grade") != fields.get("grade"):
+            regraded_summary = {key: value for key, value in summary.items()
+                                if key != "grade"}
+            regraded_summary["old_grade"] = old_summary.get("grade")
+            regraded_summary["new_grade"] = summary.get("grade")
+            regraded.append(regraded_summary)
+        changed_fields = _changed_fields(old_fields, fields, ignored)
+        if changed_fields:
+            changed.append({id_key: item_id, "fields": changed_fields})
+
+    removed = [summary for _, summary in old_by_id.values()]
+    return SectionDiff(added, removed, regraded if regrades else None,
+                       changed)
+
+
+def _changed_fields(
+    old: Mapping, new: Mapping, ignored: frozenset[str]
+) -> dict[str, dict[str, Any]]:
+    """Return the old and new values of the changed fields. Missing
+    fields have the value None.
+    """
+    changed = {}
+    for key in dict.fromkeys([*old, *new]):
+        if key in ignored:
+            continue
+        old_value, new_value = old.get(key), new.get(key)
+        if old_value != new_value:
+            changed[key] = {"old": old_value, "new": new_value}
+    return changed
+
+
+def _format_items(formats: Iterable[Mapping]) -> Iterator[_Item]:
+    """Yield the file formats to compare."""
+    for file_format in formats:
+        yield file_format["_id"], file_format, {
+            "_id": file_format["_id"],
+            "mimetype": file_format["mimetype"],
+            "format_name_short": file_format.get("format_name_short", ""),
+        }
+
+
+def _version_items(formats: Iterable[Mapping]) -> Iterator[_Item]:
+    """Yield the file format versions to compare."""
+    for file_format in formats:
+        for version in file_format.get("versions", ()):
+            yield version["_id"], version, {
+                "_id": version["_id"],
+                "format_id": file_format["_id"],
+                "mimetype": file_format["mimetype"],
+                "version": version["version"],
+                "grade": version["grade"],
+            }
+
+
+def _supersession_items(formats: Iterable[Mapping]) -> Iterator[_Item]:
+    """Yield the supersessions to compare, keyed on the superseded and
+    the superseding file format.
+    """
+    for file_format in formats:
+        for relation in file_format.get("relations", ()):
+            if relation["type"] != RelationshipTypes.SUPERSEDED:
+                continue
+            supersession = {
+                "superseded_format": file_format["_id"],
+                "superseding_format": relation["_id"],
+                "dps_spec_version": relation.get("dps_spec_version", ""),
+                "description": relation.get("description", ""),
+            }
+            yield ((file_format["_id"], relation["_id"]), supersession,
+                   supersession)
+
+
+def _container_items(
+    containers: Iterable[Mapping],
+    version_ids: Container[str] | None = None,
+) -> Iterator[_Item]:
+    """Yield the pairs of an AV container and a stream allowed in it to
+    compare, with the best grade given to the stream in the container.
+
+    :param containers: AV container grading dicts
+    :param version_ids: IDs of the versions to include, or None to
+        include all containers and streams
+    """
+    pairs: dict[tuple[str, str | None], dict] = {}
+    for container in containers:
+        if version_ids is not None \
+                and container["version_id"] not in version_ids:
+            continue
+        streams = [stream for key in _STREAM_KEYS
+                   for stream in container.get(key, ())]
+        if version_ids is not None and streams:
+            streams = [stream for stream in streams
+                       if stream["version_id"] in version_ids]
+            if not streams:
+                # None of the streams of the rule are in the spec version
+                continue
+        for stream in streams or [None]:
+            stream_id = stream["version_id"] if stream else None
+            pair = pairs.get((container["version_id"], stream_id))
+            if pair is not None and (
+                    GRADE_TO_NUMERIC_QUALITY.get(pair["grade"], 0)
+                    >= GRADE_TO_NUMERIC_QUALITY.get(container["grade"], 0)):
+                continue
+            pairs[container["version_id"], stream_id] = {
+                "version_id": container["version_id"],
+                "mimetype": container["mimetype"],
+                "version": container["version"],
+                "stream_version_id": stream_id,
+                "stream_mimetype": stream["mimetype"] if stream else None,
+                "stream_version": stream["version"] if stream else None,
+                "grade": container["grade"],
+            }
+    for key, pair in pairs.items():
+        yield key, pair, pair
+
+
+def diff_registries(
+    old_formats: Iterable[Mapping],
+    new_formats: Iterable[Mapping],
+    old_containers: Iterable[Mapping] = (),
+    new_containers: Iterable[Mapping] = (),
+) -> RegistryDiff:
+    """Return the differences between two registries.
+
+    :param old_formats: File format dicts of the old registry, as in the
+        file formats JSON file
+    :param new_formats: File format dicts of the new registry
+    :param old_containers: AV container grading dicts of the old registry,
+        as in the AV container grading JSON file
+    :param new_containers: AV container grading dicts of the new registry
+    :returns: The differences
+    """
+    old_formats, new_formats = list(old_formats), list(new_formats)
+    return _diff(
+        (_format_items(old_formats), _format_items(new_formats)),
+        (_version_items(old_formats), _version_items(new_formats)),
+        (_supersession_items(old_formats), _supersession_items(new_formats)),
+        (_container_items(old_containers), _container_items(new_containers)),
+    )
+
+
+def _diff(
+    formats: tuple[Iterable[_Item], Iterable[_Item]],
+    versions: tuple[Iterable[_Item], Iterable[_Item]],
+    supersessions: tuple[Iterable[_Item], Iterable[_Item]],
+    av_containers: tuple[Iterable[_Item], Iterable[_Item]],
+    regrades: bool = True,
+) -> RegistryDiff:
+    """Return the differences of the old and new items of each section,
+    comparing their grades if regrades is True.
+    """
+    return RegistryDiff(
+        formats=_diff_section(*formats, "_id", _FORMAT_IGNORED, regrades),
+        versions=_diff_section(*versions, "_id", _VERSION_IGNORED,
+                               regrades),
+        supersessions=_diff_section(*supersessions, "supersession",
+                                    _SUPERSESSION_IGNORED, regrades),
+        av_containers=_diff_section(*av_containers, "container_stream",
+                                    _CONTAINER_IGNORED, regrades),
+    )
+
+
+def diff_files(
+    old_path: str | PathLike,
+    new_path: str | PathLike,
+    old_containers_path: str | PathLike | None = None,
+    new_containers_path: str | PathLike | None = None,
+) -> RegistryDiff:
+    """Return the differences between two copies of the data files.
+
+    :param old_path: Path of the old file formats JSON file
+    :param new_path: Path of the new file formats JSON file
+    :param old_containers_path: Path of the old AV container grading JSON
+        file, or None to not compare the AV containers
+    :param new_containers_path: Path of the new AV container grading JSON
+        file, or None to not compare the AV containers
+    :returns: The differences
+    """
+    return diff_registries(
+        read_data_file(old_path), read_data_file(new_path),
+        read_data_file(old_containers_path)
+        if old_containers_path is not None else (),
+        read_data_file(new_containers_path)
+        if new_containers_path is not None else ())
+
+
+def _spec_items(as_of: str) -> tuple[Iterator[_Item], ...]:
+    """Return the items of each section in a DPS spec version.
+
+    The file formats have the official versions active in the spec
+    version. The supersessions are the relations made by the spec version
+    or before it, also of the file formats without active versions. The
+    AV containers have no spec versions of their own, so the containers
+    and streams of the versions active in the spec version are included.
+    """
+    as_of_key = spec_key(as_of)
+    formats = file_formats(versions_separately=False, views=True,
+                           as_of=as_of)
+    all_formats = file_formats(deprecated=True, unofficial=True,
+                               versions_separately=False, views=True)
+    version_ids = {version["_id"] for file_format in formats
+                   for version in file_format["versions"]}
+    supersessions = (
+        item for item in _supersession_items(all_formats)
+        if item[1]["dps_spec_version"]
+        and spec_key(item[1]["dps_spec_version"]) <= as_of_key)
+    return (_format_items(formats), _version_items(formats), supersessions,
+            _container_items(av_container_grading(), version_ids))
+
+
+def diff_specs(old: str, new: str) -> RegistryDiff:
+    """Return the differences between two DPS spec versions of the
+    registry.
+
+    The official file format versions active in each spec version are
+    compared, see ``file_formats(as_of=...)``. The registry records only
+    the current grade of each version, so the grades are not compared and
+    the regraded items of each section are None. The versions removed
+    after a spec version have the grade ``UnknownValue.UNAV`` in it, as
+    their earlier grades are not recorded. Compare copies of the data
+    files with :func:`diff_files` to find regraded versions.
+
+    :param old: Old DPS spec version, such as ``1.9.0`` or ``V9``
+    :param new: New DPS spec version
+    :returns: The differences
+    :raises ValueError: if a spec version is unknown
+    """
+    return _diff(*zip(_spec_items(spec_version(old)),
+                      _spec_items(spec_version(new))),
+                 regrades=False)
+
+
+def _is_spec_version(value: str) -> bool:
+    """Return True if the value names a DPS spec version."""
+    try:
+        spec_version(value)
+    except ValueError:
+        return False
+    return True
+
+
+def write_text(diff: RegistryDiff, output: TextIO) -> None:
+    """Write the differences as lines of text.
+
+    :param diff: The differences
+    :param output: Text file to write to
+    """
+    for name, section in diff._asdict().items():
+        for change in ("added", "removed", "regraded", "changed"):
+            for item in getattr(section, change) or ():
+                output.write(f"{name} {change}: {_describe(item)}\n")
+
+
+def _describe(item: dict) -> str:
+    """Return a description of an item of the differences."""
+    if "superseded_format" in item:
+        return (f"{item['superseded_format']} is superseded by "
+                f"{item['superseding_format']} in "
+                f"{item['dps_spec_version'] or 'no spec version'}")
+    if "stream_version_id" in item:
+        item_id = (f"{item['version_id']} with "
+                   f"{item['stream_version_id'] or 'no streams'}")
+    else:
+        item_id = item.get("_id", item.get("version_id", item.get(
+            "supersession", item.get("container_stream"))))
+    if "fields" in item:
+        return f"{item_id}: " + ", ".join(
+            f"{key} {value['old']!r} -> {value['new']!r}"
+            for key, value in item["fields"].items())
+    details = " ".join(str(item[key]) for key in ("mimetype", "version")
+                       if key in item)
+    if "old_grade" in item:
+        return (f"{item_id} ({details}): {item['old_grade']} -> "
+                f"{item['new_grade']}")
+    if "grade" in item:
+        return f"{item_id} ({details}): {item['grade']}"
+    return f"{item_id} ({details})"
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Compare two registries and write the differences.
+
+    :param argv: Command line arguments, sys.argv is used if None
+    :returns: Exit status, 0 if the registries are equal, 1 if they
+        differ and 2 on errors
+    """
+    parser = argparse.ArgumentParser(
+        prog="dpres-diff",
+        description="Compare two DPS spec versions of the file format "
+                    "registry, or two copies of the file formats JSON "
+                    "file.")
+    parser.add_argument(
+        "old", help="Old DPS spec version, such as 1.9.0 or V9, or path "
+                    "of the old file formats JSON file")
+    parser.add_argument(
+        "new", help="New DPS spec version or path of the new file formats "
+                    "JSON file")
+    parser.add_argument(
+        "--containers", nargs=2, metavar=("OLD", "NEW"),
+        help="Paths of the old and new AV container grading JSON files "
+             "to compare with the JSON files")
+    parser.add_argument(
+        "--json", action="store_true",
+        help="Write the differences as a JSON object")
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="Output file, or - to write standard output (default)")
+    args = parser.parse_args(argv)
+
+    specs = (_is_spec_version(args.old), _is_spec_version(args.new))
+    if specs[0] != specs[1]:
+        parser.error("compare two spec versions or two files")
+    if specs[0] and args.containers:
+        parser.error("--containers can only be given with files")
+
+    try:
+        if specs[0]:
+            diff = diff_specs(args.old, args.new)
+        else:
+            diff = diff_files(args.old, args.new,
+                              *(args.containers or (None, None)))
+    except (OSError, ValueError, KeyError) as error:
+        print(f"dpres-diff: error: {error}", file=sys.stderr)
+        return 2
+
+    # pylint: disable=consider-using-with
+    output = (sys.stdout if args.output == "-"
+              else open(args.output, "w", encoding="utf-8"))
+    try:
+        if args.json:
+            json.dump(diff.to_dict(), output, indent=4)
+            output.write("\n")
+        else:
+            write_text(diff, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if diff else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
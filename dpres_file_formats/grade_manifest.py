@@ -0,0 +1,280 @@
+"""Grade the files listed in a JSON Lines manifest.
+
+Each line of the manifest is a JSON object with the keys ``mimetype``,
+``version`` and ``streams``, given as to
+:func:`~dpres_file_formats.graders.grade`. The keys of ``streams`` are
+stream indexes as strings, like ``{"0": {"mimetype": ...}}``, or the
+streams can be given as a list. Other keys of the object, such as a file
+identifier, are copied to the output.
+
+For each line, a JSON object with the copied keys and the key ``grade`` is
+written, in the same order as in the manifest. A line that is not a valid
+record or can not be graded is written as an object with the copied keys,
+the line number as ``line`` and the error message as ``error``, and the
+grading continues with the next line. The manifest is read and graded in
+chunks, so that memory use does not grow with its size.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from collections import deque
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from typing import Any, NamedTuple
+
+from dpres_file_formats.graders import dispatch_table, grade_many
+
+GRADING_KEYS = ("mimetype", "version", "streams")
+
+
+class ManifestError(ValueError):
+    """Error in the manifest."""
+
+
+class GradedLine(NamedTuple):
+    """Output of one manifest line."""
+
+    output: str
+    error: str | None
+
+
+def parse_record(
+    line: str,
+) -> tuple[tuple[str, str, dict[int, dict[str, str]]], dict[str, Any]]:
+    """Parse one line of the manifest.
+
+    :param line: JSON object of a file
+    :returns: The ``(mimetype, version, streams)`` tuple of the file and
+        the other keys of the object
+    :raises ManifestError: if the line is not a valid record
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as error:
+        raise ManifestError(f"Invalid JSON: {error}") from error
+    if not isinstance(record, dict):
+        raise ManifestError("Record is not a JSON object")
+
+    streams = record.get("streams") or {}
+    if isinstance(streams, list):
+        streams = dict(enumerate(streams))
+    elif isinstance(streams, dict):
+        try:
+            streams = {int(index): stream
+                       for index, stream in streams.items()}
+        except ValueError as error:
+            raise ManifestError(
+                f"Stream index is not an integer: {error}") from error
+    else:
+        raise ManifestError("Streams are not a JSON object or list")
+    for index, stream in streams.items():
+        if not isinstance(stream, dict):
+            raise ManifestError(f"Stream {index} is not a JSON object")
+        for key, value in stream.items():
+            if not isinstance(value, str):
+                raise ManifestError(
+                    f"Stream {index}: {key} is not a string")
+
+    for key in ("mimetype", "version"):
+        if not isinstance(record.get(key), str):
+            raise ManifestError(f"{key} is missing or not a string")
+
+    other = {key: value for key, value in record.items()
+             if key not in GRADING_KEYS}
+    return (record.get("mimetype"), record.get("version"), streams), other
+
+
+def _grades(
+    files: list[tuple[str, str, dict[int, dict[str, str]]]]
+) -> Iterator[str | Exception]:
+    """Grade the files, yielding the error in place of the grade of a
+    file that can not be graded.
+    """
+    graded = 0
+    while graded < len(files):
+        # The grades after an error are yielded by a new grade_many()
+        try:
+            for file_grade in grade_many(files[graded:]):
+                graded += 1
+                yield file_grade
+        except (KeyError, TypeError, ValueError, AttributeError) as error:
+            # For example a container without the container stream 0
+            graded += 1
+            yield error
+
+
+def _error_line(
+    line_number: int, message: str, other: dict[str, Any]
+) -> GradedLine:
+    """Return the output of a line that could not be graded."""
+    error = f"Line {line_number}: {message}"
+    output = json.dumps({**other, "line": line_number, "error": message},
+                        ensure_ascii=False)
+    return GradedLine(output, error)
+
+
+def grade_chunk(chunk: tuple[int, list[str]]) -> list[GradedLine]:
+    """Grade a chunk of manifest lines.
+
+    :param chunk: Number of the first line and the lines of the chunk
+    :returns: Output lines without line breaks, with the error messages
+        of the lines that are not valid records or can not be graded
+    """
+    first_line, lines = chunk
+    files = []
+    others = []
+    output: list[GradedLine | None] = []
+    for line_number, line in enumerate(lines, start=first_line):
+        if not line.strip():
+            continue
+        try:
+            file, other = parse_record(line)
+        except ManifestError as error:
+            output.append(_error_line(line_number, str(error), {}))
+            continue
+        files.append(file)
+        others.append((len(output), line_number, other))
+        output.append(None)
+
+    for (index, line_number, other), file_grade in zip(
+            others, _grades(files)):
+        if isinstance(file_grade, Exception):
+            output[index] = _error_line(
+                line_number,
+                f"Grading failed: {type(file_grade).__name__}: "
+                f"{file_grade}",
+                other)
+        else:
+            output[index] = GradedLine(
+                json.dumps({**other, "grade": file_grade},
+                           ensure_ascii=False),
+                None)
+    return output
+
+
+def _chunks(
+    lines: Iterable[str], chunk_size: int
+) -> Iterator[tuple[int, list[str]]]:
+    """Split the lines into chunks of at most chunk_size lines."""
+    lines = iter(lines)
+    first_line = 1
+    while True:
+        chunk = list(islice(lines, chunk_size))
+        if not chunk:
+            return
+        yield first_line, chunk
+        first_line += len(chunk)
+
+
+def grade_lines(
+    lines: Iterable[str], processes: int = 1, chunk_size: int = 1000
+) -> Iterator[GradedLine]:
+    """Grade manifest lines.
+
+    With more than one process, the chunks are graded in a process pool.
+    At most two chunks per process are read ahead, and the output is
+    yielded in the input order.
+
+    :param lines: Manifest lines
+    :param processes: Number of grading processes
+    :param chunk_size: Number of lines graded at a time
+    :returns: Iterator of output lines without line breaks, with the error
+        messages of the lines that are not valid records or can not be
+        graded
+    :raises ValueError: if processes or chunk_size is not positive
+    """
+    if processes < 1:
+        raise ValueError("Number of processes must be positive")
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be positive")
+
+    chunks = _chunks(lines, chunk_size)
+    if processes == 1:
+        for chunk in chunks:
+            yield from grade_chunk(chunk)
+        return
+
+    # Imported here, as most users of the package never start a pool
+    import multiprocessing  # pylint: disable=import-outside-toplevel
+
+    # Load the registry before starting the pool, so that forked workers
+    # share it instead of each reading it
+    dispatch_table()
+    with multiprocessing.Pool(processes) as pool:
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(grade_chunk, (chunk,)))
+            if len(pending) >= 2 * processes:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Grade a manifest and write the grades as JSON Lines.
+
+    The errors of the lines that are not valid records or can not be
+    graded are also printed to the standard error.
+
+    :param argv: Command line arguments, sys.argv is used if None
+    :returns: Exit status, 1 if any line could not be graded
+    """
+    parser = argparse.ArgumentParser(
+        prog="dpres-grade",
+        description="Grade the files listed in a JSON Lines manifest.")
+    parser.add_argument(
+        "manifest", nargs="?", default="-",
+        help="Manifest file, or - to read standard input (default)")
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="Output file, or - to write standard output (default)")
+    parser.add_argument(
+        "-p", "--processes", type=int, default=1,
+        help="Number of grading processes (default: 1)")
+    parser.add_argument(
+        "--chunk-size", type=int, default=1000,
+        help="Number of lines graded at a time (default: 1000)")
+    args = parser.parse_args(argv)
+    if args.processes < 1:
+        parser.error("--processes must be positive")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be positive")
+
+    # pylint: disable=consider-using-with
+    try:
+        manifest = (sys.stdin if args.manifest == "-"
+                    else open(args.manifest, encoding="utf-8"))
+    except OSError as error:
+        parser.error(f"can not read {args.manifest}: {error.strerror}")
+    try:
+        output = (sys.stdout if args.output == "-"
+                  else open(args.output, "w", encoding="utf-8"))
+    except OSError as error:
+        manifest.close()
+        parser.error(f"can not write {args.output}: {error.strerror}")
+
+    errors = 0
+    try:
+        for line in grade_lines(manifest, args.processes, args.chunk_size):
+            output.write(line.output)
+            output.write("\n")
+            if line.error is not None:
+                errors += 1
+                print(f"dpres-grade: error: {args.manifest}: {line.error}",
+                      file=sys.stderr)
+    finally:
+        if manifest is not sys.stdin:
+            manifest.close()
+        if output is not sys.stdout:
+            output.close()
+    if errors:
+        print(f"dpres-grade: {errors} lines could not be graded",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
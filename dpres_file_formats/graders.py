@@ -1,16 +1,26 @@
 """Digital preservation grading."""
 from __future__ import annotations
 
-import functools
-
 from abc import ABCMeta, abstractmethod
-from typing import TypedDict
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from types import MappingProxyType
+from time import perf_counter
+from typing import TYPE_CHECKING, Any, NamedTuple
+from dpres_file_formats import instrumentation, query
 from dpres_file_formats.defaults import Grades, UnknownValue
-from dpres_file_formats.read_file_formats import (
-    file_formats,
-    av_container_grading,
+from dpres_file_formats.json_handler import data_generation
+from dpres_file_formats.registry import (
+    REGISTRY,
+    FormatIndex,
+    Registry,
+    _current_registry,
+    current_registry,
 )
 
+if TYPE_CHECKING:
+    from dpres_file_formats.records import FormatVersion
+
 NUMERIC_QUALITY_TO_GRADE = [Grades.UNACCEPTABLE, Grades.BIT_LEVEL,
                             Grades.WITH_RECOMMENDED, Grades.ACCEPTABLE,
                             Grades.RECOMMENDED]
@@ -24,9 +34,32 @@ GRADE_TO_NUMERIC_QUALITY = {
 }
 
 
+class _RegistryAttribute:
+    """Class attribute whose value is built lazily from the registry of
+    the current context, see :func:`grade`.
+    """
+
+    def __init__(self, build: Callable[[Registry], Any]) -> None:
+        self._build = build
+        self._name = ""
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self._name = f"{owner.__name__}.{name}"
+
+    def __get__(self, instance: Any, owner: type | None = None) -> Any:
+        registry = current_registry()
+        return registry.derived(self._name,
+                                lambda: self._build(registry))
+
+
 class BaseGrader(metaclass=ABCMeta):
     """Base class for graders."""
 
+    # Relative cost of grading a file. Cheaper graders are run first, so
+    # that the more expensive ones can be skipped once a file is found to
+    # be unacceptable.
+    cost: int = 10
+
     def __init__(
         self, mimetype: str, version: str, streams: dict[int, dict[str, str]]
     ) -> None:
@@ -55,6 +88,17 @@ class BaseGrader(metaclass=ABCMeta):
     def is_supported(cls, mimetype) -> bool:
         """Check whether grader is supported with given mimetype."""
 
+    @classmethod
+    def supported_mimetypes(cls) -> Iterable[str] | None:
+        """Return the lowercased mimetypes the grader may support, or None
+        if they are not known in advance.
+
+        The mimetypes are collected into the dispatch table of
+        :func:`grade`. Graders returning None are asked with
+        :meth:`is_supported` for every mimetype missing from the table.
+        """
+        return None
+
     @abstractmethod
     def grade(self) -> Grades:
         """Determine and return digital preservation grade for the file."""
@@ -63,72 +107,63 @@ class BaseGrader(metaclass=ABCMeta):
 class MIMEGrader(BaseGrader):
     """Grade file based on mimetype and version."""
 
-    formats = file_formats(unofficial=True)
+    cost = 1
+
+    formats = _RegistryAttribute(lambda registry: registry.formats)
+    format_index: FormatIndex = _RegistryAttribute(
+        lambda registry: registry.format_index)
 
     @classmethod
     def is_supported(cls, mimetype) -> bool:
         """Check whether grader is supported with given mimetype."""
-        return mimetype.lower() in map(
-            lambda f: f["mimetype"].lower(), cls.formats
-        )
+        return mimetype.lower() in cls.format_index.mimetypes
+
+    @classmethod
+    def supported_mimetypes(cls) -> Iterable[str]:
+        """Return the lowercased mimetypes the grader supports."""
+        return cls.format_index.mimetypes
 
     def grade(self) -> Grades:
         """Return digital preservation grade."""
-        grades = list(filter(
-            lambda f:
-            f["mimetype"].lower() == self.mimetype.lower() and
-            f["version"] == self.version,
-            self.formats
-        ))
-
-        if len(grades) == 0:
+        grade_ = self.format_index.grade(self.mimetype.lower(), self.version)
+
+        if grade_ is None:
             return Grades.UNACCEPTABLE
 
-        return grades[0]["grade"]
+        return grade_
 
 
 class TextGrader(BaseGrader):
     """Grade file based on mimetype, version and charset."""
 
-    formats = file_formats(unofficial=True)
+    cost = 2
+
+    formats = _RegistryAttribute(lambda registry: registry.formats)
+    format_index: FormatIndex = _RegistryAttribute(
+        lambda registry: registry.format_index)
 
     @classmethod
     def is_supported(cls, mimetype) -> bool:
         """Check whether grader is supported with given mimetype."""
         # TextGrader accepts mimetypes which are in formats and have allowed
         # charsets list non-empty.
-        return bool(list(filter(
-            lambda file_format:
-            file_format["mimetype"].lower() == mimetype.lower() and
-            file_format["charsets"], cls.formats)))
+        return mimetype.lower() in cls.format_index.text_mimetypes
+
+    @classmethod
+    def supported_mimetypes(cls) -> Iterable[str]:
+        """Return the lowercased mimetypes the grader supports."""
+        return cls.format_index.text_mimetypes
 
     def grade(self) -> Grades:
         """Return digital preservation grade."""
+        # Find the grade of the first format with a charset matching any
+        # of the streams
+        grade_ = self.format_index.text_grade(
+            self.mimetype.lower(), self.version, self.streams.values())
 
-        def does_match(file_format) -> bool:
-            # Given a file format object, checks if it has a relevant mime
-            def in_file_format_charsets(stream_info):
-                # Given a stream object, checks if it has acceptable charset
-                return stream_info["charset"] in file_format["charsets"]
-
-            return (
-                    file_format["mimetype"].lower() ==
-                    self.mimetype.lower() and
-                    file_format["version"] == self.version and
-                    any(map(in_file_format_charsets, self.streams.values())))
-
-        # Find the matching grades (assumed to have only 1 element) from the
-        # formats
-        grades = list(filter(does_match, self.formats))
-
-        if len(grades) == 0:
+        if grade_ is None:
             return Grades.UNACCEPTABLE
-        return grades[0]["grade"]
-
-
-class _GradingCriteria(TypedDict):
-    grade: Grades
-    streams: list[tuple[str, str]]
+        return grade_
 
 
 class ContainerStreamsGrader(BaseGrader):
@@ -141,102 +176,82 @@ class ContainerStreamsGrader(BaseGrader):
     tables 2 and 3.
     """
 
-    av_container_grades = av_container_grading()
+    cost = 3
+
+    av_container_grades = _RegistryAttribute(
+        lambda registry: registry.av_containers)
+    container_mimetypes = _RegistryAttribute(
+        lambda registry: registry.container_mimetypes)
+    stream_grades = _RegistryAttribute(
+        lambda registry: _container_stream_grades(registry.av_containers))
 
     @classmethod
     def is_supported(cls, mimetype) -> bool:
         """Check whether grader is supported with given mimetype."""
-        return mimetype.lower() in map(
-            lambda container: container["mimetype"].lower(),
-            cls.av_container_grades)
+        return mimetype.lower() in cls.container_mimetypes
+
+    @classmethod
+    def supported_mimetypes(cls) -> Iterable[str]:
+        """Return the lowercased mimetypes the grader supports."""
+        return cls.container_mimetypes
 
     def grade(self) -> Grades:
         """Return digital preservation grade."""
         # First stream should be the container
         container = self.streams[0]
-        container_mimetype = container["mimetype"].lower()
-        container_version = container["version"]
+        stream_grades = self.stream_grades.get(
+            (container["mimetype"].lower(), container["version"]), {})
 
-        # Create a set of (mime_type, version) tuples
-        # This makes it trivial to check which grade should be assigned.
-        contained_formats = {
-            (stream["mimetype"].lower(), stream["version"])
-            for index, stream in self.streams.items()
-            if index != 0
-        }
+        # Look up the grade of each stream and keep the weakest one.
+        # Return UNACCEPTABLE if some grade was not found.
+        weakest_quality = None
+        for index, stream in self.streams.items():
+            if index == 0:
+                continue
+            grade_ = stream_grades.get(
+                (stream["mimetype"].lower(), stream["version"]))
+            if grade_ is None:
+                return Grades.UNACCEPTABLE
+            quality = GRADE_TO_NUMERIC_QUALITY[grade_]
+            if weakest_quality is None or quality < weakest_quality:
+                weakest_quality = quality
 
         # When the container has no streams, return RECOMMENDED.
-        if len(contained_formats) == 0:
+        if weakest_quality is None:
             return Grades.RECOMMENDED
 
-        grading_criteria = self._grading_criteria(container_mimetype.lower(),
-                                                  container_version)
+        return NUMERIC_QUALITY_TO_GRADE[weakest_quality]
 
-        # Find the correct grade for each stream
-        grades = [
-            criterion["grade"]
-            for contained_format in contained_formats
-            for criterion in grading_criteria
-            if contained_format in criterion["streams"]
-        ]
 
-        # Return UNACCEPTABLE if some grade was not found.
-        if len(grades) != len(contained_formats):
-            return Grades.UNACCEPTABLE
-
-        # Select the weakest grade using tables
-        return weakest_grade(grades)
-
-    @classmethod
-    @functools.cache
-    def _grading_criteria(
-        cls, container_mimetype: str, container_version: str
-    ) -> list[_GradingCriteria]:
-        """
-        Given container mimetype and version, returns a list in a useful
-        form based on av_container_grades.
-        :return: List of grades, where each grade is a dict with keys
-            ``grade`` and ``streams``.
-            Streams are tuples in the form of ``(mimetype, version)``
-            and grade is the name of the grade.
+def _container_stream_grades(
+    av_container_grades: Iterable[Mapping],
+) -> Mapping[tuple[str, str], Mapping[tuple[str, str], Grades]]:
+    """Return a lookup table of the grades of the streams allowed in each
+    container.
 
-        """
-        # We only care about the entries which have the correct mimetype and
-        # version.
-        relevant_grades = list(
-            filter(
-                lambda av_container_grade: (
-                    av_container_grade["mimetype"].lower()
-                    == container_mimetype
-                    and av_container_grade["version"] == container_version
-                ),
-                cls.av_container_grades,
-            )
-        )
-
-        def transform_streams(format_object) -> list[tuple[str, str]]:
-            return list(
-                map(
-                    lambda stream: (
-                        stream["mimetype"].lower(),
-                        stream["version"],
-                    ),
-                    format_object["audio_streams"]
-                    + format_object["video_streams"],
-                )
-            )
-
-        # Transform grades to a format which is easier to work with
-        grading_criteria: list[_GradingCriteria] = list(
-            map(
-                lambda format_object: {
-                    "grade": format_object["grade"],
-                    "streams": transform_streams(format_object),
-                },
-                relevant_grades,
-            )
-        )
-        return grading_criteria
+    :param av_container_grades: AV container grading dicts
+    :returns: Read-only mapping from lowercased ``(mimetype, version)`` of
+        a container to a mapping from lowercased ``(mimetype, version)`` of
+        a stream to the best grade given to the stream in the container.
+    """
+    containers: dict[tuple[str, str], dict[tuple[str, str], Grades]] = {}
+    for container in av_container_grades:
+        stream_grades = containers.setdefault(
+            (container["mimetype"].lower(), container["version"]), {})
+        for stream in (list(container["audio_streams"])
+                       + list(container["video_streams"])):
+            key = (stream["mimetype"].lower(), stream["version"])
+            grade_ = container["grade"]
+            if key in stream_grades:
+                grade_ = NUMERIC_QUALITY_TO_GRADE[max(
+                    GRADE_TO_NUMERIC_QUALITY[stream_grades[key]],
+                    GRADE_TO_NUMERIC_QUALITY[grade_])]
+            stream_grades[key] = grade_
+
+    return MappingProxyType({
+        key: MappingProxyType(stream_grades)
+        for key, stream_grades in containers.items()
+    })
 
 
 class NotContainerStreamsGrader(BaseGrader):
@@ -244,20 +259,26 @@ class NotContainerStreamsGrader(BaseGrader):
     Gives grades to non-container files based on the amount of their streams.
     """
 
+    cost = 0
+
     # File formats, which contain only a single metadata stream. Excludes AV
     # file formats and gif/tiff formats, because they can contain multiple
     # metadata streams.
-    non_container_mime_types = ((set(map(lambda f: f["mimetype"].lower(),
-                                         file_formats(unofficial=True))) -
-                                 set(map(lambda f: f["mimetype"].lower(),
-                                         av_container_grading()))) -
-                                {"image/gif", "image/tiff"})
+    non_container_mime_types = _RegistryAttribute(
+        lambda registry: ((registry.format_index.mimetypes -
+                           registry.container_mimetypes) -
+                          {"image/gif", "image/tiff"}))
 
     @classmethod
     def is_supported(cls, mimetype) -> bool:
         """Check whether grader is supported with given mimetype."""
         return mimetype.lower() in cls.non_container_mime_types
 
+    @classmethod
+    def supported_mimetypes(cls) -> Iterable[str]:
+        """Return the lowercased mimetypes the grader supports."""
+        return cls.non_container_mime_types
+
     def grade(self) -> Grades:
         """Return digital preservation grade."""
 
@@ -277,31 +298,551 @@ GRADERS: list[type[BaseGrader]] = [
 ]
 
 
+def register_grader(grader: type[BaseGrader]) -> type[BaseGrader]:
+    """Add a grader to the graders used by :func:`grade`.
+
+    The grader can implement :meth:`BaseGrader.supported_mimetypes`, so
+    that it is added to the dispatch table only for those mimetypes.
+    Registering a grader again has no effect. Can be used as a class
+    decorator.
+
+    :param grader: Grader class
+    :returns: The grader class
+    """
+    global _graders_revision  # pylint: disable=global-statement
+    if grader not in GRADERS:
+        GRADERS.append(grader)
+        _graders_revision += 1
+    return grader
+
+
+# Incremented when a grader is registered, so that cached grades are not
+# used after the graders have changed
+_graders_revision = 0
+
+
+def _grading_state() -> tuple[int, int, int]:
+    """Return the state of the data and graders that the grades depend
+    on. Cached grades are valid only while the state is unchanged.
+    """
+    return (data_generation(), REGISTRY.revision, _graders_revision)
+
+
+class _DispatchTable(NamedTuple):
+    """Graders to use for each mimetype."""
+
+    graders: tuple[type[BaseGrader], ...]
+    by_mimetype: Mapping[str, tuple[type[BaseGrader], ...]]
+    open_graders: tuple[type[BaseGrader], ...]
+
+
+def _build_dispatch_table(
+    graders: tuple[type[BaseGrader], ...]
+) -> _DispatchTable:
+    """Build the dispatch table for the given graders."""
+    mimetypes: set[str] = set()
+    open_graders = []
+    for grader in graders:
+        supported = grader.supported_mimetypes()
+        if supported is None:
+            open_graders.append(grader)
+        else:
+            mimetypes.update(supported)
+
+    # Graders of equal cost are kept in the order of GRADERS
+    graders_by_cost = tuple(sorted(graders, key=lambda grader: grader.cost))
+    return _DispatchTable(
+        graders=graders,
+        by_mimetype=MappingProxyType({
+            mimetype: tuple(grader for grader in graders_by_cost
+                            if grader.is_supported(mimetype))
+            for mimetype in mimetypes
+        }),
+        open_graders=tuple(sorted(open_graders,
+                                  key=lambda grader: grader.cost)),
+    )
+
+
+def _dispatch_table() -> _DispatchTable:
+    """Return the dispatch table of the current graders, building it when
+    the registry data or the graders have changed.
+    """
+    graders = tuple(GRADERS)
+    registry = current_registry()
+    table = registry.derived("graders._dispatch_table",
+                             lambda: _build_dispatch_table(graders))
+    if table.graders != graders:
+        registry.discard("graders._dispatch_table")
+        table = registry.derived("graders._dispatch_table",
+                                 lambda: _build_dispatch_table(graders))
+    return table
+
+
+def dispatch_table() -> Mapping[str, tuple[type[BaseGrader], ...]]:
+    """Return the read-only mapping from lowercased mimetypes to the
+    graders used for them by :func:`grade`, cheapest first.
+
+    Mimetypes not in the mapping are graded only by the graders which do
+    not know their supported mimetypes in advance.
+    """
+    return _dispatch_table().by_mimetype
+
+
+class GradeCacheInfo(NamedTuple):
+    """Statistics of the grade cache."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class GradeCache:
+    """Bounded least recently used cache of grades keyed by
+    :func:`grade_signature`.
+
+    The cache is cleared automatically when the file format data is
+    written, when the registry is reset or its backend is replaced, and
+    when a grader is registered.
+    """
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        """Initialize the cache.
+
+        :param maxsize: Maximum number of cached grades
+        :raises ValueError: if maxsize is not positive
+        """
+        if maxsize < 1:
+            raise ValueError("Cache size must be positive")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._grades: OrderedDict[tuple, str] = OrderedDict()
+        self._state = _grading_state()
+
+    def get(self, signature: tuple) -> str | None:
+        """Return cached grade for the signature, or None if the grade is
+        not cached.
+        """
+        if self._state != _grading_state():
+            self.clear()
+        try:
+            grade_ = self._grades[signature]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._grades.move_to_end(signature)
+        self.hits += 1
+        return grade_
+
+    def put(self, signature: tuple, grade_: str) -> None:
+        """Cache grade for the signature, evicting the least recently used
+        grade if the cache is full.
+        """
+        self._grades[signature] = grade_
+        self._grades.move_to_end(signature)
+        if len(self._grades) > self.maxsize:
+            self._grades.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all cached grades."""
+        self._grades.clear()
+        self._state = _grading_state()
+
+    def info(self) -> GradeCacheInfo:
+        """Return cache statistics."""
+        return GradeCacheInfo(self.hits, self.misses, self.maxsize,
+                              len(self._grades))
+
+
+# Number of grades reused by each call of grade_many()
+GRADE_MANY_CACHE_SIZE = 4096
+
+# Grade cache used by grade(), disabled by default
+_grade_cache: GradeCache | None = None
+
+
+def enable_grade_cache(maxsize: int = 4096) -> None:
+    """Cache grades returned by :func:`grade`.
+
+    Enabling the cache again replaces the existing cache.
+
+    :param maxsize: Maximum number of cached grades
+    """
+    global _grade_cache  # pylint: disable=global-statement
+    _grade_cache = GradeCache(maxsize)
+
+
+def disable_grade_cache() -> None:
+    """Stop caching grades returned by :func:`grade`."""
+    global _grade_cache  # pylint: disable=global-statement
+    _grade_cache = None
+
+
+def grade_cache_info() -> GradeCacheInfo | None:
+    """Return statistics of the grade cache, or None if the cache is
+    disabled.
+    """
+    if _grade_cache is None:
+        return None
+    return _grade_cache.info()
+
+
 def grade(
-    mimetype: str, version: str, streams: dict[int, dict[str, str]]
+    mimetype: str,
+    version: str,
+    streams: dict[int, dict[str, str]],
+    as_of: str | None = None,
 ) -> str:
-    """Return digital preservation grade."""
+    """Return digital preservation grade.
+
+    :param mimetype: Mimetype of the file
+    :param version: Version of the file
+    :param streams: Streams of the file
+    :param as_of: DPS spec version, such as ``1.10.0`` or ``V10``, to
+        grade the file by the file formats as they were in, see
+        ``file_formats(as_of=...)``. The lookup tables of each spec
+        version are built once. Defaults to None, which grades by the
+        current file formats.
+    :returns: The grade, or ``UnknownValue.UNAV`` if the grade is not
+        known, such as for a version removed after the spec version
+    :raises ValueError: if the spec version is unknown
+    """
     if not mimetype or mimetype == UnknownValue.UNAV:
-        grade_ = UnknownValue.UNAV
+        return UnknownValue.UNAV
+
+    if as_of is not None:
+        token = _current_registry.set(REGISTRY.for_spec(as_of))
+        try:
+            return grade(mimetype, version, streams)
+        finally:
+            _current_registry.reset(token)
+
+    if instrumentation.active is not None:
+        return _instrumented_grade(mimetype, version, streams)
+
+    cache = _grade_cache
+    if cache is None:
+        return _grade(mimetype, version, streams,
+                      _supported_graders(mimetype))
+
+    signature = _cache_signature(mimetype, version, streams)
+    grade_ = cache.get(signature)
+    if grade_ is None:
+        grade_ = _grade(mimetype, version, streams,
+                        _supported_graders(mimetype))
+        cache.put(signature, grade_)
+    return grade_
+
+
+def _instrumented_grade(
+    mimetype: str, version: str, streams: dict[int, dict[str, str]]
+) -> str:
+    """Return digital preservation grade like :func:`grade`, recording
+    the call and the cache lookup.
+    """
+    instruments = instrumentation.active
+    start = perf_counter()
+    cache = _grade_cache
+    if cache is None:
+        grade_ = _grade(mimetype, version, streams,
+                        _supported_graders(mimetype))
     else:
-        grades = [grader(mimetype, version, streams).grade()
-                  for grader in GRADERS
-                  if grader.is_supported(mimetype)]
-        # If no graders support the MIME type, we don't know anything
-        # about the MIME type and therefore can not accept it
-        if not grades:
-            return Grades.UNACCEPTABLE
-        # Multiple grades might be returned. For example, Grader (which
-        # only performs a quick MIME type check) might grade the main file
-        # format as RECOMMENDED, while ContainerStreamsGrader might give it
-        # a lower grade because the contained streams do not fulfill the
-        # additional requirements.
-        #
-        # In such cases, pick the lowest assigned grade.
-        grade_ = weakest_grade(grades)
+        signature = _cache_signature(mimetype, version, streams)
+        grade_ = cache.get(signature)
+        instruments.cache_lookup("grade", grade_ is not None)
+        if grade_ is None:
+            grade_ = _grade(mimetype, version, streams,
+                            _supported_graders(mimetype))
+            cache.put(signature, grade_)
+    instruments.grade_called(perf_counter() - start, grade_)
     return grade_
 
 
+def _cache_signature(
+    mimetype: str, version: str, streams: dict[int, dict[str, str]]
+) -> tuple:
+    """Return the key of a file in the grade cache, which also tells the
+    spec version of the registry the file is graded by.
+    """
+    signature = grade_signature(mimetype, version, streams)
+    as_of = current_registry().as_of
+    if as_of is not None:
+        signature += (as_of,)
+    return signature
+
+
+def grade_many(
+    files: Iterable[tuple[str, str, dict[int, dict[str, str]]]],
+    as_of: str | None = None,
+) -> Iterator[str]:
+    """Return digital preservation grades for many files.
+
+    Grades are yielded lazily in the same order as the files are given.
+    The graders supporting each mimetype are resolved only once, and the
+    grades of the :data:`GRADE_MANY_CACHE_SIZE` most recently graded
+    signatures are reused for files with an equal
+    :func:`grade_signature`. Both are discarded when the data files,
+    registry or graders change between the files.
+
+    :param files: Iterable of ``(mimetype, version, streams)`` tuples,
+        where the items are given as to :func:`grade`.
+    :param as_of: DPS spec version to grade the files by, as given to
+        :func:`grade`
+    :returns: Iterator of grades.
+    :raises ValueError: if the spec version is unknown
+    """
+    supported_graders: dict[str, tuple[type[BaseGrader], ...]] = {}
+    grades = GradeCache(GRADE_MANY_CACHE_SIZE)
+    state = _grading_state()
+    instruments = instrumentation.active
+    registry = (current_registry() if as_of is None
+                else REGISTRY.for_spec(as_of))
+
+    for mimetype, version, streams in files:
+        if not mimetype or mimetype == UnknownValue.UNAV:
+            yield UnknownValue.UNAV
+            continue
+
+        current_state = _grading_state()
+        if current_state != state:
+            supported_graders.clear()
+            state = current_state
+        signature = grade_signature(mimetype, version, streams)
+        grade_ = grades.get(signature)
+        if instruments is not None:
+            instruments.cache_lookup("grade_many", grade_ is not None)
+        if grade_ is None:
+            # The registry is set only while grading, as the caller runs
+            # in the same context between the grades
+            token = _current_registry.set(registry)
+            try:
+                graders = supported_graders.get(mimetype)
+                if graders is None:
+                    graders = _supported_graders(mimetype)
+                    supported_graders[mimetype] = graders
+                grade_ = _grade(mimetype, version, streams, graders)
+            finally:
+                _current_registry.reset(token)
+            grades.put(signature, grade_)
+        yield grade_
+
+
+def puid_versions(
+    puid: str, streams: dict[int, dict[str, str]] | None = None
+) -> tuple[FormatVersion, ...]:
+    """Return the file format versions that a file identified by a PRONOM
+    PUID is graded as by :func:`grade_by_puid`.
+
+    The versions with the PUID in their ``format_registry_key`` are
+    looked up in the index of :mod:`dpres_file_formats.query`. If the
+    container stream ``streams[0]`` gives a mimetype, only the versions
+    with its mimetype and version are used. Of the remaining versions,
+    the active ones are used if there are any.
+
+    :param puid: PRONOM PUID, such as ``fmt/199``
+    :param streams: Streams of the file, as given to :func:`grade`
+    :returns: The versions in registry order, or an empty tuple
+    """
+    return _puid_versions(query.query_index(), puid, streams)
+
+
+def _puid_versions(
+    index: query.QueryIndex,
+    puid: str,
+    streams: dict[int, dict[str, str]] | None,
+) -> tuple[FormatVersion, ...]:
+    """Return the versions to grade a file with the PUID as."""
+    versions = index.by_puid(puid)
+    container = streams.get(0) if streams else None
+    if container is not None and container.get("mimetype"):
+        key = (container["mimetype"].lower(), container.get("version"))
+        versions = tuple(version for version in versions
+                         if (version.mimetype.lower(), version.version)
+                         == key)
+    active = tuple(version for version in versions if version.active)
+    return active or versions
+
+
+def grade_by_puid(
+    puid: str, streams: dict[int, dict[str, str]] | None = None
+) -> str:
+    """Return digital preservation grade of a file identified by a PRONOM
+    PUID.
+
+    A PUID may be the key of several file format versions. The file is
+    graded as each of the versions returned by :func:`puid_versions`, and
+    the weakest of the grades is returned. Give the streams to grade an
+    AV container by its streams or a text file by its charset, and to
+    narrow the versions down by the mimetype and version of the file.
+
+    A PUID does not tell the charset of a text file, so a file of a text
+    format, such as ``x-fmt/111``, is graded UNACCEPTABLE unless the
+    streams give the charset of the file.
+
+    :param puid: PRONOM PUID, such as ``fmt/199``
+    :param streams: Streams of the file, as given to :func:`grade`. By
+        default, the file is graded as having no other streams than the
+        container stream, which has the mimetype and version of each
+        version graded as and an unavailable charset.
+    :returns: The weakest grade, or UNACCEPTABLE if no version has the
+        PUID or the file is of a text format and its charset is not
+        given
+    """
+    return _grade_versions(puid_versions(puid, streams), streams)
+
+
+def grade_many_by_puid(
+    files: Iterable[str | tuple[str, dict[int, dict[str, str]] | None]]
+) -> Iterator[str]:
+    """Return digital preservation grades for many files identified by
+    PRONOM PUIDs.
+
+    Grades are yielded lazily in the same order as the files are given.
+    The grades of the :data:`GRADE_MANY_CACHE_SIZE` most recently graded
+    PUIDs and :func:`grade_signature` of their streams are reused for
+    equal files, until the data files, registry or graders change. Like
+    in :func:`grade_by_puid`, files of text formats are graded
+    UNACCEPTABLE unless their streams give the charset.
+
+    :param files: Iterable of PUIDs, or of ``(puid, streams)`` tuples,
+        where the items are given as to :func:`grade_by_puid`.
+    :returns: Iterator of grades.
+    """
+    index = query.query_index()
+    grades = GradeCache(GRADE_MANY_CACHE_SIZE)
+    state = _grading_state()
+    for file in files:
+        current_state = _grading_state()
+        if current_state != state:
+            index = query.query_index()
+            state = current_state
+        puid, streams = (file, None) if isinstance(file, str) else file
+        signature = (puid.strip(),
+                     grade_signature("", "", streams) if streams else None)
+        grade_ = grades.get(signature)
+        if grade_ is None:
+            grade_ = _grade_versions(
+                _puid_versions(index, puid, streams), streams)
+            grades.put(signature, grade_)
+        yield grade_
+
+
+def _grade_versions(
+    versions: Iterable[FormatVersion],
+    streams: dict[int, dict[str, str]] | None,
+) -> str:
+    """Return the weakest grade of a file graded as each of the versions.
+    """
+    grades = [
+        grade(mimetype, version, streams or {0: {
+            "mimetype": mimetype, "version": version,
+            "charset": UnknownValue.UNAV}})
+        for mimetype, version in dict.fromkeys(
+            (version.mimetype, version.version) for version in versions)
+    ]
+    if not grades:
+        return Grades.UNACCEPTABLE
+    return weakest_grade(grades)
+
+
+def grade_signature(
+    mimetype: str, version: str, streams: dict[int, dict[str, str]]
+) -> tuple:
+    """Return a canonical, hashable signature of a file to grade.
+
+    Files with equal signatures always get the same grade. The signature
+    contains the mimetype and version of the file, the container stream,
+    the set of ``(mimetype, version, charset)`` tuples of the other
+    streams and the number of streams, which is needed by
+    :class:`NotContainerStreamsGrader`.
+
+    :param mimetype: Mimetype of the file
+    :param version: Version of the file
+    :param streams: Streams of the file
+    :returns: Signature tuple
+    """
+    return (
+        mimetype,
+        version,
+        _stream_signature(streams.get(0)),
+        frozenset(_stream_signature(stream)
+                  for index, stream in streams.items()
+                  if index != 0),
+        len(streams),
+    )
+
+
+def _stream_signature(
+    stream: dict[str, str] | None
+) -> tuple[str | None, str | None, str | None] | None:
+    """Return the values of a stream that affect grading."""
+    if stream is None:
+        return None
+    return (stream.get("mimetype"), stream.get("version"),
+            stream.get("charset"))
+
+
+def _supported_graders(mimetype: str) -> tuple[type[BaseGrader], ...]:
+    """Return graders supporting the given mimetype."""
+    table = _dispatch_table()
+    graders = table.by_mimetype.get(mimetype.lower())
+    if graders is not None:
+        return graders
+    return tuple(grader for grader in table.open_graders
+                 if grader.is_supported(mimetype))
+
+
+def _grade(
+    mimetype: str,
+    version: str,
+    streams: dict[int, dict[str, str]],
+    graders: tuple[type[BaseGrader], ...],
+) -> str:
+    """Return the weakest grade given by the graders.
+
+    The graders are run in the given order until one of them returns
+    UNACCEPTABLE, which no other grade can make weaker. Otherwise, if a
+    grader returns ``UnknownValue.UNAV``, the grade is unknown.
+    """
+    # Multiple grades might be returned. For example, Grader (which
+    # only performs a quick MIME type check) might grade the main file
+    # format as RECOMMENDED, while ContainerStreamsGrader might give it
+    # a lower grade because the contained streams do not fulfill the
+    # additional requirements.
+    #
+    # In such cases, pick the lowest assigned grade.
+    instruments = instrumentation.active
+    weakest_quality = None
+    unknown = False
+    for grader in graders:
+        if instruments is None:
+            grade_ = grader(mimetype, version, streams).grade()
+        else:
+            grade_ = instruments.time_grader(
+                grader(mimetype, version, streams))
+        if grade_ == UnknownValue.UNAV:
+            # The grade of a version removed after the DPS spec version
+            # being graded by is not known
+            unknown = True
+            continue
+        quality = GRADE_TO_NUMERIC_QUALITY[grade_]
+        if quality == GRADE_TO_NUMERIC_QUALITY[Grades.UNACCEPTABLE]:
+            return Grades.UNACCEPTABLE
+        if weakest_quality is None or quality < weakest_quality:
+            weakest_quality = quality
+
+    if unknown:
+        return UnknownValue.UNAV
+
+    # If no graders support the MIME type, we don't know anything
+    # about the MIME type and therefore can not accept it
+    if weakest_quality is None:
+        return Grades.UNACCEPTABLE
+
+    return NUMERIC_QUALITY_TO_GRADE[weakest_quality]
+
+
 def weakest_grade(grades: list[Grades]) -> Grades:
     """Return weakest grade from provided list."""
     return NUMERIC_QUALITY_TO_GRADE[
@@ -0,0 +1,377 @@
+"""Opt-in instrumentation of grading and registry loads.
+
+Instrumentation is disabled by default. When it is disabled, the
+instrumented code only checks that :data:`active` is None. When it is
+enabled with :func:`enable_instrumentation`, the following are recorded:
+
+* calls and timings of :func:`~dpres_file_formats.graders.grade` and of
+  each grader
+* hits and misses of the grade cache and of the per-call cache of
+  :func:`~dpres_file_formats.graders.grade_many`
+* builds of the values derived from the registry, registry resets and
+  loads of the data files
+
+The recorded values are returned by :meth:`Instrumentation.snapshot`, and
+:func:`write_prometheus` writes them in the Prometheus text format. Each
+recorded event is also passed to the callbacks added with
+:func:`add_callback`.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from os import PathLike
+from time import perf_counter
+from typing import Any, NamedTuple
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.000_001, 0.000_005, 0.000_01, 0.000_05, 0.000_1,
+                   0.000_5, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+class Event(NamedTuple):
+    """Recorded event passed to the callbacks.
+
+    :ivar kind: ``"grade"``, ``"grader"``, ``"cache"``, ``"registry_build"``,
+        ``"registry_reset"`` or ``"data_load"``
+    :ivar name: Name of the grader, cache, derived value or data file, or
+        an empty string
+    :ivar seconds: Duration of the event, or 0.0
+    :ivar value: Grade, ``"hit"`` or ``"miss"`` for cache events, the
+        source of loaded data, or None
+    """
+
+    kind: str
+    name: str
+    seconds: float
+    value: Any
+
+
+class Histogram:
+    """Cumulative histogram of durations."""
+
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        """Initialize an empty histogram.
+
+        :param buckets: Upper bounds of the buckets in seconds
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        """Add a duration to the histogram."""
+        index = bisect_left(self.buckets, seconds)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative_counts(self) -> list[tuple[float, int]]:
+        """Return the number of durations at most each upper bound,
+        including the infinite upper bound last.
+        """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((float("inf"), self.count))
+        return result
+
+    def to_dict(self) -> dict:
+        """Return the histogram as a dict."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {_format_bound(bound): count
+                        for bound, count in self.cumulative_counts()},
+        }
+
+
+class Instrumentation:
+    """Recorded calls, timings, cache lookups and registry events."""
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        """Initialize the instrumentation with nothing recorded.
+
+        :param buckets: Upper bounds of the histogram buckets in seconds
+        """
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._callbacks: list[Callable[[Event], Any]] = []
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the recorded values. Callbacks are kept."""
+        with self._lock:
+            self._grade = Histogram(self._buckets)
+            self._graders: dict[str, Histogram] = {}
+            self._grades: dict[str, int] = {}
+            self._cache: dict[str, list[int]] = {}
+            self._registry_builds: dict[str, Histogram] = {}
+            self._registry_resets = 0
+            self._data_loads: dict[tuple[str, str], Histogram] = {}
+
+    def add_callback(self, callback: Callable[[Event], Any]) -> None:
+        """Call the callback with each recorded :class:`Event`."""
+        with self._lock:
+            self._callbacks = [*self._callbacks, callback]
+
+    def remove_callback(self, callback: Callable[[Event], Any]) -> None:
+        """Stop calling the callback.
+
+        :raises ValueError: if the callback has not been added
+        """
+        with self._lock:
+            callbacks = list(self._callbacks)
+            callbacks.remove(callback)
+            self._callbacks = callbacks
+
+    def _emit(self, event: Event) -> None:
+        for callback in self._callbacks:
+            callback(event)
+
+    def _histogram(self, histograms: dict, key: Any) -> Histogram:
+        try:
+            return histograms[key]
+        except KeyError:
+            histogram = histograms[key] = Histogram(self._buckets)
+            return histogram
+
+    def time_grader(self, grader: Any) -> str:
+        """Return the grade given by the grader instance, recording the
+        duration of the call.
+        """
+        start = perf_counter()
+        grade_ = grader.grade()
+        seconds = perf_counter() - start
+        name = type(grader).__name__
+        with self._lock:
+            self._histogram(self._graders, name).observe(seconds)
+        self._emit(Event("grader", name, seconds, grade_))
+        return grade_
+
+    def grade_called(self, seconds: float, grade_: str) -> None:
+        """Record a call of :func:`~dpres_file_formats.graders.grade`."""
+        with self._lock:
+            self._grade.observe(seconds)
+            self._grades[grade_] = self._grades.get(grade_, 0) + 1
+        self._emit(Event("grade", "", seconds, grade_))
+
+    def cache_lookup(self, cache: str, hit: bool) -> None:
+        """Record a lookup from a cache."""
+        with self._lock:
+            counts = self._cache.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += 1
+        self._emit(Event("cache", cache, 0.0, "hit" if hit else "miss"))
+
+    def registry_built(self, name: str, seconds: float) -> None:
+        """Record building a value derived from the registry."""
+        with self._lock:
+            self._histogram(self._registry_builds, name).observe(seconds)
+        self._emit(Event("registry_build", name, seconds, None))
+
+    def registry_reset(self) -> None:
+        """Record a reset of the registry."""
+        with self._lock:
+            self._registry_resets += 1
+        self._emit(Event("registry_reset", "", 0.0, None))
+
+    def data_loaded(self, name: str, seconds: float, source: str) -> None:
+        """Record loading a data file.
+
+        :param name: Name of the data file
+        :param seconds: Duration of reading and parsing the file
+        :param source: ``"json"``, ``"snapshot"``, ``"journal"`` when only
+            the journal of the file had changed, or ``"unchanged"`` when
+            the file was read but its content had not changed
+        """
+        with self._lock:
+            self._histogram(self._data_loads, (name, source)).observe(seconds)
+        self._emit(Event("data_load", name, seconds, source))
+
+    def snapshot(self) -> dict:
+        """Return the recorded values as a dict of plain values.
+
+        Cache hit rates are None for caches without lookups.
+        """
+        with self._lock:
+            return {
+                "grade": {**self._grade.to_dict(),
+                          "grades": dict(self._grades)},
+                "graders": {name: histogram.to_dict()
+                            for name, histogram in self._graders.items()},
+                "caches": {
+                    name: {"hits": hits, "misses": misses,
+                           "hit_rate": (hits / (hits + misses)
+                                        if hits + misses else None)}
+                    for name, (hits, misses) in self._cache.items()
+                },
+                "registry": {
+                    "resets": self._registry_resets,
+                    "builds": {name: histogram.to_dict() for name, histogram
+                               in self._registry_builds.items()},
+                    "data_loads": {
+                        f"{name}:{source}": histogram.to_dict()
+                        for (name, source), histogram
+                        in self._data_loads.items()
+                    },
+                },
+            }
+
+    def prometheus(self) -> str:
+        """Return the recorded values in the Prometheus text format."""
+        lines: list[str] = []
+        with self._lock:
+            _histogram_lines(lines, "dpres_grade_duration_seconds",
+                             "Duration of grade() calls",
+                             {(): self._grade})
+            _metric_lines(
+                lines, "dpres_grades_total", "counter",
+                "Grades returned by grade()",
+                {(("grade", grade_),): count
+                 for grade_, count in self._grades.items()})
+            _histogram_lines(
+                lines, "dpres_grader_duration_seconds",
+                "Duration of grader calls",
+                {(("grader", name),): histogram
+                 for name, histogram in self._graders.items()})
+            _metric_lines(
+                lines, "dpres_cache_lookups_total", "counter",
+                "Lookups from the grade caches",
+                {(("cache", name), ("result", result)): count
+                 for name, counts in self._cache.items()
+                 for result, count in zip(("hit", "miss"), counts)})
+            _metric_lines(
+                lines, "dpres_registry_resets_total", "counter",
+                "Resets of the registry", {(): self._registry_resets})
+            _histogram_lines(
+                lines, "dpres_registry_build_duration_seconds",
+                "Duration of building values derived from the registry",
+                {(("name", name),): histogram
+                 for name, histogram in self._registry_builds.items()})
+            _histogram_lines(
+                lines, "dpres_data_load_duration_seconds",
+                "Duration of loading the data files",
+                {(("file", name), ("source", source)): histogram
+                 for (name, source), histogram
+                 in self._data_loads.items()})
+        return "".join(line + "\n" for line in lines)
+
+
+def _format_bound(bound: float) -> str:
+    """Return the histogram bucket bound as a Prometheus label value."""
+    if bound == float("inf"):
+        return "+Inf"
+    return repr(bound)
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    """Return the labels in the Prometheus text format."""
+    labels = [
+        f'{name}="' + str(value).replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    ]
+    if not labels:
+        return ""
+    return "{" + ",".join(labels) + "}"
+
+
+def _metric_lines(
+    lines: list[str], name: str, metric_type: str, help_text: str,
+    values: dict[tuple, float],
+) -> None:
+    """Add the lines of a counter or gauge."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in values.items():
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+
+def _histogram_lines(
+    lines: list[str], name: str, help_text: str,
+    histograms: dict[tuple, Histogram],
+) -> None:
+    """Add the lines of a histogram."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in histograms.items():
+        for bound, count in histogram.cumulative_counts():
+            bucket_labels = _format_labels(
+                (*labels, ("le", _format_bound(bound))))
+            lines.append(f"{name}_bucket{bucket_labels} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+        lines.append(
+            f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+
+# Instrumentation in use, or None if disabled. Instrumented code checks
+# this before recording anything.
+active: Instrumentation | None = None
+
+
+def enable_instrumentation(
+    buckets: Iterable[float] = DEFAULT_BUCKETS,
+) -> Instrumentation:
+    """Start recording.
+
+    Enabling the instrumentation again replaces the recorded values and
+    callbacks.
+
+    :param buckets: Upper bounds of the histogram buckets in seconds
+    :returns: The enabled instrumentation
+    """
+    global active  # pylint: disable=global-statement
+    active = Instrumentation(buckets)
+    return active
+
+
+def disable_instrumentation() -> None:
+    """Stop recording."""
+    global active  # pylint: disable=global-statement
+    active = None
+
+
+def add_callback(callback: Callable[[Event], Any]) -> None:
+    """Call the callback with each event recorded by the enabled
+    instrumentation.
+
+    :raises RuntimeError: if the instrumentation is disabled
+    """
+    if active is None:
+        raise RuntimeError("Instrumentation is not enabled")
+    active.add_callback(callback)
+
+
+def snapshot() -> dict | None:
+    """Return the recorded values, or None if the instrumentation is
+    disabled. See :meth:`Instrumentation.snapshot`.
+    """
+    if active is None:
+        return None
+    return active.snapshot()
+
+
+def write_prometheus(path: str | PathLike) -> None:
+    """Write the recorded values to a file in the Prometheus text format.
+
+    The file is replaced atomically, so that a node exporter reading the
+    directory never sees a partially written file.
+
+    :param path: Path of the file, usually ending with ``.prom``
+    :raises RuntimeError: if the instrumentation is disabled
+    """
+    if active is None:
+        raise RuntimeError("Instrumentation is not enabled")
+    text = active.prometheus()
+    temporary_path = f"{os.fspath(path)}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(text)
+    os.replace(temporary_path, path)
@@ -3,23 +3,566 @@
 from __future__ import annotations
 
 import json
+import os
+import threading
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import contextmanager
 from importlib.resources import path as resource_path
 from os import PathLike
+from pathlib import Path
+from time import perf_counter
+from typing import Any, NamedTuple
 
+from dpres_file_formats import instrumentation
 from dpres_file_formats.defaults import (
-    DATA_MODULE_NAME, CONTAINERS_STREAMS_NAME, FILE_FORMATS_NAME
+    DATA_MODULE_NAME, CONTAINERS_STREAMS_NAME, FILE_FORMATS_NAME,
+    JOURNAL_SUFFIX, LOCK_SUFFIX, SNAPSHOT_SUFFIX
 )
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the data files are not locked
+    fcntl = None  # pylint: disable=invalid-name
+
+# Version of the snapshot file layout, increment when it changes
+SNAPSHOT_VERSION = 2
+
+# Version of the marshal format of the snapshots
+_MARSHAL_VERSION = 4
+
+# Version of the journal file layout, increment when it changes
+JOURNAL_VERSION = 1
+
+# Use snapshots of the data files when they are up to date
+USE_SNAPSHOTS = True
+
+# Append the changes to the data files to their journals instead of
+# writing the whole files, see write_changes(). Existing journals are read
+# regardless of this setting.
+USE_JOURNAL = False
+
+# Incremented whenever this process writes the data files or notices that
+# they have changed, so that caches derived from the data can notice that
+# the data has changed.
+_generation = 0
+
+
+def data_generation() -> int:
+    """Return a counter that changes whenever the data files are written
+    by this process, or when a changed data file is read.
+    """
+    return _generation
+
+
+def _data_changed() -> None:
+    global _generation  # pylint: disable=global-statement
+    _generation += 1
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError("Shared file format data is read-only")
+
+
+class ReadOnlyList(list):
+    """List that can not be modified.
+
+    Shared file format data is returned as read-only lists and dicts, so
+    that it can be used like the data read from JSON, but modifying it
+    raises :class:`TypeError`.
+    """
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = _read_only
+    sort = reverse = _read_only
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def __copy__(self) -> list:
+        return list(self)
+
+    def __deepcopy__(self, memo: dict) -> list:
+        return mutable_copy(self)
+
+
+class ReadOnlyDict(dict):
+    """Dict that can not be modified, see :class:`ReadOnlyList`."""
+
+    __slots__ = ()
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __copy__(self) -> dict:
+        return dict(self)
+
+    def __deepcopy__(self, memo: dict) -> dict:
+        return mutable_copy(self)
+
+
+def mutable_copy(value: Any) -> Any:
+    """Return a deep copy of shared file format data as plain lists and
+    dicts that can be modified.
+
+    :param value: Shared data, or a part of it such as a read-only list,
+        dict or other mapping
+    :returns: The copy, or the value itself if it is not a container
+    """
+    if isinstance(value, list):
+        return [mutable_copy(item) for item in value]
+    if isinstance(value, Mapping):
+        return {key: mutable_copy(item) for key, item in value.items()}
+    return value
+
+
+def _freeze_list(items: list) -> ReadOnlyList:
+    return ReadOnlyList([_freeze_list(item) if type(item) is list else item
+                         for item in items])
+
+
+def _freeze_object(pairs: list[tuple[str, Any]]) -> ReadOnlyDict:
+    # Called by the JSON decoder for each object after its members have
+    # been decoded, so only the lists need to be frozen here.
+    return ReadOnlyDict([
+        (key, _freeze_list(value) if type(value) is list else value)
+        for key, value in pairs
+    ])
+
+
+def loads_read_only(content: str | bytes) -> Any:
+    """Parse JSON with all lists and dicts read-only.
+
+    :param content: JSON document
+    :returns: The parsed value, with :class:`ReadOnlyList` and
+        :class:`ReadOnlyDict` in place of lists and dicts
+    """
+    value = json.loads(content, object_pairs_hook=_freeze_object)
+    if type(value) is list:
+        return _freeze_list(value)
+    return value
+
+
+def _freeze_plain_list(items: list) -> ReadOnlyList:
+    return ReadOnlyList([
+        _freeze_plain_dict(item) if type(item) is dict
+        else _freeze_plain_list(item) if type(item) is list
+        else item
+        for item in items
+    ])
+
+
+def _freeze_plain_dict(items: dict) -> ReadOnlyDict:
+    return ReadOnlyDict({
+        key: _freeze_plain_dict(item) if type(item) is dict
+        else _freeze_plain_list(item) if type(item) is list
+        else item
+        for key, item in items.items()
+    })
+
+
+def _parse_read_only(content: bytes) -> ReadOnlyList:
+    """Parse JSON data file content with all lists and dicts read-only."""
+    return loads_read_only(content)["file_formats"]
+
+
+def snapshot_path(path: str | PathLike) -> Path:
+    """Return the path of the snapshot of a data file."""
+    return Path(path).with_suffix(SNAPSHOT_SUFFIX)
+
+
+def write_snapshot(path: str | PathLike) -> Path:
+    """Write a snapshot of a data file next to it.
+
+    The snapshot contains the parsed data as plain lists and dicts in the
+    :mod:`marshal` format, and the SHA-256 digest of the data file, so
+    that it is used only while the data file is unchanged. The lookup
+    tables of the graders and the query indexes
+    are not stored, but built on first use: the dispatch table depends on
+    the registered graders and the query indexes share their records with
+    ``file_formats(records=True)``.
+
+    :param path: Path of the JSON data file
+    :returns: Path of the written snapshot
+    """
+    # Imported here to keep importing the package fast
+    import marshal  # pylint: disable=import-outside-toplevel
+
+    with open(path, "rb") as json_file:
+        content = json_file.read()
+    data = json.loads(content)["file_formats"]
+
+    target = snapshot_path(path)
+    _replace_file(target,
+                  _snapshot_header(_sha256(content))
+                  + marshal.dumps(data, _MARSHAL_VERSION))
+    return target
+
+
+def _snapshot_header(digest: str) -> bytes:
+    """Return the header of a snapshot of a data file with the digest."""
+    return f"dpres-snapshot {SNAPSHOT_VERSION} {digest}\n".encode("ASCII")
+
+
+def write_snapshots() -> list[Path]:
+    """Write snapshots of the data files of the package.
+
+    :returns: Paths of the written snapshots
+    """
+    snapshots = []
+    for resource_name in (FILE_FORMATS_NAME, CONTAINERS_STREAMS_NAME):
+        with resource_path(DATA_MODULE_NAME, resource_name) as path:
+            snapshots.append(write_snapshot(path))
+    return snapshots
+
+
+def _read_snapshot(path: str | PathLike, digest: str) -> ReadOnlyList | None:
+    """Return the data from the snapshot of a data file, or None if there
+    is no usable snapshot for the data file with the given digest.
+    """
+    # Imported here to keep importing the package fast
+    import marshal  # pylint: disable=import-outside-toplevel
+
+    header = _snapshot_header(digest)
+    try:
+        with open(snapshot_path(path), "rb") as snapshot_file:
+            # Reading the whole file is much faster than marshal.load()
+            content = snapshot_file.read()
+        if not content.startswith(header):
+            return None
+        data = marshal.loads(memoryview(content)[len(header):])
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError):
+        # A broken snapshot, or one written by a Python version with
+        # another marshal format, only makes the loading slower
+        return None
+    if type(data) is not list:
+        return None
+    return _freeze_plain_list(data)
+
+
+class _SharedFile(NamedTuple):
+    """Parsed data file and the information to check if it is current."""
+
+    path: str
+    stat_key: tuple[int, ...]
+    digest: str
+    journal_digest: str
+    base: ReadOnlyList
+    data: ReadOnlyList
+
+
+# Shared data files by resource name
+_shared_files: dict[str, _SharedFile] = {}
+
+
+def _sha256(content: bytes) -> str:
+    """Return the SHA-256 digest of the content as hex."""
+    # Imported here to keep importing the package fast
+    import hashlib  # pylint: disable=import-outside-toplevel
+    return hashlib.sha256(content).hexdigest()
+
+
+def journal_path(path: str | PathLike) -> Path:
+    """Return the path of the change journal of a data file."""
+    return Path(f"{os.fspath(path)}{JOURNAL_SUFFIX}")
+
+
+def _journal_header(digest: str) -> dict:
+    """Return the first record of a journal of the data file with the
+    given digest.
+    """
+    return {"version": JOURNAL_VERSION, "base_sha256": digest}
+
+
+def _read_journal(path: str | PathLike) -> bytes:
+    """Return the content of the journal of a data file, or empty bytes if
+    it has none.
+    """
+    try:
+        with open(journal_path(path), "rb") as journal_file:
+            return journal_file.read()
+    except FileNotFoundError:
+        return b""
+
+
+def _journal_changes(
+    journal: bytes, digest: str, object_pairs_hook: Any = None
+) -> list:
+    """Return the changes recorded in a journal as a list of
+    ``[path, value]`` pairs, see :func:`write_changes`.
+
+    A journal written for another version of the data file, left by an
+    interrupted write of the whole file, is ignored, as is an incomplete
+    last line left by an interrupted append.
+
+    :param journal: Content of the journal
+    :param digest: Digest of the data file content
+    :param object_pairs_hook: Hook used to decode the values
+    """
+    lines = journal.split(b"\n")[:-1]
+    if not lines or json.loads(lines[0]) != _journal_header(digest):
+        return []
+    changes = []
+    for line in lines[1:]:
+        changes.extend(
+            json.loads(line, object_pairs_hook=object_pairs_hook)["set"])
+    return changes
+
+
+def _set_path(container: Any, path: list, value: Any,
+              read_only: bool) -> None:
+    """Set the value at the path of list indexes and dict keys in the
+    container. An index one past the end of a list appends the value.
+
+    The container is modified in place. With read_only, the nested lists
+    and dicts on the path are replaced with modified read-only copies, so
+    that the shared data is not modified.
+    """
+    key = path[0]
+    if len(path) > 1:
+        child = container[key]
+        if read_only:
+            child = list(child) if isinstance(child, list) else dict(child)
+        _set_path(child, path[1:], value, read_only)
+        if read_only:
+            child = (ReadOnlyList(child) if isinstance(child, list)
+                     else ReadOnlyDict(child))
+        value = child
+    if isinstance(container, list) and key == len(container):
+        container.append(value)
+    else:
+        container[key] = value
+
+
+def _apply_changes(items: list, changes: list, read_only: bool) -> list:
+    """Return a copy of the items with the changes applied."""
+    items = list(items)
+    for path, value in changes:
+        _set_path(items, path, value, read_only)
+    return items
+
+
+def _append_journal(path: str | PathLike, changes: list) -> None:
+    """Append the changes to the journal of a data file as one record.
+
+    A journal of another version of the data file is replaced, and an
+    incomplete last line is removed.
+    """
+    target = journal_path(path)
+    journal = _read_journal(path)
+    with open(path, "rb") as json_file:
+        header = json.dumps(_journal_header(
+            _sha256(json_file.read()))).encode("UTF-8") + b"\n"
+    record = json.dumps({"set": changes},
+                        ensure_ascii=False).encode("UTF-8") + b"\n"
+
+    offset = journal.rfind(b"\n") + 1 if journal.startswith(header) else 0
+    with open(target, "r+b" if offset else "wb") as journal_file:
+        journal_file.seek(offset)
+        journal_file.truncate()
+        if not offset:
+            journal_file.write(header)
+        journal_file.write(record)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+    if not journal:
+        _fsync_directory(os.path.dirname(target) or ".")
+    _data_changed()
+
+
+def _remove_journal(path: str | PathLike) -> None:
+    """Remove the journal of a data file, if it has one."""
+    target = journal_path(path)
+    try:
+        os.unlink(target)
+    except FileNotFoundError:
+        return
+    _fsync_directory(os.path.dirname(target) or ".")
+
 
 def _read(path: str | PathLike) -> list[dict]:
-    with open(path, "r", encoding="UTF-8") as json_file:
-        return json.load(json_file)["file_formats"]
+    # Read the journal first, so that a journal removed after the data
+    # file is written is not applied to the new data file
+    journal = _read_journal(path)
+    with open(path, "rb") as json_file:
+        content = json_file.read()
+    file_formats = json.loads(content)["file_formats"]
+    if journal:
+        file_formats = _apply_changes(
+            file_formats, _journal_changes(journal, _sha256(content)),
+            read_only=False)
+    return file_formats
 
 
 def _write(path: str | PathLike, file_formats: list[dict]) -> None:
     data = {"file_formats": file_formats}
-    with open(path, "w", encoding="UTF-8") as json_file:
-        json.dump(data, json_file, indent=4, ensure_ascii=False)
+    _replace_file(path, json.dumps(data, indent=4,
+                                   ensure_ascii=False).encode("UTF-8"))
+    # The written file includes the changes in the journal
+    _remove_journal(path)
+    # Keep an existing snapshot up to date
+    if snapshot_path(path).exists():
+        write_snapshot(path)
+    _data_changed()
+
+
+def _replace_file(path: str | PathLike, content: bytes) -> None:
+    """Replace the file with the content atomically.
+
+    The content is written to a temporary file in the same directory,
+    synced to disk and renamed over the file, so that readers and a crash
+    leave either the old or the new content, never a partial file. The
+    file keeps its permissions.
+    """
+    path = os.fspath(path)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    descriptor = os.open(temporary_path,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with open(descriptor, "wb") as temporary_file:
+            temporary_file.write(content)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+        if os.path.exists(path):
+            os.chmod(temporary_path, os.stat(path).st_mode & 0o7777)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+    _fsync_directory(os.path.dirname(path) or ".")
+
+
+def _fsync_directory(directory: str) -> None:
+    """Sync the directory to disk, so that a rename in it is durable."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+# Lock of the data files held by this process, see registry_lock()
+_thread_lock = threading.RLock()
+_lock_file = None
+_lock_depth = 0
+
+
+@contextmanager
+def registry_lock() -> Iterator[None]:
+    """Hold an exclusive lock of the data files.
+
+    The lock is an advisory lock of a lock file next to the file formats
+    JSON, so that processes and threads updating the data files take
+    turns. The lock is reentrant within a thread. The functions updating
+    the registry hold the lock from reading the data files until they have
+    written them.
+    """
+    global _lock_file, _lock_depth  # pylint: disable=global-statement
+    with _thread_lock:
+        if _lock_depth == 0:
+            with resource_path(DATA_MODULE_NAME, FILE_FORMATS_NAME) as path:
+                lock_path = f"{os.fspath(path)}{LOCK_SUFFIX}"
+            # pylint: disable=consider-using-with
+            lock_file = open(lock_path, "ab")
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                lock_file.close()
+                raise
+            _lock_file = lock_file
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0:
+                # Closing the file releases the lock
+                _lock_file.close()
+                _lock_file = None
+
+
+def _stat_key(path: str) -> tuple[int, ...]:
+    """Return the modification times and sizes of a data file and its
+    journal.
+    """
+    stat = os.stat(path)
+    try:
+        journal_stat = os.stat(journal_path(path))
+    except FileNotFoundError:
+        return (stat.st_mtime_ns, stat.st_size)
+    return (stat.st_mtime_ns, stat.st_size,
+            journal_stat.st_mtime_ns, journal_stat.st_size)
+
+
+def _read_shared(resource_name: str) -> ReadOnlyList:
+    """Return the parsed data file, shared by all callers in this process.
+
+    The file is parsed again only if its modification time or size has
+    changed and its content is no longer the same. An up to date snapshot
+    of the file is used instead of parsing it, if one exists. The changes
+    in the journal of the file are applied on top of it, without parsing
+    the file again when only the journal has changed.
+    """
+    with resource_path(DATA_MODULE_NAME, resource_name) as path:
+        path = os.fspath(path)
+        stat_key = _stat_key(path)
+
+        shared = _shared_files.get(resource_name)
+        if shared and shared.path == path and shared.stat_key == stat_key:
+            return shared.data
+
+        start = perf_counter()
+        # Read the journal first, see _read()
+        journal = _read_journal(path)
+        with open(path, "rb") as json_file:
+            content = json_file.read()
+
+    digest = _sha256(content)
+    journal_digest = _sha256(journal) if journal else ""
+
+    if shared and shared.digest == digest:
+        base = shared.base
+        source = "unchanged"
+    else:
+        base = None
+        source = "snapshot"
+        if USE_SNAPSHOTS:
+            base = _read_snapshot(path, digest)
+        if base is None:
+            base = _parse_read_only(content)
+            source = "json"
+
+    if shared and source == "unchanged" \
+            and shared.journal_digest == journal_digest:
+        data = shared.data
+    else:
+        data = base
+        if journal:
+            data = ReadOnlyList(_apply_changes(
+                base, _journal_changes(journal, digest, _freeze_object),
+                read_only=True))
+            if source == "unchanged":
+                source = "journal"
+        if shared:
+            _data_changed()
+
+    _shared_files[resource_name] = _SharedFile(
+        path, stat_key, digest, journal_digest, base, data)
+    if instrumentation.active is not None:
+        instrumentation.active.data_loaded(
+            resource_name, perf_counter() - start, source)
+    return data
 
 
 def read_file_formats_json() -> list[dict]:
@@ -28,9 +571,35 @@ def read_file_formats_json() -> list[dict]:
         return _read(path)
 
 
+def current_shared_data(resource_name: str) -> ReadOnlyList | None:
+    """Return the shared data of a data file if it has been read and the
+    file has not changed since, without reading the file.
+
+    :param resource_name: Name of the data file
+    :returns: The shared data, or None if the file has to be read
+    """
+    shared = _shared_files.get(resource_name)
+    if shared is None:
+        return None
+    try:
+        if _stat_key(shared.path) != shared.stat_key:
+            return None
+    except OSError:
+        return None
+    return shared.data
+
+
+def shared_file_formats_json() -> ReadOnlyList:
+    """Return file formats from JSON file as read-only data shared within
+    the process. The file is parsed again only when it changes.
+    """
+    return _read_shared(FILE_FORMATS_NAME)
+
+
 def update_file_formats_json(file_formats: list[dict]) -> None:
     """Write file formats to JSON file."""
-    with resource_path(DATA_MODULE_NAME, FILE_FORMATS_NAME) as path:
+    with registry_lock(), \
+            resource_path(DATA_MODULE_NAME, FILE_FORMATS_NAME) as path:
         _write(path, file_formats)
 
 
@@ -40,7 +609,81 @@ def read_container_streams_json() -> list[dict]:
         return _read(path)
 
 
+def shared_container_streams_json() -> ReadOnlyList:
+    """Return container streams from JSON file as read-only data shared
+    within the process. The file is parsed again only when it changes.
+    """
+    return _read_shared(CONTAINERS_STREAMS_NAME)
+
+
 def write_container_streams_json(container_streams: list[dict]) -> None:
     """Write container streams from JSON file."""
-    with resource_path(DATA_MODULE_NAME, CONTAINERS_STREAMS_NAME) as path:
+    with registry_lock(), \
+            resource_path(DATA_MODULE_NAME, CONTAINERS_STREAMS_NAME) as path:
         _write(path, container_streams)
+
+
+def read_data_file(path: str | PathLike) -> list[dict]:
+    """Read the list of a file formats or AV container grading JSON file
+    at any path, such as a copy of the data files.
+
+    :param path: Path of the JSON file
+    :returns: The list of the file, with the changes in its journal
+        applied if it has one
+    """
+    return _read(path)
+
+
+def write_changes(
+    resource_name: str, items: list[dict], paths: Iterable[tuple]
+) -> None:
+    """Write the changed values of a data file.
+
+    With :data:`USE_JOURNAL`, the values at the given paths are appended
+    to the journal of the data file as one record, so that the cost of the
+    write depends only on the size of the changes. Otherwise the whole
+    data file is written.
+
+    :param resource_name: Name of the data file
+    :param items: All items of the data file, including the changes
+    :param paths: Paths of the changed values in the order of the changes,
+        as tuples of list indexes and dict keys. An index one past the end
+        of a list is an appended value. A path within another given path
+        is left out of the journal.
+    """
+    with registry_lock(), \
+            resource_path(DATA_MODULE_NAME, resource_name) as path:
+        if USE_JOURNAL:
+            paths = list(paths)
+            recorded = set(paths)
+            changes = []
+            for value_path in paths:
+                if any(value_path[:length] in recorded
+                       for length in range(1, len(value_path))):
+                    continue
+                value = items
+                for key in value_path:
+                    value = value[key]
+                changes.append([list(value_path), value])
+            _append_journal(path, changes)
+        else:
+            _write(path, items)
+
+
+def compact() -> list[Path]:
+    """Apply the journals of the data files to the files and remove the
+    journals.
+
+    The data files are written exactly as they would have been written
+    without the journals.
+
+    :returns: Paths of the data files that had a journal
+    """
+    compacted = []
+    with registry_lock():
+        for resource_name in (FILE_FORMATS_NAME, CONTAINERS_STREAMS_NAME):
+            with resource_path(DATA_MODULE_NAME, resource_name) as path:
+                if journal_path(path).exists():
+                    _write(path, _read(path))
+                    compacted.append(Path(path))
+    return compacted
@@ -0,0 +1,465 @@
+"""Read-only registry backend in a memory-mapped file.
+
+The registry file contains a flat string table and fixed-width records
+with hash tables for looking them up, so that it can be queried directly
+from the memory map without parsing it first. When the same file is
+mapped by many processes, the operating system keeps only one copy of it
+in memory.
+
+Build the file from the current registry data and take it into use for
+the graders with::
+
+    from dpres_file_formats.mmap_registry import write_mmap_registry
+    from dpres_file_formats.registry import use_mmap_registry
+    write_mmap_registry("/var/lib/dpres/registry.bin")
+    use_mmap_registry("/var/lib/dpres/registry.bin")
+"""
+from __future__ import annotations
+
+import json
+import mmap
+import struct
+import zlib
+from collections.abc import Iterable, Iterator, Mapping, Set
+from os import PathLike
+
+from dpres_file_formats.defaults import Grades
+from dpres_file_formats.json_handler import (
+    ReadOnlyDict,
+    ReadOnlyList,
+    _replace_file,
+    loads_read_only,
+    shared_container_streams_json,
+    shared_file_formats_json,
+)
+
+MAGIC = b"DPRG"
+# Version of the file layout, increment when it changes
+LAYOUT_VERSION = 2
+
+_HEADER = struct.Struct("<4s12I")
+# Offset and length of a string in the string table
+_STRING_REF = "II"
+# mimetype (lowercased), version, grade, charsets, version JSON, JSON of
+# the file format without its versions, next version with the same
+# mimetype and version, flags. The string table stores the JSON of each
+# file format once.
+_VERSION = struct.Struct("<" + _STRING_REF * 6 + "IB")
+# mimetype (lowercased), flags
+_MIMETYPE = struct.Struct("<" + _STRING_REF + "B")
+# mimetype (lowercased), version, JSON
+_CONTAINER = struct.Struct("<" + _STRING_REF * 3)
+_SLOT = struct.Struct("<I")
+
+_NONE = 0xFFFFFFFF
+_CHARSET_SEPARATOR = "\x1f"
+
+_VERSION_ACTIVE = 1
+_VERSION_OFFICIAL = 2
+_MIMETYPE_TEXT = 1
+
+
+def _hash(key: bytes) -> int:
+    # Python's own string hash is randomized per process
+    return zlib.crc32(key)
+
+
+def _slot_count(count: int) -> int:
+    """Return a power of two at least twice the count."""
+    slots = 8
+    while slots < count * 2:
+        slots *= 2
+    return slots
+
+
+class _StringTable:
+    """String table under construction."""
+
+    def __init__(self) -> None:
+        self.content = bytearray()
+        self._offsets: dict[str, tuple[int, int]] = {}
+
+    def add(self, value: str) -> tuple[int, int]:
+        """Add the string unless already added, and return its offset and
+        length.
+        """
+        try:
+            return self._offsets[value]
+        except KeyError:
+            encoded = value.encode("UTF-8")
+            ref = self._offsets[value] = (len(self.content), len(encoded))
+            self.content += encoded
+            return ref
+
+
+def _hash_table(keys: list[bytes]) -> list[int]:
+    """Return open addressing hash table slots with the index of the first
+    record of each key, or _NONE for empty slots.
+    """
+    slots = [_NONE] * _slot_count(len(keys))
+    mask = len(slots) - 1
+    seen = set()
+    for index, key in enumerate(keys):
+        if key in seen:
+            continue
+        seen.add(key)
+        slot = _hash(key) & mask
+        while slots[slot] != _NONE:
+            slot = (slot + 1) & mask
+        slots[slot] = index
+    return slots
+
+
+def _version_key(mimetype: str, version: str) -> bytes:
+    return f"{mimetype}\0{version}".encode("UTF-8")
+
+
+def write_mmap_registry(
+    path: str | PathLike,
+    file_formats: Iterable[Mapping] | None = None,
+    av_containers: Iterable[Mapping] | None = None,
+) -> None:
+    """Write a registry file for :class:`MmapRegistry`.
+
+    :param path: Path of the registry file to write
+    :param file_formats: File format dicts as in the JSON file, defaults
+        to the registry data of the package
+    :param av_containers: AV container grading dicts as in the JSON file,
+        defaults to the registry data of the package
+    """
+    if file_formats is None:
+        file_formats = shared_file_formats_json()
+    if av_containers is None:
+        av_containers = shared_container_streams_json()
+
+    strings = _StringTable()
+
+    versions = []
+    for format_dict in file_formats:
+        # The versions are stored separately, an empty list keeps the
+        # position of the key
+        format_json = json.dumps({**format_dict, "versions": []},
+                                 ensure_ascii=False)
+        mimetype = format_dict["mimetype"].lower()
+        for version_dict in format_dict.get("versions", []):
+            flags = 0
+            if version_dict.get("active", False):
+                flags |= _VERSION_ACTIVE
+            if version_dict.get("added_in_dps_spec", ""):
+                flags |= _VERSION_OFFICIAL
+            versions.append((
+                mimetype,
+                version_dict["version"],
+                version_dict["grade"],
+                _CHARSET_SEPARATOR.join(format_dict.get("charsets", [])),
+                json.dumps(version_dict, ensure_ascii=False),
+                format_json,
+                flags,
+            ))
+
+    version_keys = [_version_key(version[0], version[1])
+                    for version in versions]
+    # Chain the versions sharing a key, in their original order
+    next_versions = [_NONE] * len(versions)
+    last_versions: dict[bytes, int] = {}
+    for index, key in enumerate(version_keys):
+        if key in last_versions:
+            next_versions[last_versions[key]] = index
+        last_versions[key] = index
+
+    # Like the format index of the graders, the mimetypes are based on the
+    # active versions only
+    mimetypes: dict[str, int] = {}
+    for version in versions:
+        if not version[6] & _VERSION_ACTIVE:
+            continue
+        flags = mimetypes.get(version[0], 0)
+        if version[3]:
+            flags |= _MIMETYPE_TEXT
+        mimetypes[version[0]] = flags
+
+    version_records = b"".join(
+        _VERSION.pack(*(value for text in version[:6]
+                        for value in strings.add(text)),
+                      next_version, version[6])
+        for version, next_version in zip(versions, next_versions)
+    )
+    mimetype_records = b"".join(
+        _MIMETYPE.pack(*strings.add(mimetype), flags)
+        for mimetype, flags in mimetypes.items()
+    )
+    container_records = b"".join(
+        _CONTAINER.pack(*strings.add(container["mimetype"].lower()),
+                        *strings.add(container["version"]),
+                        *strings.add(json.dumps(container,
+                                                ensure_ascii=False)))
+        for container in av_containers
+    )
+    version_slots = _hash_table(version_keys)
+    mimetype_slots = _hash_table(
+        [mimetype.encode("UTF-8") for mimetype in mimetypes])
+
+    sections = [bytes(strings.content), version_records,
+                b"".join(_SLOT.pack(slot) for slot in version_slots),
+                mimetype_records,
+                b"".join(_SLOT.pack(slot) for slot in mimetype_slots),
+                container_records]
+    offsets = []
+    offset = _HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+
+    header = _HEADER.pack(
+        MAGIC, LAYOUT_VERSION,
+        offsets[0],
+        offsets[1], len(versions),
+        offsets[2], len(version_slots),
+        offsets[3], len(mimetypes),
+        offsets[4], len(mimetype_slots),
+        offsets[5], len(container_records) // _CONTAINER.size,
+    )
+
+    # Processes that have mapped the old file keep using it
+    _replace_file(path, header + b"".join(sections))
+
+
+class _MimetypeSet(Set):
+    """Set of lowercased mimetypes in the registry file."""
+
+    def __init__(self, registry: MmapRegistry, flags: int = 0) -> None:
+        self._registry = registry
+        self._flags = flags
+
+    def __contains__(self, mimetype: object) -> bool:
+        if not isinstance(mimetype, str):
+            return False
+        flags = self._registry.mimetype_flags(mimetype)
+        return flags is not None and flags & self._flags == self._flags
+
+    def __iter__(self) -> Iterator[str]:
+        return self._registry.iter_mimetypes(self._flags)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    @classmethod
+    def _from_iterable(cls, iterable: Iterable[str]) -> frozenset[str]:
+        # Results of set operations are ordinary sets
+        return frozenset(iterable)
+
+
+class MmapRegistry:
+    """Registry queried directly from a memory-mapped registry file.
+
+    The registry can be used in place of the format index of
+    :class:`~dpres_file_formats.registry.Registry`, so the mimetype and
+    grade lookups consider only active versions, like the graders. Mimetypes
+    given to the lookups must be lowercased.
+    """
+
+    def __init__(self, path: str | PathLike) -> None:
+        """Map the registry file to memory.
+
+        :param path: Path of the registry file
+        :raises ValueError: if the file is not a registry file of a
+            supported version
+        """
+        with open(path, "rb") as registry_file:
+            self._map = mmap.mmap(registry_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+        try:
+            header = _HEADER.unpack_from(self._map)
+        except struct.error as error:
+            self.close()
+            raise ValueError(f"{path} is not a registry file") from error
+        if header[:2] != (MAGIC, LAYOUT_VERSION):
+            self.close()
+            raise ValueError(
+                f"{path} is not a registry file of version {LAYOUT_VERSION}")
+        (self._strings, self._versions, self._version_count,
+         self._version_slots, self._version_slot_count,
+         self._mimetypes, self._mimetype_count,
+         self._mimetype_slots, self._mimetype_slot_count,
+         self._containers, self._container_count) = header[2:]
+
+    def close(self) -> None:
+        """Unmap the registry file."""
+        self._view.release()
+        self._map.close()
+
+    def _bytes(self, offset: int, length: int) -> memoryview:
+        start = self._strings + offset
+        return self._view[start:start + length]
+
+    def _str(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return str(self._map[start:start + length], "UTF-8")
+
+    def _version(self, index: int) -> tuple:
+        return _VERSION.unpack_from(
+            self._map, self._versions + index * _VERSION.size)
+
+    def _mimetype(self, index: int) -> tuple:
+        return _MIMETYPE.unpack_from(
+            self._map, self._mimetypes + index * _MIMETYPE.size)
+
+    def _find(self, key: bytes, slots: int, slot_count: int, matches) -> int:
+        """Return the index of the record with the key from a hash table,
+        or _NONE if not found.
+        """
+        mask = slot_count - 1
+        slot = _hash(key) & mask
+        while True:
+            index = _SLOT.unpack_from(self._map, slots + slot * _SLOT.size)[0]
+            if index == _NONE or matches(index, key):
+                return index
+            slot = (slot + 1) & mask
+
+    def _first_version(self, mimetype: str, version: str) -> int:
+        mimetype_bytes = mimetype.encode("UTF-8")
+        version_bytes = version.encode("UTF-8")
+
+        def matches(index, _key):
+            record = self._version(index)
+            return (self._bytes(*record[0:2]) == mimetype_bytes
+                    and self._bytes(*record[2:4]) == version_bytes)
+
+        return self._find(_version_key(mimetype, version),
+                          self._version_slots, self._version_slot_count,
+                          matches)
+
+    def _active_versions(
+        self, mimetype: str, version: str
+    ) -> Iterator[tuple]:
+        """Iterate the records of the active versions with the mimetype
+        and version.
+        """
+        index = self._first_version(mimetype, version)
+        while index != _NONE:
+            record = self._version(index)
+            if record[13] & _VERSION_ACTIVE:
+                yield record
+            index = record[12]
+
+    def mimetype_flags(self, mimetype: str) -> int | None:
+        """Return the flags of a lowercased mimetype, or None if the
+        mimetype is not in the registry.
+        """
+        def matches(index, key):
+            return self._bytes(*self._mimetype(index)[0:2]) == key
+
+        index = self._find(mimetype.encode("UTF-8"), self._mimetype_slots,
+                           self._mimetype_slot_count, matches)
+        if index == _NONE:
+            return None
+        return self._mimetype(index)[2]
+
+    def iter_mimetypes(self, flags: int = 0) -> Iterator[str]:
+        """Iterate lowercased mimetypes having all of the given flags."""
+        for index in range(self._mimetype_count):
+            record = self._mimetype(index)
+            if record[2] & flags == flags:
+                yield self._str(*record[0:2])
+
+    @property
+    def mimetypes(self) -> Set[str]:
+        """Lowercased mimetypes of all formats."""
+        return _MimetypeSet(self)
+
+    @property
+    def text_mimetypes(self) -> Set[str]:
+        """Lowercased mimetypes of formats with allowed charsets."""
+        return _MimetypeSet(self, _MIMETYPE_TEXT)
+
+    def grade(self, mimetype: str, version: str) -> Grades | None:
+        """Return the grade of the first format matching the mimetype and
+        version, or None if no format matches.
+        """
+        for record in self._active_versions(mimetype, version):
+            return self._str(*record[4:6])
+        return None
+
+    def text_grade(
+        self, mimetype: str, version: str, streams: Iterable[Mapping]
+    ) -> Grades | None:
+        """Return the grade of the first format matching the mimetype and
+        version which allows the charset of any of the given streams, or
+        None if no format matches.
+        """
+        streams = list(streams)
+        for record in self._active_versions(mimetype, version):
+            charsets = self._str(*record[6:8]).split(_CHARSET_SEPARATOR)
+            if any(stream["charset"] in charsets for stream in streams):
+                return self._str(*record[4:6])
+        return None
+
+    def file_formats(
+        self,
+        deprecated: bool = False,
+        unofficial: bool = False,
+        versions_separately: bool = True,
+    ) -> list[dict]:
+        """Return the file formats like :func:`file_formats` with the
+        arguments. Only the selected versions and their formats are
+        decoded, and nothing is kept in memory between the calls.
+        """
+        selected = []
+        format_ref = None
+        format_dict: dict = {}
+        for index in range(self._version_count):
+            record = self._version(index)
+            flags = record[13]
+            if not ((unofficial or flags & _VERSION_OFFICIAL)
+                    and (deprecated or flags & _VERSION_ACTIVE)):
+                continue
+            version_dict = json.loads(self._str(*record[8:10]))
+            if record[10:12] != format_ref:
+                format_ref = record[10:12]
+                format_dict = json.loads(self._str(*format_ref))
+                if versions_separately:
+                    del format_dict["_id"]
+                    del format_dict["versions"]
+                else:
+                    selected.append(format_dict)
+            if versions_separately:
+                selected.append({**format_dict, **version_dict})
+            else:
+                format_dict["versions"].append(version_dict)
+        return selected
+
+    def file_format_data(self) -> ReadOnlyList:
+        """Return the file formats like in the JSON file, as read-only
+        lists and dicts. File formats without versions are left out.
+        """
+        formats = []
+        format_ref = None
+        for index in range(self._version_count):
+            record = self._version(index)
+            if record[10:12] != format_ref:
+                format_ref = record[10:12]
+                versions: list = []
+                formats.append(
+                    (loads_read_only(self._str(*format_ref)), versions))
+            versions.append(loads_read_only(self._str(*record[8:10])))
+        return ReadOnlyList(
+            ReadOnlyDict({**format_dict, "versions": ReadOnlyList(versions)})
+            for format_dict, versions in formats)
+
+    def container_data(self) -> ReadOnlyList:
+        """Return the AV container grading dicts as read-only lists and
+        dicts.
+        """
+        return ReadOnlyList(
+            loads_read_only(self._str(*_CONTAINER.unpack_from(
+                self._map, self._containers + index * _CONTAINER.size)[4:6]))
+            for index in range(self._container_count))
+
+    def av_container_grading(self) -> list[dict]:
+        """Return the AV container grading dicts."""
+        return [
+            json.loads(self._str(*_CONTAINER.unpack_from(
+                self._map, self._containers + index * _CONTAINER.size)[4:6]))
+            for index in range(self._container_count)
+        ]
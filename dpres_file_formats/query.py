@@ -0,0 +1,180 @@
+"""Look up file formats and versions by their identifiers.
+
+The lookups use indexes built once from the registry on first use and
+built again when the data files change. Each lookup is a dict lookup, so
+they suit mapping many identification results, such as PRONOM PUIDs, to
+the file formats of the DPS.
+
+The lookups return the shared
+:class:`~dpres_file_formats.records.FileFormat` and
+:class:`~dpres_file_formats.records.FormatVersion` records of all file
+formats, including deprecated and unofficial ones. Use the ``active`` and
+``grade`` attributes of the versions to filter them.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from types import MappingProxyType
+
+from dpres_file_formats.read_file_formats import file_formats
+from dpres_file_formats.records import FileFormat, FormatVersion
+from dpres_file_formats.registry import REGISTRY
+
+
+def normalize_extension(extension: str) -> str:
+    """Return the extension lowercased and with a leading dot, as in the
+    ``typical_extensions`` of the file formats.
+    """
+    extension = extension.lower()
+    if not extension.startswith("."):
+        extension = "." + extension
+    return extension
+
+
+def split_puids(format_registry_key: str) -> list[str]:
+    """Return the PRONOM PUIDs of a format registry key.
+
+    A key may list several PUIDs separated by commas.
+    """
+    return [puid.strip() for puid in format_registry_key.split(",")
+            if puid.strip()]
+
+
+class QueryIndex:
+    """Immutable secondary indexes of file format records.
+
+    The results of each lookup are tuples in the order of the file
+    formats and versions in the registry.
+    """
+
+    __slots__ = ("_by_puid", "_by_extension", "_by_content_type",
+                 "_by_version_id", "_by_mimetype")
+
+    def __init__(self, versions: Iterable[FormatVersion]) -> None:
+        """Build the indexes.
+
+        :param versions: File format version records, as returned by
+            ``file_formats(versions_separately=True, records=True)``. The
+            file formats are indexed through the versions.
+        """
+        by_puid: dict[str, list[FormatVersion]] = {}
+        by_extension: dict[str, list[FileFormat]] = {}
+        by_content_type: dict[str, list[FileFormat]] = {}
+        by_version_id: dict[str, FormatVersion] = {}
+        by_mimetype: dict[str, list[FileFormat]] = {}
+        versions = list(versions)
+        for version in versions:
+            by_version_id.setdefault(version.id, version)
+            for puid in dict.fromkeys(
+                    split_puids(version.format_registry_key)):
+                by_puid.setdefault(puid, []).append(version)
+        for file_format in dict.fromkeys(
+                version.file_format for version in versions):
+            by_mimetype.setdefault(
+                file_format.mimetype.lower(), []).append(file_format)
+            by_content_type.setdefault(
+                file_format.content_type, []).append(file_format)
+            for extension in dict.fromkeys(
+                    map(normalize_extension, file_format.typical_extensions)):
+                by_extension.setdefault(extension, []).append(file_format)
+
+        self._by_puid = _freeze(by_puid)
+        self._by_extension = _freeze(by_extension)
+        self._by_content_type = _freeze(by_content_type)
+        self._by_version_id = MappingProxyType(by_version_id)
+        self._by_mimetype = _freeze(by_mimetype)
+
+    @property
+    def puids(self) -> frozenset[str]:
+        """PRONOM PUIDs of all indexed versions."""
+        return frozenset(self._by_puid)
+
+    def by_puid(self, puid: str) -> tuple[FormatVersion, ...]:
+        """Return the versions with the PRONOM PUID."""
+        return self._by_puid.get(puid.strip(), ())
+
+    def by_extension(self, extension: str) -> tuple[FileFormat, ...]:
+        """Return the file formats with the typical extension. The
+        extension is matched case-insensitively, with or without the
+        leading dot.
+        """
+        return self._by_extension.get(normalize_extension(extension), ())
+
+    def by_content_type(self, content_type: str) -> tuple[FileFormat, ...]:
+        """Return the file formats of the content type, given as a
+        :class:`~dpres_file_formats.defaults.ContentTypes` member or its
+        value.
+        """
+        return self._by_content_type.get(content_type, ())
+
+    def by_version_id(self, version_id: str) -> FormatVersion | None:
+        """Return the version with the ID, or None if there is none."""
+        return self._by_version_id.get(version_id)
+
+    def by_mimetype(self, mimetype: str) -> tuple[FileFormat, ...]:
+        """Return the file formats with the mimetype. The mimetype is
+        matched case-insensitively.
+        """
+        return self._by_mimetype.get(mimetype.lower(), ())
+
+
+def _freeze(index: dict[str, list]) -> Mapping[str, tuple]:
+    """Return the index as a read-only mapping of tuples."""
+    return MappingProxyType(
+        {key: tuple(values) for key, values in index.items()})
+
+
+def query_index() -> QueryIndex:
+    """Return the indexes of the registry, building them on first use."""
+    return REGISTRY.derived(
+        "query_index",
+        lambda: QueryIndex(file_formats(
+            deprecated=True, unofficial=True, versions_separately=True,
+            records=True)))
+
+
+def by_puid(puid: str) -> tuple[FormatVersion, ...]:
+    """Return the file format versions with the PRONOM PUID, such as
+    ``fmt/354``.
+
+    :param puid: PRONOM PUID
+    :returns: The versions in registry order, or an empty tuple
+    """
+    return query_index().by_puid(puid)
+
+
+def by_extension(extension: str) -> tuple[FileFormat, ...]:
+    """Return the file formats with the typical extension.
+
+    :param extension: File name extension, such as ``.pdf`` or ``PDF``
+    :returns: The file formats in registry order, or an empty tuple
+    """
+    return query_index().by_extension(extension)
+
+
+def by_content_type(content_type: str) -> tuple[FileFormat, ...]:
+    """Return the file formats of the content type.
+
+    :param content_type: Content type, such as ``ContentTypes.VIDEO`` or
+        ``"video"``
+    :returns: The file formats in registry order, or an empty tuple
+    """
+    return query_index().by_content_type(content_type)
+
+
+def by_version_id(version_id: str) -> FormatVersion | None:
+    """Return the file format version with the ID.
+
+    :param version_id: Version ID, such as ``FI_DPRES_PDF_1_1.7``
+    :returns: The version, or None if there is none
+    """
+    return query_index().by_version_id(version_id)
+
+
+def by_mimetype(mimetype: str) -> tuple[FileFormat, ...]:
+    """Return the file formats with the mimetype.
+
+    :param mimetype: Mimetype, matched case-insensitively
+    :returns: The file formats in registry order, or an empty tuple
+    """
+    return query_index().by_mimetype(mimetype)
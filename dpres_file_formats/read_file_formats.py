@@ -1,84 +1,376 @@
 """Functions that output the file formats list."""
 from __future__ import annotations
 
+import marshal
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from typing import TYPE_CHECKING, Any, TypeVar
+
+from dpres_file_formats.defaults import (
+    FILE_FORMATS_NAME,
+    DpsSpecVersions,
+    UnknownValue,
+)
 from dpres_file_formats.json_handler import (
-    read_container_streams_json,
-    read_file_formats_json,
+    ReadOnlyDict,
+    ReadOnlyList,
+    current_shared_data,
+    mutable_copy,
+    shared_container_streams_json,
+    shared_file_formats_json,
+)
+from dpres_file_formats.records import (
+    ContainerRule,
+    FileFormat,
+    FormatVersion,
 )
 
+if TYPE_CHECKING:
+    from dpres_file_formats.mmap_registry import MmapRegistry
+
+T = TypeVar("T")
+
+
+class FileFormatView(Mapping):
+    """Read-only view of a mapping with some of its keys overridden by
+    another mapping.
+
+    Views are used to filter and flatten the file formats without copying
+    or modifying the underlying dicts. The keys of the base mapping come
+    first in their original order, followed by the new keys of the
+    overriding mapping, like in ``{**base, **overrides}``.
+    """
+
+    __slots__ = ("_overrides", "_base", "_hidden")
+
+    def __init__(
+        self,
+        overrides: Mapping,
+        base: Mapping,
+        hidden: frozenset[str] = frozenset(),
+    ) -> None:
+        """Initialize the view.
+
+        :param overrides: Mapping whose values are preferred
+        :param base: Mapping whose values are used if not overridden
+        :param hidden: Keys of the base mapping to leave out of the view
+        """
+        self._overrides = overrides
+        self._base = base
+        self._hidden = hidden
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._overrides[key]
+        except KeyError:
+            pass
+        if key in self._hidden:
+            raise KeyError(key)
+        return self._base[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in self._base:
+            if key not in self._hidden:
+                yield key
+        for key in self._overrides:
+            if key not in self._base or key in self._hidden:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    @property
+    def base(self) -> Mapping:
+        """The mapping whose values are used if not overridden."""
+        return self._base
+
+    def to_dict(self) -> dict:
+        """Return the contents of the view as a new dict."""
+        merged = dict(self._base)
+        for key in self._hidden:
+            merged.pop(key, None)
+        merged.update(self._overrides)
+        return merged
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+# Keys of a file format which are not merged into its versions
+_FORMAT_ONLY_KEYS = frozenset(["versions", "_id"])
+
+
+def spec_version(spec: str) -> str:
+    """Return the value of a DPS spec version.
+
+    :param spec: DPS spec version as a
+        :class:`~dpres_file_formats.defaults.DpsSpecVersions` member, its
+        value such as ``1.10.0`` or its name such as ``V10``
+    :returns: The value of the spec version
+    :raises ValueError: if the spec version is unknown
+    """
+    try:
+        return DpsSpecVersions(spec).value
+    except ValueError:
+        pass
+    try:
+        return DpsSpecVersions[spec].value
+    except KeyError:
+        raise ValueError(f"Unknown DPS spec version {spec!r}") from None
+
+
+def spec_key(spec: str) -> tuple[int, ...]:
+    """Return a key for comparing DPS spec versions such as ``1.10.0``."""
+    return tuple(int(part) for part in spec.split("."))
+
+
+# Grade of the versions that were active in a DPS spec version but have
+# been removed since. The data records only the current grade of a
+# removed version, so its grade in the earlier spec version is unknown.
+_REMOVED_GRADE = UnknownValue.UNAV.value
+
+
+def _active_as_of(
+    added_in_dps_spec: str,
+    removed_in_dps_spec: str,
+    active: bool,
+    as_of: tuple[int, ...],
+) -> bool | None:
+    """Return whether a version was active in a DPS spec version.
+
+    Official versions were active from the spec version where they were
+    added until the one where they were removed. Versions not officially
+    in the spec or not known to be removed keep their current status.
+
+    :param added_in_dps_spec: DPS spec version where the version was
+        added, empty for versions not officially in the spec.
+    :param removed_in_dps_spec: DPS spec version where the version was
+        removed, empty for versions not removed.
+    :param active: Is the version active now.
+    :param as_of: Key of the spec version, as returned by
+        :func:`spec_key`.
+    :returns: The status of the version, or None if the version was added
+        after the spec version.
+    """
+    if not added_in_dps_spec:
+        return active
+    if spec_key(added_in_dps_spec) > as_of:
+        return None
+    if not removed_in_dps_spec:
+        return active
+    return spec_key(removed_in_dps_spec) > as_of
+
+
+def _version_included(
+    added_in_dps_spec: str,
+    active: bool,
+    include_deprecated: bool,
+    include_unofficial: bool,
+) -> bool:
+    """Return True if a version should be included in the output.
+
+    :param added_in_dps_spec: DPS spec version where the version was
+        added, empty for versions not officially in the spec.
+    :param active: Is the version active.
+    :param include_deprecated: Should deprecated versions be included.
+    :param include_unofficial: Should versions not officially in dps spec
+        be included.
+    """
+    official_ok = include_unofficial or added_in_dps_spec
+    status_ok = include_deprecated or active
+    return bool(official_ok and status_ok)
+
 
 def _select_format_and_versions(
-    file_formats_raw: list[dict],
+    file_formats_raw: Iterable[Mapping],
     include_deprecated: bool,
     include_unofficial: bool,
-) -> list[dict]:
+    as_of: str | None = None,
+) -> list[FileFormatView]:
     """Selects a file format and its versions based on if deprecated
     or unofficial file format versions are to be included in the
-    output or not. If a format dict is to be included, it is
-    included in the returned list.
+    output or not. If a format dict is to be included, a view of it
+    with only the included versions is included in the returned list.
+    The given format dicts are not modified.
 
     :param file_formats_raw: List of file format dicts.
     :param deprecated: Should deprecated versions be included.
     :param unofficial: Should formats not officially in dps spec be included.
-    :returns: List of file formats with filtered versions.
+    :param as_of: DPS spec version to select the versions of, or None for
+        the current versions.
+    :returns: List of file format views with filtered versions.
     """
     selected_formats = []
+    as_of_key = spec_key(as_of) if as_of else None
 
     for file_format in file_formats_raw:
-        include_format = False
         included_versions = []
-        # Set file format as active if any version is active or if
-        # the format should be included in the output
         for version in file_format.get("versions", []):
-            is_official_version = version.get("added_in_dps_spec", "")
-            is_active_version = version.get("active", False)
-
-            official_ok = include_unofficial or is_official_version
-            status_ok = include_deprecated or is_active_version
-
-            if official_ok and status_ok:
-                include_format = True
+            active = version.get("active", False)
+            if as_of_key is not None:
+                active = _active_as_of(
+                    version.get("added_in_dps_spec", ""),
+                    version.get("removed_in_dps_spec", ""),
+                    active, as_of_key)
+                if active is None:
+                    continue
+                if active != version.get("active", False):
+                    overrides = {"active": active}
+                    if active:
+                        overrides["grade"] = _REMOVED_GRADE
+                    version = ReadOnlyDict({**version, **overrides})
+            if _version_included(version.get("added_in_dps_spec", ""),
+                                 active, include_deprecated,
+                                 include_unofficial):
                 included_versions.append(version)
 
-        if include_format:
+        # Set file format as active if any version is active or if
+        # the format should be included in the output
+        if included_versions:
             # Include only active versions in the output
-            file_format["versions"] = included_versions
-            selected_formats.append(file_format)
+            selected_formats.append(FileFormatView(
+                {"versions": ReadOnlyList(included_versions)}, file_format))
 
     return selected_formats
 
 
-def _flatten_format_versions(selected_formats: list[dict]) -> list[dict]:
-    """Split the file format to dicts for each file format version,
+def _flatten_format_versions(
+    selected_formats: Iterable[Mapping]
+) -> list[FileFormatView]:
+    """Split the file format to views for each file format version,
     merging file format keys to the version dicts.
 
     :param selected_formats: List of file foramts with filtered versions.
-    :returns: List of flattened version dicts.
+    :returns: List of flattened version views.
     """
-    output_formats = []
+    flattened_formats = []
     for file_format in selected_formats:
-        format_dict = file_format.copy()
-        # Exclude unwanted file format keys from the output
-        for key in ["versions", "_id"]:
-            try:
-                del format_dict[key]
-            except KeyError:
-                pass
+        # Merge the versions to the underlying format dict, which has the
+        # same keys as the view apart from the versions.
+        if isinstance(file_format, FileFormatView):
+            format_dict = file_format.base
+        else:
+            format_dict = file_format
+        flattened_formats.extend(
+            FileFormatView(version_dict, format_dict, _FORMAT_ONLY_KEYS)
+            for version_dict in file_format.get("versions", [])
+        )
+    return flattened_formats
 
-        # Merge file format and version dicts
-        for version_dict in file_format.get("versions", []):
-            merged_dict = {**format_dict, **version_dict}
-            output_formats.append(merged_dict)
 
-    return output_formats
+# Outputs built from the built-in data, by output type and arguments.
+# Each output is stored with the parsed data it was built from.
+_shared_outputs: dict[tuple, tuple[list, list]] = {}
+
+
+def _registry_backend() -> MmapRegistry | None:
+    """Return the memory-mapped registry used by the graders, or None if
+    none is used.
+    """
+    # Imported here, as the registry module imports this module
+    # pylint: disable=import-outside-toplevel
+    from dpres_file_formats.registry import REGISTRY
+
+    return REGISTRY.backend
+
+
+def _registry_data(
+    name: str, read_json: Callable[[], ReadOnlyList]
+) -> ReadOnlyList:
+    """Return the built-in data from the memory-mapped registry used by
+    the graders, or from the JSON file if none is used.
+
+    :param name: Name of the method of the memory-mapped registry
+        returning the data
+    :param read_json: Function returning the data of the JSON file
+    """
+    # pylint: disable=import-outside-toplevel
+    from dpres_file_formats.registry import REGISTRY
+
+    backend = REGISTRY.backend
+    if backend is None:
+        return read_json()
+    return REGISTRY.derived(f"read_file_formats.{name}",
+                            getattr(backend, name))
+
+
+def _shared_output(key: tuple, data: list, build: Callable[[], T]) -> T:
+    """Return output built from the built-in data, building it only once
+    for each key and each parse of the data.
+    """
+    cached = _shared_outputs.get(key)
+    if cached is not None and cached[0] is data:
+        return cached[1]
+    output = build()
+    _shared_outputs[key] = (data, output)
+    return output
+
+
+def _file_format_views(
+    data: Iterable[Mapping],
+    deprecated: bool,
+    unofficial: bool,
+    versions_separately: bool,
+    as_of: str | None = None,
+) -> list[FileFormatView]:
+    """Return filtered and optionally flattened views of the file formats.
+    """
+    selected_formats = _select_format_and_versions(
+        data, deprecated, unofficial, as_of
+    )
+
+    if not versions_separately:
+        return selected_formats
+    return _flatten_format_versions(selected_formats)
+
+
+def _file_format_records(
+    all_records: Iterable[FileFormat],
+    deprecated: bool,
+    unofficial: bool,
+    versions_separately: bool,
+    as_of: str | None = None,
+) -> list[FileFormat] | list[FormatVersion]:
+    """Return filtered file format records, or their versions if
+    versions_separately is True.
+    """
+    selected_formats = []
+    as_of_key = spec_key(as_of) if as_of else None
+    for file_format in all_records:
+        included_versions = []
+        for version in file_format.versions:
+            active = version.active
+            if as_of_key is not None:
+                active = _active_as_of(
+                    version.added_in_dps_spec, version.removed_in_dps_spec,
+                    active, as_of_key)
+                if active is None:
+                    continue
+                if active != version.active:
+                    version = version.with_active(
+                        active, _REMOVED_GRADE if active else None)
+            if _version_included(version.added_in_dps_spec, active,
+                                 deprecated, unofficial):
+                included_versions.append(version)
+        if included_versions:
+            selected_formats.append(file_format.with_versions(
+                included_versions))
+
+    if not versions_separately:
+        return selected_formats
+    return [version for file_format in selected_formats
+            for version in file_format.versions]
 
 
 def file_formats(
     deprecated: bool = False,
     unofficial: bool = False,
     versions_separately: bool = True,
-    data: dict | None = None
-) -> list[dict]:
+    data: dict | None = None,
+    views: bool = False,
+    records: bool = False,
+    as_of: str | None = None,
+) -> list[dict] | list[FileFormatView] | list[FileFormat] | \
+        list[FormatVersion]:
     """Return file formats as a list of dicts with optional filtering and
         flattening.
 
@@ -92,24 +384,136 @@ def file_formats(
         to False.
     :param data: Optional file format data dictionary. If not provided, the
         package's built-in file format data will be used instead.
+    :param views: If set to True, will output read-only views of the data
+        instead of new dicts. Views of the built-in data are shared between
+        the calls, so repeated calls do not copy anything. Defaults to
+        False.
+    :param records: If set to True, will output
+        :class:`~dpres_file_formats.records.FileFormat` records, or
+        :class:`~dpres_file_formats.records.FormatVersion` records if
+        versions_separately is True, instead of dicts. Records of the
+        built-in data are shared between the calls. Defaults to False.
+    :param as_of: DPS spec version, such as ``1.10.0`` or ``V10``, to
+        return the file formats as they were in. The official versions
+        added after it are left out, and the other official versions are
+        active if they were not removed by it. The grade of the versions
+        removed after it is ``UnknownValue.UNAV``, as their earlier
+        grades are not recorded. The output for each spec
+        version is built from the built-in data only once. Defaults to
+        None, which returns the current file formats.
 
-    :returns: List of file format dicts.
+    :returns: List of file format dicts, views or records. The built-in
+        data is parsed only once per process. The dicts are new copies
+        that can be modified, while the views and records are read-only
+        data shared between the calls. When the graders use a
+        memory-mapped registry, the dicts of the current file formats
+        are decoded from it on each call, only for the selected
+        versions. Views, records and the file formats of a spec version
+        are built from the whole registry, decoded once per process.
+    :raises ValueError: if both views and records are requested, or if
+        the spec version is unknown
     """
+    if views and records:
+        raise ValueError("Only one of views and records can be requested")
+
+    if as_of is not None:
+        as_of = spec_version(as_of)
+    arguments = (deprecated, unofficial, versions_separately, as_of)
     if data:
         # Valid file format data has 'file_formats' as the root key
         data = data["file_formats"]
+        if records:
+            return _file_format_records(
+                [FileFormat.from_dict(format_dict) for format_dict in data],
+                *arguments)
+        format_views = _file_format_views(data, *arguments)
+        if views:
+            return format_views
+        return mutable_copy(format_views)
     else:
-        data = read_file_formats_json()
+        backend = _registry_backend()
+        if backend is not None and not (views or records or as_of):
+            return backend.file_formats(deprecated, unofficial,
+                                        versions_separately)
+        data = _registry_data("file_format_data", shared_file_formats_json)
+        if records:
+            all_records = _shared_output(
+                ("records",), data,
+                lambda: [FileFormat.from_dict(format_dict)
+                         for format_dict in data])
+            return list(_shared_output(
+                ("records", *arguments), data,
+                lambda: _file_format_records(all_records, *arguments)))
+        format_views = _shared_output(
+            ("views", *arguments), data,
+            lambda: _file_format_views(data, *arguments))
+        if views:
+            return list(format_views)
+        return _mutable_output(("dicts", *arguments), data, format_views)
 
-    selected_formats = _select_format_and_versions(
-        data, deprecated, unofficial
-    )
 
-    if not versions_separately:
-        return selected_formats
-    return _flatten_format_versions(selected_formats)
+def _mutable_output(key: tuple, data: list, output: list) -> list:
+    """Return a mutable copy of shared output.
+
+    A plain copy of the output is serialized with :mod:`marshal` once, as
+    loading it is much faster than copying the shared data on each call.
+    """
+    serialized = _shared_output(
+        key, data, lambda: marshal.dumps(mutable_copy(output)))
+    return marshal.loads(serialized)
 
 
-def av_container_grading() -> list[dict]:
-    """Return information about supported av containers"""
-    return read_container_streams_json()
+def views_built(
+    deprecated: bool = False,
+    unofficial: bool = False,
+    versions_separately: bool = True,
+    as_of: str | None = None,
+) -> bool:
+    """Return True if ``file_formats(views=True)`` with the arguments
+    returns views already built from the current built-in data, without
+    reading or building anything.
+
+    :raises ValueError: if the spec version is unknown
+    """
+    if as_of is not None:
+        as_of = spec_version(as_of)
+    cached = _shared_outputs.get(
+        ("views", deprecated, unofficial, versions_separately, as_of))
+    if cached is None:
+        return False
+
+    # pylint: disable=import-outside-toplevel
+    from dpres_file_formats.registry import REGISTRY
+
+    backend = REGISTRY.backend
+    if backend is None:
+        return cached[0] is current_shared_data(FILE_FORMATS_NAME)
+    name = "read_file_formats.file_format_data"
+    return (REGISTRY.is_built(name)
+            and cached[0] is REGISTRY.derived(name, backend.file_format_data))
+
+
+def av_container_grading(
+    records: bool = False
+) -> list[dict] | list[ContainerRule]:
+    """Return information about supported av containers.
+
+    The built-in data is parsed only once per process. When the graders
+    use a memory-mapped registry, the dicts are decoded from it on each
+    call and the records are built from it once per process. The dicts
+    in the output are new copies that can be modified.
+
+    :param records: If set to True, will output
+        :class:`~dpres_file_formats.records.ContainerRule` records shared
+        between the calls instead of dicts. Defaults to False.
+    """
+    backend = _registry_backend()
+    if backend is not None and not records:
+        return backend.av_container_grading()
+    data = _registry_data("container_data", shared_container_streams_json)
+    if records:
+        return list(_shared_output(
+            ("container_rules",), data,
+            lambda: [ContainerRule.from_dict(container)
+                     for container in data]))
+    return _mutable_output(("container_dicts",), data, data)
@@ -0,0 +1,344 @@
+"""Compact record types for the file format registry.
+
+The records hold the same information as the dicts in the JSON files, but
+use ``__slots__`` and tuples instead of dicts and lists. Like the shared
+dicts, the records can not be modified. Frequently repeated strings, such
+as mimetypes, versions and grades, are interned so that all records share
+one copy of each.
+"""
+from __future__ import annotations
+
+import sys
+from collections.abc import Iterable, Mapping
+from typing import Any, NamedTuple, TypeVar
+
+
+def _intern(value: Any) -> Any:
+    """Intern the value if it is a string."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class FormatSource(NamedTuple):
+    """Source of a file format version."""
+
+    pid: str
+    url: str
+    reference: str
+
+
+class FormatRelation(NamedTuple):
+    """Relation between two file formats."""
+
+    id: str
+    type: str
+    dps_spec_version: str
+    description: str
+
+
+class ContainerStream(NamedTuple):
+    """Stream allowed in an AV container."""
+
+    version_id: str
+    mimetype: str
+    version: str
+
+
+R = TypeVar("R", bound="_Record")
+
+
+class _Record:
+    """Base class of records that can not be modified.
+
+    The records are shared between all users of the registry, so their
+    attributes are set only when they are created.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def _set(self, **values: Any) -> None:
+        """Set the attributes of a record being created."""
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def _replace(self: R, **values: Any) -> R:
+        """Return a copy of the record with some attributes replaced."""
+        record = type(self).__new__(type(self))
+        for name in self.__slots__:
+            object.__setattr__(record, name,
+                               values.get(name, getattr(self, name)))
+        return record
+
+    def __setstate__(self, state: tuple[None, dict[str, Any]]) -> None:
+        # Unpickling and copying set the slots like this
+        self._set(**state[1])
+
+
+class FileFormat(_Record):
+    """File format and its versions."""
+
+    __slots__ = ("id", "mimetype", "content_type", "format_name_long",
+                 "format_name_short", "typical_extensions",
+                 "required_metadata", "charsets", "relations", "versions")
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        id: str,  # pylint: disable=redefined-builtin
+        mimetype: str,
+        content_type: str,
+        format_name_long: str = "",
+        format_name_short: str = "",
+        typical_extensions: tuple[str, ...] = (),
+        required_metadata: str = "",
+        charsets: tuple[str, ...] = (),
+        relations: tuple[FormatRelation, ...] = (),
+    ) -> None:
+        """Initialize the file format without versions."""
+        self._set(
+            id=id,
+            mimetype=_intern(mimetype),
+            content_type=_intern(content_type),
+            format_name_long=format_name_long,
+            format_name_short=format_name_short,
+            typical_extensions=tuple(map(_intern, typical_extensions)),
+            required_metadata=_intern(required_metadata),
+            charsets=tuple(map(_intern, charsets)),
+            relations=relations,
+            versions=(),
+        )
+
+    @classmethod
+    def from_dict(cls, format_dict: Mapping) -> FileFormat:
+        """Create the file format and its versions from a format dict."""
+        file_format = cls(
+            id=format_dict["_id"],
+            mimetype=format_dict["mimetype"],
+            content_type=format_dict["content_type"],
+            format_name_long=format_dict.get("format_name_long", ""),
+            format_name_short=format_dict.get("format_name_short", ""),
+            typical_extensions=format_dict.get("typical_extensions", ()),
+            required_metadata=format_dict.get("required_metadata", ""),
+            charsets=format_dict.get("charsets", ()),
+            relations=tuple(
+                FormatRelation(relation["_id"], _intern(relation["type"]),
+                               _intern(relation["dps_spec_version"]),
+                               relation["description"])
+                for relation in format_dict.get("relations", ())
+            ),
+        )
+        file_format._set(versions=tuple(
+            FormatVersion.from_dict(version_dict, file_format)
+            for version_dict in format_dict.get("versions", ())
+        ))
+        return file_format
+
+    def with_versions(self, versions: Iterable[FormatVersion]) -> FileFormat:
+        """Return a copy of the file format with only the given versions.
+
+        The versions still refer to the original file format.
+        """
+        return self._replace(versions=tuple(versions))
+
+    def to_dict(self) -> dict:
+        """Return the file format as a dict like in the JSON file."""
+        return {
+            "_id": self.id,
+            "mimetype": self.mimetype,
+            "content_type": self.content_type,
+            "format_name_long": self.format_name_long,
+            "format_name_short": self.format_name_short,
+            "typical_extensions": list(self.typical_extensions),
+            "required_metadata": self.required_metadata,
+            "charsets": list(self.charsets),
+            "relations": [
+                {"_id": relation.id, "type": relation.type,
+                 "dps_spec_version": relation.dps_spec_version,
+                 "description": relation.description}
+                for relation in self.relations
+            ],
+            "versions": [version.to_dict() for version in self.versions],
+        }
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.id!r}, {self.mimetype!r})"
+
+
+class FormatVersion(_Record):
+    """Version of a file format."""
+
+    __slots__ = ("file_format", "id", "version", "grade",
+                 "format_registry_key", "support_in_dps_ingest", "active",
+                 "added_in_dps_spec", "removed_in_dps_spec", "format_sources")
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        file_format: FileFormat,
+        id: str,  # pylint: disable=redefined-builtin
+        version: str,
+        grade: str,
+        format_registry_key: str = "",
+        support_in_dps_ingest: bool = False,
+        active: bool = False,
+        added_in_dps_spec: str = "",
+        removed_in_dps_spec: str = "",
+        format_sources: tuple[FormatSource, ...] = (),
+    ) -> None:
+        """Initialize the file format version."""
+        self._set(
+            file_format=file_format,
+            id=id,
+            version=_intern(version),
+            grade=_intern(grade),
+            format_registry_key=_intern(format_registry_key),
+            support_in_dps_ingest=support_in_dps_ingest,
+            active=active,
+            added_in_dps_spec=_intern(added_in_dps_spec),
+            removed_in_dps_spec=_intern(removed_in_dps_spec),
+            format_sources=format_sources,
+        )
+
+    @classmethod
+    def from_dict(
+        cls, version_dict: Mapping, file_format: FileFormat
+    ) -> FormatVersion:
+        """Create the file format version from a version dict."""
+        return cls(
+            file_format=file_format,
+            id=version_dict["_id"],
+            version=version_dict["version"],
+            grade=version_dict["grade"],
+            format_registry_key=version_dict.get("format_registry_key", ""),
+            support_in_dps_ingest=version_dict.get(
+                "support_in_dps_ingest", False),
+            active=version_dict.get("active", False),
+            added_in_dps_spec=version_dict.get("added_in_dps_spec", ""),
+            removed_in_dps_spec=version_dict.get("removed_in_dps_spec", ""),
+            format_sources=tuple(
+                FormatSource(source["pid"], source["url"],
+                             source["reference"])
+                for source in version_dict.get("format_sources", ())
+            ),
+        )
+
+    def with_active(
+        self, active: bool, grade: str | None = None
+    ) -> FormatVersion:
+        """Return a copy of the version with the given status, and with
+        the given grade unless it is None.
+        """
+        if grade is None:
+            return self._replace(active=active)
+        return self._replace(active=active, grade=grade)
+
+    @property
+    def mimetype(self) -> str:
+        """Mimetype of the file format."""
+        return self.file_format.mimetype
+
+    @property
+    def charsets(self) -> tuple[str, ...]:
+        """Allowed charsets of the file format."""
+        return self.file_format.charsets
+
+    def to_dict(self) -> dict:
+        """Return the version as a dict like in the JSON file."""
+        return {
+            "_id": self.id,
+            "version": self.version,
+            "grade": self.grade,
+            "format_registry_key": self.format_registry_key,
+            "support_in_dps_ingest": self.support_in_dps_ingest,
+            "active": self.active,
+            "added_in_dps_spec": self.added_in_dps_spec,
+            "removed_in_dps_spec": self.removed_in_dps_spec,
+            "format_sources": [source._asdict()
+                               for source in self.format_sources],
+        }
+
+    def to_flat_dict(self) -> dict:
+        """Return the version merged with its file format, like in the
+        output of ``file_formats(versions_separately=True)``.
+        """
+        format_dict = self.file_format.to_dict()
+        del format_dict["versions"]
+        del format_dict["_id"]
+        return {**format_dict, **self.to_dict()}
+
+    def __repr__(self) -> str:
+        return (f"{type(self).__name__}({self.id!r}, {self.mimetype!r}, "
+                f"{self.version!r})")
+
+
+class ContainerRule(_Record):
+    """Streams allowed in an AV container version and the grade given to
+    the container when it contains only them.
+    """
+
+    __slots__ = ("version_id", "mimetype", "version", "grade",
+                 "audio_streams", "video_streams")
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        version_id: str,
+        mimetype: str,
+        version: str,
+        grade: str,
+        audio_streams: tuple[ContainerStream, ...] = (),
+        video_streams: tuple[ContainerStream, ...] = (),
+    ) -> None:
+        """Initialize the container rule."""
+        self._set(
+            version_id=version_id,
+            mimetype=_intern(mimetype),
+            version=_intern(version),
+            grade=_intern(grade),
+            audio_streams=audio_streams,
+            video_streams=video_streams,
+        )
+
+    @classmethod
+    def from_dict(cls, container_dict: Mapping) -> ContainerRule:
+        """Create the container rule from an AV container grading dict."""
+        def streams(key):
+            return tuple(
+                ContainerStream(_intern(stream["version_id"]),
+                                _intern(stream["mimetype"]),
+                                _intern(stream["version"]))
+                for stream in container_dict.get(key, ())
+            )
+
+        return cls(
+            version_id=container_dict["version_id"],
+            mimetype=container_dict["mimetype"],
+            version=container_dict["version"],
+            grade=container_dict["grade"],
+            audio_streams=streams("audio_streams"),
+            video_streams=streams("video_streams"),
+        )
+
+    def to_dict(self) -> dict:
+        """Return the rule as a dict like in the JSON file."""
+        return {
+            "version_id": self.version_id,
+            "mimetype": self.mimetype,
+            "version": self.version,
+            "grade": self.grade,
+            "audio_streams": [stream._asdict()
+                              for stream in self.audio_streams],
+            "video_streams": [stream._asdict()
+                              for stream in self.video_streams],
+        }
+
+    def __repr__(self) -> str:
+        return (f"{type(self).__name__}({self.version_id!r}, "
+                f"{self.grade!r})")
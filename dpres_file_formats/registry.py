@@ -0,0 +1,280 @@
+"""Lazily loaded file format data shared by the graders."""
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable, Mapping
+from contextvars import ContextVar
+from os import PathLike
+from types import MappingProxyType
+from time import perf_counter
+from typing import Any, TypeVar
+
+from dpres_file_formats import instrumentation
+from dpres_file_formats.defaults import Grades
+from dpres_file_formats.json_handler import data_generation
+from dpres_file_formats.mmap_registry import MmapRegistry
+from dpres_file_formats.read_file_formats import (
+    av_container_grading,
+    file_formats,
+    spec_version,
+)
+
+T = TypeVar("T")
+
+
+class FormatIndex:
+    """Immutable lookup tables for grading by mimetype and version.
+
+    The index is built once from a flattened file format list, so that
+    graders do not have to scan the whole list for every file. Mimetypes
+    are lowercased when the index is built, and lookups expect lowercased
+    mimetypes.
+    """
+
+    __slots__ = ("_versions", "_mimetypes", "_text_mimetypes")
+
+    def __init__(self, formats: Iterable[Mapping]) -> None:
+        """Build the index.
+
+        :param formats: Flattened file format version dicts, as returned
+            by ``file_formats(versions_separately=True)``.
+        """
+        versions: dict[tuple[str, str], list] = {}
+        text_mimetypes = set()
+        for file_format in formats:
+            mimetype = file_format["mimetype"].lower()
+            # Several formats may share a mimetype and version, keep all
+            # of them in the original order.
+            versions.setdefault((mimetype, file_format["version"]), []).append(
+                (file_format["grade"], frozenset(file_format["charsets"]))
+            )
+            if file_format["charsets"]:
+                text_mimetypes.add(mimetype)
+
+        self._versions = MappingProxyType(
+            {key: tuple(entries) for key, entries in versions.items()}
+        )
+        self._mimetypes = frozenset(key[0] for key in versions)
+        self._text_mimetypes = frozenset(text_mimetypes)
+
+    @property
+    def mimetypes(self) -> frozenset[str]:
+        """Lowercased mimetypes of all indexed formats."""
+        return self._mimetypes
+
+    @property
+    def text_mimetypes(self) -> frozenset[str]:
+        """Lowercased mimetypes of formats with allowed charsets."""
+        return self._text_mimetypes
+
+    def grade(self, mimetype: str, version: str) -> Grades | None:
+        """Return the grade of the first format matching the mimetype and
+        version, or None if no format matches.
+        """
+        entries = self._versions.get((mimetype, version))
+        if not entries:
+            return None
+        return entries[0][0]
+
+    def text_grade(
+        self, mimetype: str, version: str, streams: Iterable[Mapping]
+    ) -> Grades | None:
+        """Return the grade of the first format matching the mimetype and
+        version which allows the charset of any of the given streams, or
+        None if no format matches.
+        """
+        streams = list(streams)
+        for grade_, charsets in self._versions.get((mimetype, version), ()):
+            if any(stream["charset"] in charsets for stream in streams):
+                return grade_
+        return None
+
+
+class Registry:
+    """File format data and the lookup tables derived from it.
+
+    Nothing is read when the registry is created. The data files are read
+    on first use, and each derived value is built once and kept until the
+    data files are written or the registry is reset.
+    """
+
+    def __init__(self, as_of: str | None = None) -> None:
+        """Initialize an empty registry.
+
+        :param as_of: Value of the DPS spec version whose file formats the
+            registry holds, or None for the current file formats
+        """
+        self._values: dict[str, Any] = {}
+        self._generation = data_generation()
+        self._backend: MmapRegistry | None = None
+        self._as_of = as_of
+        self._specs: dict[str, Registry] = {}
+        self._revision = 0
+
+    @property
+    def as_of(self) -> str | None:
+        """DPS spec version whose file formats the registry holds, or None
+        for the current file formats.
+        """
+        return self._as_of
+
+    def for_spec(self, as_of: str) -> Registry:
+        """Return the registry of the file formats as they were in a DPS
+        spec version, creating it on first use.
+
+        The registry of each spec version derives its own lookup tables
+        from ``file_formats(as_of=...)`` instead of querying the
+        memory-mapped registry.
+
+        :param as_of: DPS spec version, such as ``1.10.0`` or ``V10``
+        :returns: The registry of the spec version
+        :raises ValueError: if the spec version is unknown
+        """
+        as_of = spec_version(as_of)
+        registry = self._specs.get(as_of)
+        if registry is None:
+            registry = self._specs[as_of] = Registry(as_of)
+        return registry
+
+    @property
+    def revision(self) -> int:
+        """Counter that changes whenever the loaded data is forgotten,
+        such as when the registry is reset or its backend is replaced.
+        """
+        return self._revision
+
+    @property
+    def backend(self) -> MmapRegistry | None:
+        """Memory-mapped registry used instead of the JSON files, or None
+        if the JSON files are used.
+        """
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend: MmapRegistry | None) -> None:
+        self._backend = backend
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the loaded data, so that it is read again on next use."""
+        self._clear()
+        if instrumentation.active is not None:
+            instrumentation.active.registry_reset()
+
+    def _clear(self) -> None:
+        """Forget the loaded data of the registry and of the registries
+        of the DPS spec versions.
+        """
+        self._values.clear()
+        self._generation = data_generation()
+        self._revision += 1
+        for registry in self._specs.values():
+            registry._clear()
+
+    def is_built(self, name: str) -> bool:
+        """Return True if the derived value has been built from the
+        current data.
+
+        :param name: Name of the value
+        """
+        return (self._generation == data_generation()
+                and name in self._values)
+
+    def discard(self, name: str) -> None:
+        """Forget a derived value, so that it is built again on next use.
+
+        :param name: Name of the value
+        """
+        self._values.pop(name, None)
+
+    def derived(self, name: str, build: Callable[[], T]) -> T:
+        """Return a value derived from the registry data, building it on
+        first use.
+
+        :param name: Unique name of the value
+        :param build: Function that builds the value
+        :returns: The built value
+        """
+        if self._generation != data_generation():
+            self.reset()
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+
+        instruments = instrumentation.active
+        if instruments is None:
+            value = self._values[name] = build()
+            return value
+        start = perf_counter()
+        value = self._values[name] = build()
+        instruments.registry_built(name, perf_counter() - start)
+        return value
+
+    @property
+    def formats(self) -> list[Mapping]:
+        """Flattened file format versions, including unofficial ones."""
+        if self._backend is not None:
+            return self.derived(
+                "formats", lambda: self._backend.file_formats(unofficial=True))
+        return self.derived(
+            "formats", lambda: file_formats(unofficial=True, views=True,
+                                            as_of=self._as_of))
+
+    @property
+    def av_containers(self) -> list[dict]:
+        """AV container grading entries."""
+        if self._backend is not None:
+            return self.derived(
+                "av_containers", self._backend.av_container_grading)
+        return self.derived("av_containers", av_container_grading)
+
+    @property
+    def format_index(self) -> FormatIndex | MmapRegistry:
+        """Index of the flattened file format versions. The memory-mapped
+        registry is queried directly when it is in use.
+        """
+        if self._backend is not None:
+            return self._backend
+        return self.derived(
+            "format_index", lambda: FormatIndex(self.formats))
+
+    @property
+    def container_mimetypes(self) -> frozenset[str]:
+        """Lowercased mimetypes of the AV containers."""
+        return self.derived(
+            "container_mimetypes",
+            lambda: frozenset(container["mimetype"].lower()
+                              for container in self.av_containers))
+
+
+# The registry shared by all graders in this process
+REGISTRY = Registry()
+
+# The registry used by the graders in the current context, either the
+# shared registry or the registry of a DPS spec version of it
+_current_registry: ContextVar[Registry] = ContextVar(
+    "current_registry", default=REGISTRY)
+
+
+def current_registry() -> Registry:
+    """Return the registry used by the graders in the current context."""
+    return _current_registry.get()
+
+
+def use_mmap_registry(path: str | PathLike | None) -> None:
+    """Grade using a memory-mapped registry file instead of the JSON files.
+
+    The file is written with
+    :func:`~dpres_file_formats.mmap_registry.write_mmap_registry`.
+    :func:`~dpres_file_formats.read_file_formats.file_formats` and
+    :func:`~dpres_file_formats.read_file_formats.av_container_grading`
+    also read the file instead of the JSON files. Once mapped, the file is
+    not reloaded when the JSON files change.
+
+    :param path: Path of the registry file, or None to use the JSON files
+        again
+    """
+    previous = REGISTRY.backend
+    REGISTRY.backend = MmapRegistry(path) if path is not None else None
+    if previous is not None:
+        previous.close()
@@ -1,14 +1,21 @@
 """Functions that add and modify the file formats list."""
 from __future__ import annotations
 
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
 from dpres_file_formats.json_handler import (
     read_container_streams_json,
     read_file_formats_json,
-    update_file_formats_json,
-    write_container_streams_json
+    registry_lock,
+    write_changes
 )
 from dpres_file_formats.defaults import (
     ALLOWED_CHARSETS,
+    CONTAINERS_STREAMS_NAME,
+    FILE_FORMATS_NAME,
     ContentTypes,
     DpsSpecVersions,
     Grades,
@@ -17,80 +24,526 @@ from dpres_file_formats.defaults import (
     UnknownValue
 )
 
+if TYPE_CHECKING:
+    from dpres_file_formats.changeset import Changeset
+
 FORMAT_ID = 'FI_DPRES_{format_name_short}_{name_count}'
 VERSION_ID = '{format_id}_{version_name}'
 
 
-# pylint: disable=too-many-arguments, too-many-positional-arguments
-def add_format(
-    mimetype: str,
-    content_type: ContentTypes,
-    format_name_long: str,
-    format_name_short: str,
-    typical_extensions: list[str] | None = None,
-    required_metadata: str = "",
-    charsets: bool = False,
-) -> str:
-    """Adds a new file format.
+class _IdIndex:
+    """Index of the file formats for looking up formats and versions by
+    ID.
 
-    :param mimetype: The MIME type of the file format
-    :param content_type: The content type, from a controlled vocabulary
-    :param format_name_long: The full human readable file format name
-    :param format_name_short: A short file format name (e.g. AAC, MP3)
-    :param typical_extensions: A list of typical file format extensions
-    :param required_metadata: Required technical metadata, from a
-        controlled vocabulary
-    :param charsets: A Boolean value of whether charsets are required
+    The index refers to the dicts of the indexed list, so changes to the
+    dicts are seen through it. Formats and versions added to the list must
+    also be added to the index.
 
-    :returns: The file format ID
+    :ivar formats: Format dicts by format ID
+    :ivar positions: Positions of the formats in the list by format ID
+    :ivar versions: ``(format dict, version dict)`` tuples by version ID
+    :ivar short_names: Number of formats with each short format name
     """
 
-    if required_metadata:
-        required_metadata = TechMetadata[required_metadata].value
+    def __init__(self, file_formats: list[dict]) -> None:
+        """Index the file formats.
+
+        :param file_formats: List of format dicts
+        """
+        self.formats: dict[str, dict] = {}
+        self.positions: dict[str, int] = {}
+        self.versions: dict[str, tuple[dict, dict]] = {}
+        self.short_names: Counter[str] = Counter()
+        for position, format_dict in enumerate(file_formats):
+            self.add_format(format_dict, position)
+
+    def add_format(self, format_dict: dict, position: int) -> None:
+        """Add a format and its versions to the index.
+
+        :param format_dict: The format dict
+        :param position: Position of the format in the list
+        """
+        self.formats[format_dict['_id']] = format_dict
+        self.positions[format_dict['_id']] = position
+        self.short_names[format_dict.get('format_name_short', '')] += 1
+        for version_dict in format_dict.get('versions', []):
+            self.add_version(format_dict, version_dict)
+
+    def add_version(self, format_dict: dict, version_dict: dict) -> None:
+        """Add a version of a format to the index."""
+        self.versions.setdefault(version_dict['_id'],
+                                 (format_dict, version_dict))
+
+    def mimetype_version(
+        self, version_id: str, content_types: list[str]
+    ) -> tuple[str, str] | tuple[None, None]:
+        """Return the mimetype and version of a format version. The
+        format must be of a given content type.
+
+        :param version_id: The file format version ID
+        :param content_types: A list content types the format must be in
+
+        :returns: A tuple of (mimetype, version), or (None, None) if the
+            version doesn't exist or is of a wrong content type
+        """
+        try:
+            format_dict, version_dict = self.versions[version_id]
+        except KeyError:
+            return (None, None)
+        if format_dict['content_type'] not in content_types:
+            return (None, None)
+        return (format_dict['mimetype'], version_dict['version'])
+
+
+class RegistryEditor:
+    """In-memory copy of the registry data files for editing them in a
+    transaction, see :func:`edit_registry`.
+
+    The data files are read on first use. The methods validate their
+    arguments before changing anything, so a method raising an error
+    leaves the copy as it was.
+    """
 
-    if charsets:
-        allowed_charsets = ALLOWED_CHARSETS
-    else:
-        allowed_charsets = []
+    def __init__(self) -> None:
+        """Initialize the editor without reading the data files."""
+        self._file_format_list: list[dict] | None = None
+        self._av_container_list: list[dict] | None = None
+        self._id_index: _IdIndex | None = None
+        # Paths of the changed values by data file, see write_changes()
+        self._changed: dict[str, dict[tuple, None]] = {}
+        self._closed = False
+
+    def _file_formats(self) -> list[dict]:
+        """Return the file formats, reading them on first use."""
+        self._check_open()
+        if self._file_format_list is None:
+            self._file_format_list = read_file_formats_json()
+        return self._file_format_list
+
+    def _av_containers(self) -> list[dict]:
+        """Return the AV containers, reading them on first use."""
+        self._check_open()
+        if self._av_container_list is None:
+            self._av_container_list = read_container_streams_json()
+        return self._av_container_list
+
+    def _index(self) -> _IdIndex:
+        """Return the ID index of the file formats, building it on first
+        use.
+        """
+        if self._id_index is None:
+            self._id_index = _IdIndex(self._file_formats())
+        return self._id_index
+
+    def _check_open(self) -> None:
+        """Check that the transaction has not ended.
+
+        :raises RuntimeError: if the transaction has ended
+        """
+        if self._closed:
+            raise RuntimeError("The registry transaction has ended")
+
+    def _commit(self) -> None:
+        """Write the changed data files and end the transaction."""
+        self._check_open()
+        self._closed = True
+        for resource_name, items in (
+                (FILE_FORMATS_NAME, self._file_format_list),
+                (CONTAINERS_STREAMS_NAME, self._av_container_list)):
+            if resource_name in self._changed:
+                write_changes(resource_name, items,
+                              self._changed[resource_name])
+
+    def _rollback(self) -> None:
+        """Discard the changes and end the transaction."""
+        self._closed = True
+        self._file_format_list = None
+        self._av_container_list = None
+        self._id_index = None
+        self._changed.clear()
+
+    def _value_changed(self, resource_name: str, *path: int | str) -> None:
+        """Mark the value at the path of list indexes and dict keys in a
+        data file as changed.
+        """
+        self._changed.setdefault(resource_name, {})[path] = None
+
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def add_format(
+        self,
+        mimetype: str,
+        content_type: ContentTypes,
+        format_name_long: str,
+        format_name_short: str,
+        typical_extensions: list[str] | None = None,
+        required_metadata: str = "",
+        charsets: bool = False,
+    ) -> str:
+        """Adds a new file format.
+
+        :param mimetype: The MIME type of the file format
+        :param content_type: The content type, from a controlled vocabulary
+        :param format_name_long: The full human readable file format name
+        :param format_name_short: A short file format name (e.g. AAC, MP3)
+        :param typical_extensions: A list of typical file format extensions
+        :param required_metadata: Required technical metadata, from a
+            controlled vocabulary
+        :param charsets: A Boolean value of whether charsets are required
+
+        :returns: The file format ID
+        """
+
+        if required_metadata:
+            required_metadata = TechMetadata[required_metadata].value
+
+        if charsets:
+            allowed_charsets = ALLOWED_CHARSETS
+        else:
+            allowed_charsets = []
+
+        if not typical_extensions:
+            typical_extensions = []
+
+        file_formats = self._file_formats()
+        index = self._index()
+
+        # Count format_name_short for the format_id
+        name_count = index.short_names[format_name_short] + 1
+
+        # Use format_name_short and a running number as base for format_id
+        format_id = FORMAT_ID.format(format_name_short=format_name_short,
+                                     name_count=name_count)
+
+        format_dict = {
+            '_id': format_id,
+            'mimetype': mimetype,
+            'content_type': ContentTypes[content_type].value,
+            'format_name_long': format_name_long,
+            'format_name_short': format_name_short,
+            'typical_extensions': typical_extensions,
+            'required_metadata': required_metadata,
+            'charsets': allowed_charsets,
+            'relations': [],
+            'versions': []
+        }
+        file_formats.append(format_dict)
+        index.add_format(format_dict, len(file_formats) - 1)
+
+        self._value_changed(FILE_FORMATS_NAME, len(file_formats) - 1)
+
+        return format_id
+
+    # pylint: disable=too-many-locals
+    def add_version_to_format(
+        self,
+        format_id: str,
+        grade: str,
+        support_in_dps_ingest: str,
+        active: bool,
+        version: str | None = None,
+        format_registry_key: str = "",
+        added_in_dps_spec: str = "",
+        removed_in_dps_spec: str = "",
+        format_source_pid: str = "",
+        format_source_url: str = "",
+        format_source_reference: str = "",
+    ) -> None:
+        """Adds a new file format version to an existing file format. The
+        file format must exist, and the version cannot be a duplicate of an
+        existing version.
+
+        :param format_id: The ID of the file format as a string
+        :param grade: The file format grade in the DPS (e.g. recommended file
+            format), from a controlled vocabulary
+        :param support_in_dps_ingest: The support of the file format version in
+            the DPS ingest, as a Boolean value
+        :param active: The status of the file format in the DPS, i.e. is the
+            file format version in the latest version of the specifications,
+            as a Boolean value
+        :param version: The file format version as a string
+        :param format_registry_key: The PRONOM format registry key as a string
+        :param added_in_dps_spec: The DPS specification version, where the file
+            format version was added, from a controlled vocabulary
+        :param removed_in_dps_spec: The DPS specification version, where the
+            file format version was removed, from a controlled vocabulary
+        :param format_source_pid: The file format source ID
+        :param format_source_url: The file format source URL, requires
+            format_source_pid
+        :param format_source_reference: Bibliographic reference to the file
+            format source, requires format_source_pid
+
+        :raises ValueError: if file format is missing, or an existing
+            file format version is detected
+        """
+
+        version_name = version
+        if not version:
+            version = UnknownValue.UNAP
+            version_name = UnknownValue.UNAP
+
+        if added_in_dps_spec:
+            added_in_dps_spec = DpsSpecVersions[added_in_dps_spec].value
+
+        if removed_in_dps_spec:
+            removed_in_dps_spec = DpsSpecVersions[removed_in_dps_spec].value
+
+        format_sources = []
+        if format_source_pid:
+            format_source = {
+                'pid': format_source_pid,
+                'url': format_source_url,
+                'reference': format_source_reference
+            }
+            format_sources.append(format_source)
+
+        index = self._index()
+        format_dict = index.formats.get(format_id)
+
+        if not format_dict:
+            raise ValueError(f"File format {format_id} doesn't exist")
+
+        for versions_dict in format_dict.get('versions', []):
+            if version in versions_dict['version']:
+                raise ValueError(
+                    f"Version {version} for file format {format_id} "
+                    "already exists")
+
+        version_id = VERSION_ID.format(format_id=format_dict['_id'],
+                                       version_name=version_name)
+
+        version_dict = {
+            '_id': version_id,
+            'version': version,
+            'grade': Grades[grade].value,
+            'format_registry_key': format_registry_key,
+            'support_in_dps_ingest': support_in_dps_ingest,
+            'active': active,
+            'added_in_dps_spec': added_in_dps_spec,
+            'removed_in_dps_spec': removed_in_dps_spec,
+            'format_sources': format_sources
+        }
+        position = index.positions[format_id]
+        try:
+            format_dict['versions'].append(version_dict)
+            self._value_changed(FILE_FORMATS_NAME, position, 'versions',
+                                len(format_dict['versions']) - 1)
+        except KeyError:
+            format_dict['versions'] = [version_dict]
+            self._value_changed(FILE_FORMATS_NAME, position, 'versions')
+        index.add_version(format_dict, version_dict)
+
+    def replace_format(
+        self,
+        superseded_format: str, superseding_format: str, dps_spec_version: str
+    ) -> None:
+        """Replaces a format by adding a relationship between two formats,
+        where one format supersedes another format. The superseded format
+        is deprecated, and its versions are marked no longer active and
+        unacceptable for digital preservation.
+
+        :param superseded_format: ID of the file format that is deprecated
+        :param superseding_format: ID of the file format that replaces
+            the deprecated format
+        :param dps_spec_version: The DPS specification version where the change
+            was published, from a controlled vocabulary
+        """
+
+        index = self._index()
+        dps_spec = DpsSpecVersions[dps_spec_version].value
+
+        (
+            superseded_format_id,
+            superseded_format_mimetype,
+            superseding_format_id,
+            superseding_format_mimetype,
+        ) = _get_supersession_format_info(
+            superseded_format,
+            superseding_format,
+            index,
+        )
+
+        relation = {
+            "_id": "",
+            "type": "",
+            "dps_spec_version": dps_spec,
+            "description": (
+                f"MIME type changed from {superseded_format_mimetype} "
+                f"to {superseding_format_mimetype}"
+            ),
+        }
 
-    if not typical_extensions:
-        typical_extensions = []
+        format_dict = index.formats.get(superseded_format)
+        if format_dict is not None:
+            self._value_changed(FILE_FORMATS_NAME,
+                                index.positions[superseded_format])
+            superseded_relation = relation.copy()
+            superseded_relation["_id"] = superseding_format_id
+            superseded_relation["type"] = RelationshipTypes.SUPERSEDED
+            try:
+                format_dict["relations"].append(superseded_relation)
+            except KeyError:
+                format_dict["relations"] = [superseded_relation]
 
-    file_formats = read_file_formats_json()
+            # Set all versions as inactive and unacceptable for digital
+            # preservation for the deprecated format
+            for version in format_dict["versions"]:
+                version["active"] = False
+                version["support_in_dps_ingest"] = False
+                version["grade"] = Grades["UNACCEPTABLE"].value
+                version["removed_in_dps_spec"] = dps_spec
 
-    # Count format_name_short for the format_id
-    name_count = 1
+        format_dict = index.formats.get(superseding_format)
+        if format_dict is not None:
+            self._value_changed(FILE_FORMATS_NAME,
+                                index.positions[superseding_format])
+            superseding_relation = relation.copy()
+            superseding_relation["_id"] = superseded_format_id
+            superseding_relation["type"] = RelationshipTypes.SUPERSEDES
+            try:
+                format_dict["relations"].append(superseding_relation)
+            except KeyError:
+                format_dict["relations"] = [superseding_relation]
+
+    def add_av_container(
+        self,
+        version_id: str,
+        grade: str,
+        video_streams: list[str] | None = None,
+        audio_streams: list[str] | None = None,
+    ) -> None:
+        """Adds a new entry to the AV container grading JSON. The given
+        version_id for the container must exist, as must all given stream
+        identifiers. All IDs must be of a supported content type.
+
+        :param version_id: The ID of the container format version
+        :param grade: The file format grade in the DPS (e.g. recommended
+            file format), from a controlled vocabulary
+        :param video_streams: A list of video stream IDs (existing file
+            format versions)
+        :param audio_streams: A list of audio stream IDs (existing file
+            format versions)
+
+        :raises ValueError: if stream ID is missing, or it is of a wrong
+            content type
+        """
+
+        av_containers = self._av_containers()
+        index = self._index()
+
+        if not video_streams:
+            video_streams = []
+
+        if not audio_streams:
+            audio_streams = []
+
+        container_types = [ContentTypes["AUDIOCONTAINER"].value,
+                           ContentTypes["VIDEOCONTAINER"].value]
+
+        (mimetype, version) = index.mimetype_version(version_id,
+                                                     container_types)
+
+        if not mimetype:
+            raise ValueError(f"File format version {version_id} doesn't "
+                             "exist or is not an AV container type.")
+
+        av_video_streams = _parse_streams(
+            index=index,
+            content_type=ContentTypes["VIDEO"].value,
+            streams=video_streams)
+
+        av_audio_streams = _parse_streams(
+            index=index,
+            content_type=ContentTypes["AUDIO"].value,
+            streams=audio_streams)
+
+        container_dict = {
+            'version_id': version_id,
+            'mimetype': mimetype,
+            'version': version,
+            'grade': Grades[grade].value,
+            'audio_streams': av_audio_streams,
+            'video_streams': av_video_streams
+        }
+
+        av_containers.append(container_dict)
+
+        self._value_changed(CONTAINERS_STREAMS_NAME,
+                            len(av_containers) - 1)
 
-    for file_format in file_formats:
-        if file_format.get('format_name_short', '') == format_name_short:
-            name_count += 1
+    def apply_changeset(self, changeset: Changeset) -> list[str]:
+        """Validates a changeset and applies it. The formats are added
+        first, then the versions, the supersessions and the AV container
+        rules. See :mod:`dpres_file_formats.changeset`.
 
-    # Use format_name_short and a running number as base for format_id
-    format_id = FORMAT_ID.format(format_name_short=format_name_short,
-                                 name_count=name_count)
+        :param changeset: The parsed changeset
 
-    format_dict = {
-        '_id': format_id,
-        'mimetype': mimetype,
-        'content_type': ContentTypes[content_type].value,
-        'format_name_long': format_name_long,
-        'format_name_short': format_name_short,
-        'typical_extensions': typical_extensions,
-        'required_metadata': required_metadata,
-        'charsets': allowed_charsets,
-        'relations': [],
-        'versions': []
-    }
-    file_formats.append(format_dict)
+        :returns: The IDs of the new formats
+        :raises ChangesetError: if the changeset has errors, in which case
+            nothing is changed
+        """
+        format_ids = changeset.validate(self._index())
 
-    update_file_formats_json(file_formats=file_formats)
+        for item in changeset.formats:
+            self.add_format(**item.fields)
+        for item in changeset.versions:
+            self.add_version_to_format(**item.fields)
+        for item in changeset.supersessions:
+            self.replace_format(**item.fields)
+        for item in changeset.av_containers:
+            self.add_av_container(**item.fields)
+
+        return format_ids
+
+
+@contextmanager
+def edit_registry() -> Iterator[RegistryEditor]:
+    """Edit the registry data files in a transaction.
+
+    The data files are read once, and all changes made with the yielded
+    :class:`RegistryEditor` are written together when the ``with`` block
+    ends. If the block raises an error, nothing is written. Other
+    transactions, also in other processes, wait until the block has
+    ended::
+
+        with edit_registry() as registry:
+            format_id = registry.add_format(...)
+            registry.add_version_to_format(format_id, ...)
+
+    :returns: Context manager yielding the editor
+    """
+    with registry_lock():
+        editor = RegistryEditor()
+        try:
+            yield editor
+        except BaseException:
+            editor._rollback()  # pylint: disable=protected-access
+            raise
+        editor._commit()  # pylint: disable=protected-access
+
+
+# pylint: disable=too-many-arguments, too-many-positional-arguments
+def add_format(
+    mimetype: str,
+    content_type: ContentTypes,
+    format_name_long: str,
+    format_name_short: str,
+    typical_extensions: list[str] | None = None,
+    required_metadata: str = "",
+    charsets: bool = False,
+) -> str:
+    """Adds a new file format and writes the file formats JSON. See
+    :meth:`RegistryEditor.add_format`.
 
-    return format_id
+    :returns: The file format ID
+    """
+    with edit_registry() as registry:
+        return registry.add_format(
+            mimetype, content_type, format_name_long, format_name_short,
+            typical_extensions, required_metadata, charsets)
 
 
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-positional-arguments
-# pylint: disable=too-many-locals
 def add_version_to_format(
     format_id: str,
     grade: str,
@@ -104,170 +557,41 @@ def add_version_to_format(
     format_source_url: str = "",
     format_source_reference: str = "",
 ) -> None:
-    """Adds a new file format version to an existing file format. The
-    file format must exist, and the version cannot be a duplicate of an
-    existing version.
-
-    :param format_id: The ID of the file format as a string
-    :param grade: The file format grade in the DPS (e.g. recommended file
-        format), from a controlled vocabulary
-    :param support_in_dps_ingest: The support of the file format version in
-        the DPS ingest, as a Boolean value
-    :param active: The status of the file format in the DPS, i.e. is the
-        file format version in the latest version of the specifications,
-        as a Boolean value
-    :param version: The file format version as a string
-    :param format_registry_key: The PRONOM format registry key as a string
-    :param added_in_dps_spec: The DPS specification version, where the file
-        format version was added, from a controlled vocabulary
-    :param removed_in_dps_spec: The DPS specification version, where the file
-        format version was removed, from a controlled vocabulary
-    :param format_source_pid: The file format source ID
-    :param format_source_url: The file format source URL, requires
-        format_source_pid
-    :param format_source_reference: Bibliographic reference to the file format
-        source, requires format_source_pid
+    """Adds a new file format version to an existing file format and
+    writes the file formats JSON. See
+    :meth:`RegistryEditor.add_version_to_format`.
 
     :raises ValueError: if file format is missing, or an existing
         file format version is detected
     """
-
-    version_name = version
-    if not version:
-        version = UnknownValue.UNAP
-        version_name = UnknownValue.UNAP
-
-    if added_in_dps_spec:
-        added_in_dps_spec = DpsSpecVersions[added_in_dps_spec].value
-
-    if removed_in_dps_spec:
-        removed_in_dps_spec = DpsSpecVersions[removed_in_dps_spec].value
-
-    format_sources = []
-    if format_source_pid:
-        format_source = {
-            'pid': format_source_pid,
-            'url': format_source_url,
-            'reference': format_source_reference
-        }
-        format_sources.append(format_source)
-
-    file_formats = read_file_formats_json()
-    format_dict = None
-    for file_format in file_formats:
-        if file_format['_id'] == format_id:
-            format_dict = file_format
-
-    if not format_dict:
-        raise ValueError(f"File format {format_id} doesn't exist")
-
-    for versions_dict in format_dict.get('versions', []):
-        if version in versions_dict['version']:
-            raise ValueError(
-                f"Version {version} for file format {format_id} "
-                "already exists")
-
-    version_id = VERSION_ID.format(format_id=format_dict['_id'],
-                                   version_name=version_name)
-
-    version_dict = {
-        '_id': version_id,
-        'version': version,
-        'grade': Grades[grade].value,
-        'format_registry_key': format_registry_key,
-        'support_in_dps_ingest': support_in_dps_ingest,
-        'active': active,
-        'added_in_dps_spec': added_in_dps_spec,
-        'removed_in_dps_spec': removed_in_dps_spec,
-        'format_sources': format_sources
-    }
-    try:
-        format_dict['versions'].append(version_dict)
-    except KeyError:
-        format_dict['versions'] = [version_dict]
-
-    update_file_formats_json(file_formats=file_formats)
+    with edit_registry() as registry:
+        registry.add_version_to_format(
+            format_id, grade, support_in_dps_ingest, active, version,
+            format_registry_key, added_in_dps_spec, removed_in_dps_spec,
+            format_source_pid, format_source_url, format_source_reference)
 
 
 def replace_format(
     superseded_format: str, superseding_format: str, dps_spec_version: str
 ) -> None:
-    """Replaces a format by adding a relationship between two formats,
-    where one format supersedes another format. The superseded format
-    is deprecated, and its versions are marked no longer active and
-    unacceptable for digital preservation.
-
-    :param superseded_format: ID of the file format that is deprecated
-    :param superseding_format: ID of the file format that replaces
-        the deprecated format
-    :param dps_spec_version: The DPS specification version where the change
-        was published, from a controlled vocabulary
+    """Replaces a format and writes the file formats JSON. See
+    :meth:`RegistryEditor.replace_format`.
     """
-
-    file_formats = read_file_formats_json()
-    dps_spec = DpsSpecVersions[dps_spec_version].value
-
-    (
-        superseded_format_id,
-        superseded_format_mimetype,
-        superseding_format_id,
-        superseding_format_mimetype,
-    ) = _get_supersession_format_info(
-        superseded_format,
-        superseding_format,
-        file_formats,
-    )
-
-    relation = {
-        "_id": "",
-        "type": "",
-        "dps_spec_version": dps_spec,
-        "description": (
-            f"MIME type changed from {superseded_format_mimetype} "
-            f"to {superseding_format_mimetype}"
-        ),
-    }
-
-    for format_dict in file_formats:
-        if format_dict["_id"] == superseded_format:
-            superseded_relation = relation.copy()
-            superseded_relation["_id"] = superseding_format_id
-            superseded_relation["type"] = RelationshipTypes.SUPERSEDED
-            try:
-                format_dict["relations"].append(superseded_relation)
-            except KeyError:
-                format_dict["relations"] = [superseded_relation]
-
-            # Set all versions as inactive and unacceptable for digital
-            # preservation for the deprecated format
-            for version in format_dict["versions"]:
-                version["active"] = False
-                version["support_in_dps_ingest"] = False
-                version["grade"] = Grades["UNACCEPTABLE"].value
-                version["removed_in_dps_spec"] = dps_spec
-
-        if format_dict["_id"] == superseding_format:
-            superseding_relation = relation.copy()
-            superseding_relation["_id"] = superseded_format_id
-            superseding_relation["type"] = RelationshipTypes.SUPERSEDES
-            try:
-                format_dict["relations"].append(superseding_relation)
-            except KeyError:
-                format_dict["relations"] = [superseding_relation]
-
-    update_file_formats_json(file_formats=file_formats)
+    with edit_registry() as registry:
+        registry.replace_format(
+            superseded_format, superseding_format, dps_spec_version)
 
 
 def _get_supersession_format_info(
     superseded_format: str,
     superseding_format: str,
-    file_formats: list[dict],
+    index: _IdIndex,
 ) -> tuple[str, str, str, str]:
     """Get the IDs and MIME types for the superseded and superseding formats.
 
     :param superseded_format: ID of the deprecated format.
     :param superseding_format: ID of the superseding format.
-    :param file_formats: List of format dicts.
+    :param index: ID index of the format dicts.
     :returns: Tuple containing:
 
         - Superseded format ID.
@@ -280,13 +604,14 @@ def _get_supersession_format_info(
     superseding_format_id = ""
     superseding_format_mimetype = ""
 
-    for format_dict in file_formats:
-        if format_dict["_id"] == superseded_format:
-            superseded_format_id = format_dict["_id"]
-            superseded_format_mimetype = format_dict["mimetype"]
-        if format_dict["_id"] == superseding_format:
-            superseding_format_id = format_dict["_id"]
-            superseding_format_mimetype = format_dict["mimetype"]
+    format_dict = index.formats.get(superseded_format)
+    if format_dict is not None:
+        superseded_format_id = format_dict["_id"]
+        superseded_format_mimetype = format_dict["mimetype"]
+    format_dict = index.formats.get(superseding_format)
+    if format_dict is not None:
+        superseding_format_id = format_dict["_id"]
+        superseding_format_mimetype = format_dict["mimetype"]
 
     return (
         superseded_format_id,
@@ -300,102 +625,25 @@ def add_av_container(version_id: str,
                      grade: str,
                      video_streams: list[str] | None = None,
                      audio_streams: list[str] | None = None) -> None:
-    """Adds a new entry to the AV container grading JSON. The given
-    version_id for the container must exist, as must all given stream
-    identifiers. All IDs must be of a supported content type.
-
-    :param version_id: The ID of the container format version
-    :param grade: The file format grade in the DPS (e.g. recommended
-        file format), from a controlled vocabulary
-    :param video_streams: A list of video stream IDs (existing file
-        format versions)
-    :param audio_streams: A list of audio stream IDs (existing file
-        format versions)
+    """Adds a new entry to the AV container grading JSON and writes it.
+    See :meth:`RegistryEditor.add_av_container`.
 
     :raises ValueError: if stream ID is missing, or it is of a wrong
         content type
     """
-
-    av_containers = read_container_streams_json()
-    file_formats = read_file_formats_json()
-
-    if not video_streams:
-        video_streams = []
-
-    if not audio_streams:
-        audio_streams = []
-
-    container_types = [ContentTypes["AUDIOCONTAINER"].value,
-                       ContentTypes["VIDEOCONTAINER"].value]
-
-    mimetype = None
-    version = None
-    for file_format in file_formats:
-        if not mimetype:
-            (mimetype, version) = _parse_format_mimetype_version(
-                file_format, version_id, container_types)
-
-    if not mimetype:
-        raise ValueError(f"File format version {version_id} doesn't exist or "
-                         "is not an AV container type.")
-
-    av_video_streams = _parse_streams(file_formats=file_formats,
-                                      content_type=ContentTypes["VIDEO"].value,
-                                      streams=video_streams)
-
-    av_audio_streams = _parse_streams(file_formats=file_formats,
-                                      content_type=ContentTypes["AUDIO"].value,
-                                      streams=audio_streams)
-
-    container_dict = {
-        'version_id': version_id,
-        'mimetype': mimetype,
-        'version': version,
-        'grade': Grades[grade].value,
-        'audio_streams': av_audio_streams,
-        'video_streams': av_video_streams
-    }
-
-    av_containers.append(container_dict)
-
-    write_container_streams_json(container_streams=av_containers)
-
-
-def _parse_format_mimetype_version(
-        file_format: dict,
-        version_id: str,
-        content_types: list[str]) -> tuple[str, str] | tuple[None, None]:
-    """Parses mimetype and version for a given ID. The format must be
-    of a given content type.
-
-    :param file_format: A doctionary of file format and version data
-    :param version_id: The file format version ID
-    :param content_types: A list content types the format must be in
-
-    :returns: A tuple of (mimetype, version)
-    """
-    mimetype = None
-    version = None
-
-    for version in file_format.get('versions', []):
-        if version_id == version['_id']:
-            if file_format['content_type'] not in content_types:
-                continue
-            mimetype = file_format['mimetype']
-            version = version['version']
-            break
-
-    return (mimetype, version)
+    with edit_registry() as registry:
+        registry.add_av_container(
+            version_id, grade, video_streams, audio_streams)
 
 
-def _parse_streams(file_formats: list[dict],
+def _parse_streams(index: _IdIndex,
                    content_type: str,
                    streams: list[str]) -> list[dict]:
     """Evaluates and parses a list of stream IDs to a list of stream
     dicts if the IDs are valid. The IDs must exist as file format
     versions and adhere to the correct content type.
 
-    :param file_formats: List of format dicts
+    :param index: ID index of the format dicts
     :param content_type: The content type a stream must belong to
     :param streams: List of stream IDs
 
@@ -405,24 +653,16 @@ def _parse_streams(file_formats: list[dict],
     """
     av_streams = []
     for stream_id in streams:
-        stream_dict = {
-            'version_id': stream_id,
-            'mimetype': '',
-            'version': ''
-        }
-        stream_found = False
-        for file_format in file_formats:
-            (mimetype, version) = _parse_format_mimetype_version(
-                file_format, stream_id, [content_type])
-            if mimetype:
-                stream_found = True
-                stream_dict["mimetype"] = mimetype
-                stream_dict["version"] = version
-                av_streams.append(stream_dict)
-                break
-        if not stream_found:
+        (mimetype, version) = index.mimetype_version(stream_id,
+                                                     [content_type])
+        if not mimetype:
             raise ValueError(
                 f"Stream version {stream_id} doesn't exist or is not a "
                 f"{content_type} stream")
+        av_streams.append({
+            'version_id': stream_id,
+            'mimetype': mimetype,
+            'version': version
+        })
 
     return av_streams
@@ -11,8 +11,14 @@ setup(
     description='File formats supported by the DPS in Finland',
     packages=find_packages(exclude=['tests', 'tests.*']),
     include_package_data=True,
-    package_data={'': ['*.json']},
+    package_data={'': ['*.json', '*.marshal']},
     python_requires='>=3.9',
+    entry_points={
+        'console_scripts': [
+            'dpres-grade=dpres_file_formats.grade_manifest:main',
+            'dpres-diff=dpres_file_formats.diff:main',
+        ]
+    },
     setup_requires=['setuptools_scm'],
     use_scm_version={
         "write_to": "dpres_file_formats/_version.py"
@@ -0,0 +1,206 @@
+"""Tests for the asyncio API."""
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from dpres_file_formats import aio, graders, read_file_formats
+from dpres_file_formats.defaults import Grades
+from tests.conftest import packaged_data
+
+UNAP = "(:unap)"
+
+FILES = [
+    ("application/pdf", "A-1a", {}),
+    ("text/plain", UNAP, {0: {"mimetype": "text/plain", "version": UNAP,
+                              "charset": "UTF-8"}}),
+    ("image/png", "0.1", {}),
+    ("foo/bar", "1", {}),
+    ("video/x-matroska", "4",
+     {0: {"mimetype": "video/x-matroska", "version": "4"},
+      1: {"mimetype": "video/x-ffv", "version": "3"},
+      2: {"mimetype": "audio/flac", "version": UNAP}}),
+]
+
+
+@pytest.fixture(name="file_formats_data_fx")
+def fixture_file_formats_data():
+    """Grade with the file formats shipped with the package."""
+    return packaged_data("file_formats.json")
+
+
+@pytest.fixture(name="av_container_grading_data_fx")
+def fixture_av_container_grading_data():
+    """Grade with the AV containers shipped with the package."""
+    return packaged_data("av_container_grading.json")
+
+
+@pytest.fixture(autouse=True)
+def fixture_default_configuration():
+    """Restore the default configuration after each test."""
+    yield
+    aio.configure()
+
+
+def test_registry_loaded_off_loop(monkeypatch):
+    """Test that the registry is loaded once, in a worker thread."""
+    threads = []
+    load = aio._load
+
+    def record_load(registry):
+        threads.append(threading.current_thread())
+        load(registry)
+
+    monkeypatch.setattr(aio, "_load", record_load)
+
+    async def grade_twice():
+        return [await aio.grade(*FILES[0]), await aio.grade(*FILES[1])]
+
+    assert asyncio.run(grade_twice()) == [Grades.RECOMMENDED,
+                                          Grades.RECOMMENDED]
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 1000])
+def test_grade_many(batch_size):
+    """Test that batches are graded in the input order."""
+    aio.configure(max_workers=2, batch_size=batch_size)
+    files = FILES * 5
+
+    grades = asyncio.run(aio.grade_many(iter(files)))
+
+    assert grades == list(graders.grade_many(files))
+
+
+def test_grade_many_in_thread_pool(monkeypatch):
+    """Test that full batches are graded in the thread pool and smaller
+    inputs in the event loop.
+    """
+    aio.configure(batch_size=len(FILES))
+    threads = []
+    grade_batch = aio._grade_batch
+
+    def record_grade_batch(files, as_of=None):
+        threads.append(threading.current_thread())
+        return grade_batch(files, as_of)
+
+    monkeypatch.setattr(aio, "_grade_batch", record_grade_batch)
+
+    asyncio.run(aio.grade_many(FILES[:-1]))
+    assert threads == [threading.main_thread()]
+
+    threads.clear()
+    asyncio.run(aio.grade_many(FILES))
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+def test_file_formats():
+    """Test that file formats are returned as from the synchronous API."""
+    async def read():
+        return (await aio.file_formats(),
+                await aio.file_formats(deprecated=True, views=True),
+                await aio.file_formats(records=True))
+
+    formats, views, records = asyncio.run(read())
+
+    assert formats == read_file_formats.file_formats()
+    assert views == read_file_formats.file_formats(deprecated=True,
+                                                   views=True)
+    assert records == read_file_formats.file_formats(records=True)
+
+
+def test_grade_as_of():
+    """Test grading by the file formats of a DPS spec version."""
+    epub = ("application/epub+zip", "3", {})
+
+    async def grade():
+        return (await aio.grade(*epub, as_of="1.12.0"),
+                await aio.grade_many([epub], as_of="1.12.0"),
+                await aio.grade(*epub))
+
+    assert asyncio.run(grade()) == (
+        Grades.UNACCEPTABLE, [Grades.UNACCEPTABLE], Grades.RECOMMENDED)
+
+
+def test_file_formats_in_thread_pool(monkeypatch):
+    """Test that only views already built are returned in the event loop
+    and everything else is read in the thread pool.
+    """
+    calls = []
+    run = aio._run
+
+    async def record_run(func, *args, **kwargs):
+        calls.append(func)
+        return await run(func, *args, **kwargs)
+
+    monkeypatch.setattr(aio, "_run", record_run)
+
+    async def read(**kwargs):
+        await aio.load_registry()
+        calls.clear()
+        return await aio.file_formats(**kwargs)
+
+    views = asyncio.run(read(views=True))
+    assert calls == []
+    assert views == read_file_formats.file_formats(views=True)
+
+    data = {"file_formats": read_file_formats.file_formats()}
+    for kwargs in ({}, {"records": True}, {"views": True, "data": data}):
+        asyncio.run(read(**kwargs))
+        assert calls == [read_file_formats.file_formats]
+
+    # The views of a spec version are built when its registry is loaded
+    calls.clear()
+    asyncio.run(aio.file_formats(views=True, as_of="V14"))
+    assert calls == [aio._load_once]
+
+
+def test_registry_reloaded_off_loop(monkeypatch, file_formats_path_fx):
+    """Test that the registry is loaded again in a worker thread after
+    another process has changed the data file.
+    """
+    asyncio.run(aio.load_registry())
+    assert asyncio.run(aio.grade("image/png", "0.1", {})) \
+        == Grades.UNACCEPTABLE
+
+    data = packaged_data("file_formats.json")
+    data["file_formats"].append({
+        **data["file_formats"][0],
+        "_id": "fi-dpres-test-png",
+        "mimetype": "image/png",
+        "versions": [{
+            **data["file_formats"][0]["versions"][0],
+            "_id": "fi-dpres-test-png-0.1",
+            "version": "0.1",
+        }],
+    })
+    file_formats_path_fx.write_text(json.dumps(data), encoding="UTF-8")
+    os.utime(file_formats_path_fx, ns=(0, 0))
+
+    threads = []
+    load = aio._load
+
+    def record_load(registry):
+        threads.append(threading.current_thread())
+        load(registry)
+
+    monkeypatch.setattr(aio, "_load", record_load)
+
+    grade = asyncio.run(aio.grade("image/png", "0.1", {}))
+    assert grade == data["file_formats"][0]["versions"][0]["grade"]
+    assert len(threads) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+@pytest.mark.parametrize("arguments", [
+    {"max_workers": 0},
+    {"batch_size": 0},
+])
+def test_configure_invalid(arguments):
+    """Test that the limits must be positive."""
+    with pytest.raises(ValueError):
+        aio.configure(**arguments)
@@ -0,0 +1,215 @@
+"""Unit tests for the changeset module."""
+
+import json
+
+import pytest
+from dpres_file_formats import import_changeset, json_handler
+from dpres_file_formats.changeset import (
+    ChangesetError,
+    parse_csv_changeset,
+    parse_json_changeset
+)
+
+CHANGESET = {
+    "formats": [
+        {"mimetype": "yyy/zzz", "content_type": "VIDEO",
+         "format_name_long": "Test file format", "format_name_short": "ABC",
+         "typical_extensions": [".yz"]},
+    ],
+    "versions": [
+        {"format_id": "FI_DPRES_ABC_3", "version": "1", "grade": "ACCEPTABLE",
+         "support_in_dps_ingest": True, "active": True,
+         "added_in_dps_spec": "V14"},
+        {"format_id": "TEST_MIMETYPE_1", "version": "4",
+         "grade": "RECOMMENDED", "support_in_dps_ingest": True,
+         "active": True},
+    ],
+    "supersessions": [
+        {"superseded_format": "TEST_MIMETYPE_4",
+         "superseding_format": "FI_DPRES_ABC_3", "dps_spec_version": "V14"},
+    ],
+    "av_containers": [
+        {"version_id": "TEST_MIMETYPE_3_1", "grade": "RECOMMENDED",
+         "video_streams": ["FI_DPRES_ABC_3_1"],
+         "audio_streams": ["TEST_MIMETYPE_1_4"]},
+    ],
+}
+
+CSV_CHANGESET = """\
+record,format_id,mimetype,content_type,format_name_long,format_name_short,\
+typical_extensions,version,grade,support_in_dps_ingest,active,\
+added_in_dps_spec,superseded_format,superseding_format,dps_spec_version,\
+version_id,video_streams,audio_streams
+av_container,,,,,,,,RECOMMENDED,,,,,,,TEST_MIMETYPE_3_1,FI_DPRES_ABC_3_1,\
+TEST_MIMETYPE_1_4
+format,,yyy/zzz,VIDEO,Test file format,ABC,.yz,,,,,,,,,,,
+version,FI_DPRES_ABC_3,,,,,,1,ACCEPTABLE,true,true,V14,,,,,,
+version,TEST_MIMETYPE_1,,,,,,4,RECOMMENDED,TRUE,True,,,,,,,
+supersession,,,,,,,,,,,,TEST_MIMETYPE_4,FI_DPRES_ABC_3,V14,,,
+"""
+
+
+def _read(path):
+    """Return the list of a data file."""
+    return json.loads(path.read_text(encoding="utf-8"))["file_formats"]
+
+
+def _by_id(items, key="_id"):
+    """Return the items by their ID."""
+    return {item[key]: item for item in items}
+
+
+@pytest.mark.parametrize("suffix", [".json", ".csv"])
+def test_import_changeset(suffix, tmp_path, file_formats_path_fx,
+                          av_container_grading_path_fx, monkeypatch):
+    """Test that a JSON or CSV changeset is applied with one write of each
+    data file, and that later items can refer to the new formats and
+    versions.
+    """
+    changeset_path = tmp_path / f"changeset{suffix}"
+    changeset_path.write_text(
+        json.dumps(CHANGESET) if suffix == ".json" else CSV_CHANGESET,
+        encoding="utf-8")
+    writes = []
+    write = json_handler._write
+    monkeypatch.setattr(json_handler, "_write",
+                        lambda path, data: writes.append(path)
+                        or write(path, data))
+
+    assert import_changeset(changeset_path) == ["FI_DPRES_ABC_3"]
+
+    assert sorted(writes) == sorted([file_formats_path_fx,
+                                     av_container_grading_path_fx])
+    file_formats = _by_id(_read(file_formats_path_fx))
+    new_format = file_formats["FI_DPRES_ABC_3"]
+    assert new_format["typical_extensions"] == [".yz"]
+    assert new_format["versions"][0]["_id"] == "FI_DPRES_ABC_3_1"
+    assert new_format["versions"][0]["added_in_dps_spec"] == "1.14.0"
+    assert new_format["relations"][0]["_id"] == "TEST_MIMETYPE_4"
+    assert file_formats["TEST_MIMETYPE_1"]["versions"][-1]["_id"] \
+        == "TEST_MIMETYPE_1_4"
+    assert file_formats["TEST_MIMETYPE_4"]["relations"][0]["type"] \
+        == "is superseded by"
+
+    container = _by_id(_read(av_container_grading_path_fx),
+                       "version_id")["TEST_MIMETYPE_3_1"]
+    assert container["video_streams"][-1]["mimetype"] == "yyy/zzz"
+    assert container["audio_streams"][-1]["version"] == "4"
+
+
+@pytest.mark.parametrize(
+    ("changeset", "errors"),
+    [
+        ({"formats": [{**CHANGESET["formats"][0], "content_type": ""}]},
+         ["formats[0]: missing field 'content_type'"]),
+        ({"versions": [{**CHANGESET["versions"][1], "grade": ""}]},
+         ["versions[0]: missing field 'grade'"]),
+        ({"versions": [{**CHANGESET["versions"][1], "format_id": "",
+                        "added_in_dps_spec": ""}]},
+         ["versions[0]: missing field 'format_id'"]),
+    ],
+    ids=("Empty content type", "Empty grade", "Empty format ID")
+)
+def test_import_changeset_empty_fields(changeset, errors,
+                                       file_formats_path_fx):
+    """Test that empty required fields are reported as missing, and that
+    nothing is written.
+    """
+    content = file_formats_path_fx.read_bytes()
+    with pytest.raises(ChangesetError) as error:
+        import_changeset(parse_json_changeset(json.dumps(changeset)))
+    assert error.value.errors == errors
+    assert file_formats_path_fx.read_bytes() == content
+
+
+def test_import_changeset_errors(file_formats_path_fx,
+                                 av_container_grading_path_fx):
+    """Test that all errors of a changeset are reported, and that nothing
+    is written.
+    """
+    contents = (file_formats_path_fx.read_bytes(),
+                av_container_grading_path_fx.read_bytes())
+    changeset = parse_json_changeset(json.dumps({
+        "formats": [
+            {"mimetype": "yyy/zzz", "content_type": "MOVIE",
+             "format_name_long": "Test file format",
+             "format_name_short": "XYZ", "charsets": "yes"},
+        ],
+        "versions": [
+            {"format_id": "FI_DPRES_XYZ_2", "grade": "ACCEPTABLE",
+             "support_in_dps_ingest": True, "active": True},
+            {"format_id": "TEST_MIMETYPE_1", "version": "2",
+             "grade": "ACCEPTABLE", "support_in_dps_ingest": True,
+             "active": True},
+            {"format_id": "TEST_MIMETYPE_1", "version": "5",
+             "grade": "GOOD", "support_in_dps_ingest": True},
+        ],
+        "supersessions": [
+            {"superseded_format": "TEST_MIMETYPE_1",
+             "superseding_format": "unknown", "dps_spec_version": "V14",
+             "description": "Unknown field"},
+        ],
+        "av_containers": [
+            {"version_id": "TEST_MIMETYPE_1_1", "grade": "RECOMMENDED",
+             "video_streams": ["TEST_MIMETYPE_1_2"]},
+        ],
+    }))
+
+    with pytest.raises(ChangesetError) as error:
+        import_changeset(changeset)
+
+    assert error.value.errors == [
+        "formats[0]: content_type 'MOVIE' is not one of TEXT, AUDIO, VIDEO, "
+        "IMAGE, WARC, GEOSPATIAL, DATABASE, RESEARCH, SCIENTIFIC, "
+        "AUDIOCONTAINER, VIDEOCONTAINER",
+        "formats[0]: charsets is not of type bool",
+        "versions[0]: file format FI_DPRES_XYZ_2 doesn't exist",
+        "versions[1]: version 2 for file format TEST_MIMETYPE_1 already "
+        "exists",
+        "versions[2]: grade 'GOOD' is not one of RECOMMENDED, ACCEPTABLE, "
+        "WITH_RECOMMENDED, BIT_LEVEL, UNACCEPTABLE",
+        "versions[2]: missing field 'active'",
+        "supersessions[0]: unknown field 'description'",
+        "av_containers[0]: file format version TEST_MIMETYPE_1_1 doesn't "
+        "exist or is not an AV container type",
+        "av_containers[0]: stream version TEST_MIMETYPE_1_2 doesn't exist "
+        "or is not a video stream",
+    ]
+    assert (file_formats_path_fx.read_bytes(),
+            av_container_grading_path_fx.read_bytes()) == contents
+
+
+@pytest.mark.parametrize(
+    ("content", "errors"),
+    [
+        ("record,active\nformat,\nsupport,true\nversion,yes\n",
+         ["line 3: unknown record 'support'",
+          "line 4: active is not true or false"]),
+        ("mimetype\nyyy/zzz\n", ["line 2: unknown record None"]),
+    ],
+    ids=("Unknown record and invalid Boolean", "No record column")
+)
+def test_parse_csv_changeset_errors(content, errors):
+    """Test that all parse errors of a CSV changeset are reported."""
+    with pytest.raises(ChangesetError) as error:
+        parse_csv_changeset(content.splitlines(keepends=True))
+    assert error.value.errors == errors
+
+
+@pytest.mark.parametrize(
+    ("content", "errors"),
+    [
+        ("[]", ["Changeset is not a JSON object"]),
+        ("{", ["Invalid JSON: Expecting property name enclosed in double "
+               "quotes: line 1 column 2 (char 1)"]),
+        ('{"format": [], "versions": {}, "supersessions": [1]}',
+         ["Unknown section 'format'", "versions: not a list",
+          "supersessions[0]: not an object"]),
+    ],
+    ids=("Not an object", "Invalid JSON", "Invalid sections")
+)
+def test_parse_json_changeset_errors(content, errors):
+    """Test that all parse errors of a JSON changeset are reported."""
+    with pytest.raises(ChangesetError) as error:
+        parse_json_changeset(content)
+    assert error.value.errors == errors
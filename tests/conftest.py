@@ -1,9 +1,12 @@
 """Configure py.test default values and functionality"""
 import contextlib
 import json
+from importlib.resources import files
 
 import pytest
 
+from dpres_file_formats.registry import REGISTRY
+
 
 @pytest.fixture(scope='function')
 def file_formats_path_fx(tmp_path):
@@ -17,13 +20,16 @@ def av_container_grading_path_fx(tmp_path):
     return tmp_path / "av_container_grading.json"
 
 
-# pylint: disable=redefined-outer-name
-@pytest.fixture(scope='function', autouse=True)
-def file_format_json_mock(
-        file_formats_path_fx, av_container_grading_path_fx, monkeypatch):
-    """Fixture to use test data for file formats JSON."""
+def packaged_data(resource_name):
+    """Return the contents of a JSON data file shipped with the package."""
+    data_file = files("dpres_file_formats.data") / resource_name
+    return json.loads(data_file.read_text(encoding="UTF-8"))
 
-    data = {
+
+@pytest.fixture(scope='function')
+def file_formats_data_fx():
+    """Fixture to return test data for file formats JSON."""
+    return {
         "file_formats": [
             {
                 "_id": "TEST_MIMETYPE_1",
@@ -122,10 +128,24 @@ def file_format_json_mock(
         ]
     }
 
+
+@pytest.fixture(scope='function')
+def av_container_grading_data_fx():
+    """Fixture to return test data for AV container grading JSON."""
+    return {"file_formats": []}
+
+
+# pylint: disable=redefined-outer-name
+@pytest.fixture(scope='function', autouse=True)
+def file_format_json_mock(
+        file_formats_path_fx, av_container_grading_path_fx,
+        file_formats_data_fx, av_container_grading_data_fx, monkeypatch):
+    """Fixture to use test data for file formats JSON."""
+
     with open(file_formats_path_fx, "w", encoding="UTF-8") as outfile:
-        json.dump(data, outfile)
+        json.dump(file_formats_data_fx, outfile)
     with open(av_container_grading_path_fx, "w", encoding="UTF-8") as outfile:
-        json.dump({"file_formats": []}, outfile)
+        json.dump(av_container_grading_data_fx, outfile)
 
     @contextlib.contextmanager
     def mock_resource_path(module, resource_name):
@@ -147,3 +167,12 @@ def file_format_json_mock(
         dpres_file_formats.json_handler,
         'resource_path',
         mock_resource_path)
+    monkeypatch.setattr(
+        dpres_file_formats.json_handler,
+        '_shared_files',
+        {})
+
+    # Data loaded by earlier tests must not be used by the graders
+    REGISTRY.reset()
+    yield
+    REGISTRY.reset()
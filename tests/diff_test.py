@@ -0,0 +1,164 @@
+"""Tests for the diff module."""
+import copy
+import json
+
+import pytest
+
+from dpres_file_formats import json_handler
+from dpres_file_formats.defaults import Grades, UnknownValue
+from dpres_file_formats.diff import (
+    diff_files,
+    diff_registries,
+    diff_specs,
+    main,
+)
+from dpres_file_formats.json_handler import read_file_formats_json
+
+SUPERSESSION = {"_id": "TEST_MIMETYPE_4", "type": "is superseded by",
+                "dps_spec_version": "1.12.0", "description": "Renamed"}
+
+CONTAINER = {
+    "version_id": "TEST_MIMETYPE_3_1", "mimetype": "fff/ggg", "version": "1",
+    "grade": Grades.RECOMMENDED.value,
+    "video_streams": [{"version_id": "TEST_MIMETYPE_4_1",
+                       "mimetype": "aaa/bbb", "version": "5"}],
+    "audio_streams": [{"version_id": "TEST_MIMETYPE_1_2",
+                       "mimetype": "aaa/bbb", "version": "2"}],
+}
+
+
+def _by_id(file_formats):
+    """Return the file formats and versions by their IDs."""
+    items = {}
+    for file_format in file_formats:
+        items[file_format["_id"]] = file_format
+        for version in file_format["versions"]:
+            items[version["_id"]] = version
+    return items
+
+
+def _edit(file_formats):
+    """Return an edited copy of the file formats."""
+    file_formats = copy.deepcopy(file_formats)
+    items = _by_id(file_formats)
+    items["TEST_MIMETYPE_1_2"]["grade"] = Grades.ACCEPTABLE.value
+    items["TEST_MIMETYPE_1_3"]["active"] = False
+    items["TEST_MIMETYPE_1"]["relations"].append(SUPERSESSION)
+    items["TEST_MIMETYPE_2"]["versions"].append(
+        {**items["TEST_MIMETYPE_2_1"], "_id": "TEST_MIMETYPE_2_2",
+         "version": "2"})
+    file_formats.remove(items["TEST_MIMETYPE_3"])
+    # Reordering does not make a difference
+    file_formats.reverse()
+    return file_formats
+
+
+def test_diff_registries():
+    """Test that added, removed, regraded and changed file formats,
+    versions, supersessions and AV container streams are found.
+    """
+    old_formats = read_file_formats_json()
+    old_containers = [CONTAINER]
+    new_containers = [
+        {**CONTAINER, "grade": Grades.ACCEPTABLE.value},
+        {**CONTAINER, "audio_streams": []},
+    ]
+
+    diff = diff_registries(old_formats, _edit(old_formats),
+                           old_containers, new_containers)
+
+    assert diff.formats.added == []
+    assert diff.formats.removed == [
+        {"_id": "TEST_MIMETYPE_3", "mimetype": "fff/ggg",
+         "format_name_short": "GHI"}]
+    assert [version["_id"] for version in diff.versions.added] \
+        == ["TEST_MIMETYPE_2_2"]
+    assert [version["_id"] for version in diff.versions.removed] \
+        == ["TEST_MIMETYPE_3_1"]
+    assert diff.versions.regraded == [
+        {"_id": "TEST_MIMETYPE_1_2", "format_id": "TEST_MIMETYPE_1",
+         "mimetype": "aaa/bbb", "version": "2",
+         "old_grade": Grades.RECOMMENDED.value,
+         "new_grade": Grades.ACCEPTABLE.value}]
+    assert diff.versions.changed == [
+        {"_id": "TEST_MIMETYPE_1_3",
+         "fields": {"active": {"old": True, "new": False}}}]
+    assert diff.supersessions.added == [
+        {"superseded_format": "TEST_MIMETYPE_1",
+         "superseding_format": "TEST_MIMETYPE_4",
+         "dps_spec_version": "1.12.0", "description": "Renamed"}]
+    assert diff.av_containers.added == []
+    assert diff.av_containers.removed == []
+    assert [(item["stream_version_id"], item["old_grade"],
+             item["new_grade"]) for item in diff.av_containers.regraded] \
+        == [("TEST_MIMETYPE_1_2", Grades.RECOMMENDED.value,
+             Grades.ACCEPTABLE.value)]
+    assert diff
+    assert not diff_registries(old_formats, reversed(old_formats),
+                               old_containers, old_containers)
+
+
+def test_diff_specs():
+    """Test that the file formats of two DPS spec versions are compared,
+    including supersessions of file formats without active versions.
+    """
+    file_formats = read_file_formats_json()
+    items = _by_id(file_formats)
+    items["TEST_MIMETYPE_1_1"].update(
+        added_in_dps_spec="1.3.0", removed_in_dps_spec="1.12.0")
+    items["TEST_MIMETYPE_1_2"]["added_in_dps_spec"] = "1.12.0"
+    items["TEST_MIMETYPE_3"]["relations"].append(SUPERSESSION)
+    json_handler.update_file_formats_json(file_formats=file_formats)
+
+    diff = diff_specs("1.11.0", "V12")
+
+    assert [version["_id"] for version in diff.versions.added] \
+        == ["TEST_MIMETYPE_1_2"]
+    assert [version["_id"] for version in diff.versions.removed] \
+        == ["TEST_MIMETYPE_1_1"]
+    # The grade of a removed version in earlier spec versions is unknown
+    assert diff.versions.removed[0]["grade"] == UnknownValue.UNAV
+    assert [(item["superseded_format"], item["superseding_format"])
+            for item in diff.supersessions.added] \
+        == [("TEST_MIMETYPE_3", "TEST_MIMETYPE_4")]
+    assert not diff.formats
+    assert diff.versions.regraded is None
+    assert "regraded" not in diff.to_dict()["versions"]
+    assert not diff_specs("1.12.0", "1.14.0")
+
+    with pytest.raises(ValueError):
+        diff_specs("1.11.0", "1.2.0")
+
+
+def test_main(tmp_path, file_formats_path_fx, capsys):
+    """Test the dpres-diff command with files and spec versions."""
+    old_path = tmp_path / "old.json"
+    old_path.write_bytes(file_formats_path_fx.read_bytes())
+    json_handler.update_file_formats_json(
+        file_formats=_edit(read_file_formats_json()))
+    new_path = tmp_path / "new.json"
+    new_path.write_bytes(file_formats_path_fx.read_bytes())
+
+    assert main([str(new_path), str(new_path)]) == 0
+    assert capsys.readouterr().out == ""
+
+    assert main([str(old_path), str(new_path), "--json"]) == 1
+    assert json.loads(capsys.readouterr().out) \
+        == diff_files(old_path, new_path).to_dict()
+
+    output_path = tmp_path / "diff.txt"
+    assert main([str(old_path), str(new_path), "-o", str(output_path)]) == 1
+    lines = output_path.read_text(encoding="utf-8").splitlines()
+    assert "formats removed: TEST_MIMETYPE_3 (fff/ggg)" in lines
+    assert ("versions regraded: TEST_MIMETYPE_1_2 (aaa/bbb 2): "
+            f"{Grades.RECOMMENDED.value} -> {Grades.ACCEPTABLE.value}") \
+        in lines
+    assert ("supersessions added: TEST_MIMETYPE_1 is superseded by "
+            "TEST_MIMETYPE_4 in 1.12.0") in lines
+
+    assert main(["1.12.0", "V14"]) == 0
+    assert main([str(tmp_path / "missing.json"), str(new_path)]) == 2
+    assert "missing.json" in capsys.readouterr().err
+
+    with pytest.raises(SystemExit):
+        main(["1.11.0", str(new_path)])
@@ -0,0 +1,188 @@
+"""Tests for the dpres-grade command."""
+import io
+import json
+
+import pytest
+
+from dpres_file_formats.defaults import Grades, UnknownValue
+from dpres_file_formats.grade_manifest import (
+    ManifestError,
+    grade_lines,
+    main,
+    parse_record,
+)
+from dpres_file_formats.graders import grade
+from tests.conftest import packaged_data
+
+UNAP = "(:unap)"
+
+RECORDS = [
+    {"id": "pdf", "mimetype": "application/pdf", "version": "A-1a",
+     "streams": {"0": {"mimetype": "application/pdf", "version": "A-1a"}}},
+    {"id": "text", "mimetype": "text/plain", "version": UNAP,
+     "streams": [{"mimetype": "text/plain", "version": UNAP,
+                  "charset": "UTF-8"}]},
+    {"id": "two streams", "mimetype": "image/png", "version": "1.2",
+     "streams": {"0": {"mimetype": "image/png", "version": "1.2"},
+                 "1": {"mimetype": "image/png", "version": "1.2"}}},
+    {"id": "unknown", "mimetype": "foo/bar", "version": "1"},
+    {"mimetype": UnknownValue.UNAV, "version": UNAP, "streams": {}},
+]
+
+EXPECTED = [
+    {"id": "pdf", "grade": Grades.RECOMMENDED},
+    {"id": "text", "grade": Grades.RECOMMENDED},
+    {"id": "two streams", "grade": Grades.UNACCEPTABLE},
+    {"id": "unknown", "grade": Grades.UNACCEPTABLE},
+    {"grade": UnknownValue.UNAV},
+]
+
+
+@pytest.fixture(name="file_formats_data_fx")
+def fixture_file_formats_data():
+    """Grade with the file formats shipped with the package."""
+    return packaged_data("file_formats.json")
+
+
+@pytest.fixture(name="av_container_grading_data_fx")
+def fixture_av_container_grading_data():
+    """Grade with the AV containers shipped with the package."""
+    return packaged_data("av_container_grading.json")
+
+
+def _manifest(records):
+    return [json.dumps(record) + "\n" for record in records]
+
+
+def test_parse_record():
+    """Test that stream indexes are converted to integers and other keys
+    are returned separately.
+    """
+    file, other = parse_record(json.dumps(RECORDS[0]))
+    assert file == ("application/pdf", "A-1a",
+                    {0: {"mimetype": "application/pdf",
+                         "version": "A-1a"}})
+    assert other == {"id": "pdf"}
+
+    assert parse_record(json.dumps(RECORDS[1]))[0][2] == {
+        0: {"mimetype": "text/plain", "version": UNAP, "charset": "UTF-8"}}
+
+
+@pytest.mark.parametrize("line", [
+    "{",
+    "[]",
+    '{"mimetype": "text/plain", "streams": "foo"}',
+    '{"mimetype": "text/plain", "streams": {"a": {}}}',
+    '{"mimetype": 5, "version": "1"}',
+    '{"version": "1"}',
+    '{"mimetype": "text/plain", "version": ["1"]}',
+    '{"mimetype": "text/plain", "version": "1", "streams": {"0": "x"}}',
+    '{"mimetype": "text/plain", "version": "1", "streams": [null]}',
+    '{"mimetype": "text/plain", "version": "1", '
+    '"streams": [{"mimetype": 5}]}',
+])
+def test_parse_invalid_record(line):
+    """Test that invalid records are rejected."""
+    with pytest.raises(ManifestError):
+        parse_record(line)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_grade_lines(processes, chunk_size):
+    """Test that the grades are returned in the input order, with and
+    without a process pool.
+    """
+    lines = _manifest(RECORDS * 3)
+    lines.insert(2, "\n")
+
+    output = list(grade_lines(lines, processes=processes,
+                              chunk_size=chunk_size))
+
+    assert [json.loads(line.output) for line in output] == EXPECTED * 3
+    assert all(line.error is None for line in output)
+
+
+def test_grade_lines_match_grade():
+    """Test that the grades equal the grades from grade()."""
+    output = grade_lines(_manifest(RECORDS))
+    for record, line in zip(RECORDS, output):
+        file, _ = parse_record(json.dumps(record))
+        assert json.loads(line.output)["grade"] == grade(*file)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_grade_lines_errors(processes, chunk_size):
+    """Test that invalid lines and records which can not be graded, such
+    as a container without the container stream, are reported with their
+    line numbers and the other lines are still graded.
+    """
+    container = {"id": "mkv", "mimetype": "video/x-matroska",
+                 "version": "4"}
+    lines = (_manifest(RECORDS[:3]) + ["{\n"] + _manifest([container])
+             + _manifest(RECORDS[3:]))
+
+    output = list(grade_lines(lines, processes=processes,
+                              chunk_size=chunk_size))
+
+    records = [json.loads(line.output) for line in output]
+    assert records[:3] + records[5:] == EXPECTED
+    assert records[3]["line"] == 4
+    assert records[3]["error"].startswith("Invalid JSON")
+    assert records[4]["id"] == "mkv"
+    assert records[4]["line"] == 5
+    assert records[4]["error"].startswith("Grading failed")
+    assert "grade" not in records[4]
+    assert [line.error is not None for line in output] == \
+        [False] * 3 + [True] * 2 + [False] * 2
+    assert output[4].error.startswith("Line 5: Grading failed")
+
+
+def test_main_files(tmp_path):
+    """Test grading a manifest file to an output file."""
+    manifest = tmp_path / "manifest.jsonl"
+    output = tmp_path / "grades.jsonl"
+    manifest.write_text("".join(_manifest(RECORDS)), encoding="utf-8")
+
+    assert main([str(manifest), "-o", str(output), "-p", "2"]) == 0
+
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == EXPECTED
+
+
+def test_main_stdin(monkeypatch, capsys):
+    """Test grading a manifest from standard input to standard output."""
+    monkeypatch.setattr("sys.stdin", io.StringIO("".join(_manifest(RECORDS))))
+
+    assert main([]) == 0
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == EXPECTED
+
+
+def test_main_invalid_manifest(monkeypatch, capsys):
+    """Test that invalid lines are reported with exit status 1 after the
+    valid lines have been graded.
+    """
+    monkeypatch.setattr("sys.stdin",
+                        io.StringIO("[]\n" + "".join(_manifest(RECORDS))))
+
+    assert main([]) == 1
+    captured = capsys.readouterr()
+    assert "Line 1: Record is not a JSON object" in captured.err
+    lines = captured.out.splitlines()
+    assert json.loads(lines[0]) == {"line": 1,
+                                    "error": "Record is not a JSON object"}
+    assert [json.loads(line) for line in lines[1:]] == EXPECTED
+
+
+def test_main_missing_manifest(tmp_path, capsys):
+    """Test that a missing manifest is reported as a usage error."""
+    with pytest.raises(SystemExit) as error:
+        main([str(tmp_path / "missing.jsonl")])
+
+    assert error.value.code == 2
+    err = capsys.readouterr().err
+    assert "can not read" in err
+    assert "Traceback" not in err
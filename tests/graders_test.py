@@ -3,14 +3,48 @@ from collections import namedtuple
 
 import pytest
 
-from dpres_file_formats.defaults import Grades
+from dpres_file_formats.defaults import Grades, UnknownValue
+from dpres_file_formats import graders
 from dpres_file_formats.graders import MIMEGrader, TextGrader, \
-    ContainerStreamsGrader
-from dpres_file_formats import grade
+    ContainerStreamsGrader, FormatIndex, BaseGrader, \
+    NotContainerStreamsGrader
+from dpres_file_formats import (
+    add_format,
+    add_version_to_format,
+    grade,
+    grade_by_puid,
+    grade_many,
+    grade_many_by_puid
+)
+from dpres_file_formats.graders import (
+    GradeCache,
+    disable_grade_cache,
+    dispatch_table,
+    enable_grade_cache,
+    grade_cache_info,
+    grade_signature,
+    puid_versions,
+    register_grader,
+    _container_stream_grades,
+)
+from dpres_file_formats.registry import REGISTRY
+from tests.conftest import packaged_data
 
 FakeScraper = namedtuple("FakeScraper", ["mimetype", "version", "streams"])
 
 
+@pytest.fixture(scope='function')
+def file_formats_data_fx():
+    """Grade against a copy of the packaged file formats data."""
+    return packaged_data("file_formats.json")
+
+
+@pytest.fixture(scope='function')
+def av_container_grading_data_fx():
+    """Grade against a copy of the packaged AV container grading data."""
+    return packaged_data("av_container_grading.json")
+
+
 @pytest.mark.parametrize(
     ('scraper', 'expected_grade'),
     [
@@ -109,7 +143,7 @@ def test_container_streams_grader(scraper, expected_grade):
     assert grader.grade() == expected_grade
 
 
-@pytest.mark.parametrize("mimetype, version, streams, expected", [
+GRADE_CASES = [
     ("non/existent", "1.0", {}, Grades.UNACCEPTABLE),
     ("text/csv", "(:unap)", {0: {"charset": "UTF-8"}}, Grades.RECOMMENDED),
     ("audio/mpeg", "2", {}, Grades.ACCEPTABLE),
@@ -141,6 +175,418 @@ def test_container_streams_grader(scraper, expected_grade):
          1: {"mimetype": "audio/mpeg", "version": "(:unap)"},
          2: {"mimetype": "image/jpeg", "version": "(:unap)"}
      }, Grades.UNACCEPTABLE)
-])
+]
+
+
+@pytest.mark.parametrize("mimetype, version, streams, expected", GRADE_CASES)
 def test_grade_function(mimetype, version, streams, expected):
     assert grade(mimetype, version, streams) == expected
+
+
+def test_grade_many():
+    """Test that grade_many grades files in the given order, also when
+    the same files are repeated.
+    """
+    files = [case[:3] for case in GRADE_CASES] * 2 + [("", "1", {})]
+    expected = [case[3] for case in GRADE_CASES] * 2 + ["(:unav)"]
+
+    assert list(grade_many(iter(files))) == expected
+
+
+def test_grade_many_cache(monkeypatch):
+    """Test that grade_many reuses a bounded number of grades, and grades
+    again after a grader is registered between the files.
+    """
+    monkeypatch.setattr(graders, "GRADERS", list(graders.GRADERS))
+    monkeypatch.setattr(graders, "GRADE_MANY_CACHE_SIZE", 1)
+    graded = []
+    grade_files = graders._grade
+
+    def record_grade(mimetype, *args):
+        graded.append(mimetype)
+        return grade_files(mimetype, *args)
+
+    monkeypatch.setattr(graders, "_grade", record_grade)
+    tiff = ("image/tiff", "6.0", {})
+    png = ("image/png", "1.2", {})
+
+    assert list(grade_many([tiff, tiff, png, tiff])) == \
+        [Grades.RECOMMENDED] * 4
+    assert graded == ["image/tiff", "image/png", "image/tiff"]
+
+    grades = grade_many([tiff, tiff])
+    assert next(grades) == Grades.RECOMMENDED
+
+    @register_grader
+    class TiffGrader(BaseGrader):  # pylint: disable=unused-variable
+        """Grader rejecting all TIFF files."""
+
+        @classmethod
+        def is_supported(cls, mimetype):
+            return mimetype.lower() == "image/tiff"
+
+        @classmethod
+        def supported_mimetypes(cls):
+            return ["image/tiff"]
+
+        def grade(self):
+            return Grades.UNACCEPTABLE
+
+    assert next(grades) == Grades.UNACCEPTABLE
+
+
+PUID_CASES = [
+    ("fmt/199", None, Grades.RECOMMENDED),
+    (" fmt/199 ", None, Grades.RECOMMENDED),
+    ("fmt/199",
+     {
+         0: {"mimetype": "video/mp4", "version": "(:unap)"},
+         1: {"mimetype": "video/h264", "version": "(:unap)"},
+         2: {"mimetype": "audio/aac", "version": "(:unap)"}
+     },
+     Grades.RECOMMENDED),
+    ("fmt/199",
+     {
+         0: {"mimetype": "video/mp4", "version": "(:unap)"},
+         1: {"mimetype": "video/x.fi-dpres.prores", "version": "(:unap)"}
+     },
+     Grades.UNACCEPTABLE),
+    ("fmt/199", {0: {"mimetype": "audio/mpeg", "version": "(:unap)"}},
+     Grades.UNACCEPTABLE),
+    ("x-fmt/111", None, Grades.UNACCEPTABLE),
+    ("x-fmt/111",
+     {0: {"mimetype": "text/plain", "version": "(:unap)",
+          "charset": "UTF-8"}},
+     Grades.RECOMMENDED),
+    ("fmt/289", None, Grades.UNACCEPTABLE),
+    ("fmt/0", None, Grades.UNACCEPTABLE),
+]
+
+
+@pytest.mark.parametrize("puid, streams, expected", PUID_CASES)
+def test_grade_by_puid(puid, streams, expected):
+    """Test grading files by their PRONOM PUIDs, with and without
+    streams.
+    """
+    assert grade_by_puid(puid, streams) == expected
+
+
+def test_grade_text_by_puid_without_charset():
+    """Test that a file of a text format identified by its PUID is
+    unacceptable without a charset, also when the format is acceptable
+    with one.
+    """
+    text = {0: {"mimetype": "text/plain", "version": "(:unap)",
+                "charset": "UTF-8"}}
+    assert all(version.charsets for version in puid_versions("x-fmt/111"))
+    assert grade_by_puid("x-fmt/111") == Grades.UNACCEPTABLE
+    assert grade_by_puid("x-fmt/111", text) == Grades.RECOMMENDED
+    assert list(grade_many_by_puid(["x-fmt/111", ("x-fmt/111", text)])) \
+        == [Grades.UNACCEPTABLE, Grades.RECOMMENDED]
+
+
+def test_grade_many_by_puid():
+    """Test that grade_many_by_puid accepts PUIDs and (puid, streams)
+    tuples, and grades them in the given order.
+    """
+    files = [case[:2] for case in PUID_CASES] + ["fmt/199", "fmt/0"]
+    expected = [case[2] for case in PUID_CASES] + [Grades.RECOMMENDED,
+                                                   Grades.UNACCEPTABLE]
+
+    assert list(grade_many_by_puid(iter(files))) == expected
+
+
+def test_puid_versions():
+    """Test that the versions of a PUID are narrowed down by the
+    container stream and to the active versions, and that a file is
+    graded by the weakest grade of the versions.
+    """
+    assert [version.id for version in puid_versions("fmt/199")] == [
+        "FI_DPRES_AAC_1_UNAP", "FI_DPRES_AVC_1_UNAP",
+        "FI_DPRES_MPEG-4_1_UNAP", "FI_DPRES_MPEG-4_2_UNAP"]
+    assert [version.id for version in puid_versions(
+        "fmt/199", {0: {"mimetype": "AUDIO/MP4", "version": "(:unap)"}})
+    ] == ["FI_DPRES_MPEG-4_2_UNAP"]
+    assert len(puid_versions("fmt/289")) == 3
+    assert puid_versions("fmt/0") == ()
+
+    add_version_to_format(format_id="FI_DPRES_PDF_A_1",
+                          grade="ACCEPTABLE",
+                          support_in_dps_ingest=True, active=True,
+                          version="A-1z", format_registry_key="fmt/354")
+
+    assert [version.version for version in puid_versions("fmt/354")] \
+        == ["A-1b", "A-1z"]
+    assert grade_by_puid("fmt/354") == Grades.ACCEPTABLE
+
+
+def test_grade_as_of():
+    """Test grading by the file formats of a DPS spec version, also with
+    the grade cache enabled and between the grades of grade_many.
+    """
+    epub = ("application/epub+zip", "3", {})
+    enable_grade_cache()
+    try:
+        assert grade(*epub) == Grades.RECOMMENDED
+        assert grade(*epub, as_of="1.12.0") == Grades.UNACCEPTABLE
+        assert grade(*epub, as_of="V13") == Grades.RECOMMENDED
+        assert grade(*epub) == Grades.RECOMMENDED
+    finally:
+        disable_grade_cache()
+
+    grades = grade_many(
+        [epub, (*epub[:2], {0: {"mimetype": epub[0], "version": "3"}})],
+        as_of="1.12.0")
+    assert next(grades) == Grades.UNACCEPTABLE
+    assert grade(*epub) == Grades.RECOMMENDED
+    assert next(grades) == Grades.UNACCEPTABLE
+
+    with pytest.raises(ValueError):
+        grade(*epub, as_of="1.2.0")
+
+
+def test_grade_as_of_removed_version():
+    """Test that the grade of a version removed after the spec version
+    is unknown in it, as its earlier grade is not recorded.
+    """
+    tiff = ("image/tiff", "1.3", {})
+    assert grade(*tiff) == Grades.UNACCEPTABLE
+    assert grade(*tiff, as_of="1.11.0") == UnknownValue.UNAV
+    assert list(grade_many([tiff], as_of="1.11.0")) == [UnknownValue.UNAV]
+    assert grade(*tiff, as_of="1.12.0") == Grades.UNACCEPTABLE
+
+
+def test_grade_as_of_removed_version():
+    """Test that the grade of a version removed after the DPS spec version
+    is unknown instead of its current grade.
+    """
+    msword = ("application/msword", "11.0", {})
+    assert grade(*msword) == Grades.UNACCEPTABLE
+    assert grade(*msword, as_of="1.5.0") == UnknownValue.UNAV
+    assert grade(*msword, as_of="1.9.0") == Grades.UNACCEPTABLE
+
+
+def test_grade_signature():
+    """Test that the signature ignores stream order and unrelated keys,
+    but not the container stream or the number of streams.
+    """
+    streams = {
+        0: {"mimetype": "video/mp4", "version": "(:unap)"},
+        1: {"mimetype": "video/h264", "version": "(:unap)"},
+        2: {"mimetype": "audio/aac", "version": "(:unap)", "index": 2}
+    }
+    reordered = {
+        0: {"mimetype": "video/mp4", "version": "(:unap)"},
+        1: {"mimetype": "audio/aac", "version": "(:unap)"},
+        2: {"mimetype": "video/h264", "version": "(:unap)"}
+    }
+    duplicated = {**reordered, 3: reordered[2]}
+
+    signature = grade_signature("video/mp4", "(:unap)", streams)
+    assert signature == grade_signature("video/mp4", "(:unap)", reordered)
+    assert signature != grade_signature("video/mp4", "(:unap)", duplicated)
+    assert signature != grade_signature(
+        "video/mp4", "(:unap)", {**streams, 0: streams[1], 1: streams[0]})
+
+
+def test_format_index():
+    """Test that FormatIndex returns the first matching format and
+    separates text formats.
+    """
+    index = FormatIndex([
+        {"mimetype": "Text/Plain", "version": "1", "charsets": ["UTF-8"],
+         "grade": Grades.RECOMMENDED},
+        {"mimetype": "text/plain", "version": "1", "charsets": ["UTF-16"],
+         "grade": Grades.ACCEPTABLE},
+        {"mimetype": "image/png", "version": "1", "charsets": [],
+         "grade": Grades.BIT_LEVEL},
+    ])
+
+    assert index.mimetypes == {"text/plain", "image/png"}
+    assert index.text_mimetypes == {"text/plain"}
+    assert index.grade("text/plain", "1") == Grades.RECOMMENDED
+    assert index.grade("image/png", "2") is None
+    assert index.text_grade(
+        "text/plain", "1", [{"charset": "UTF-16"}]) == Grades.ACCEPTABLE
+    assert index.text_grade("text/plain", "1", [{"charset": "foo"}]) is None
+
+
+def test_container_stream_grades():
+    """Test that the stream lookup table keeps the best grade of a stream
+    allowed in several rules of a container.
+    """
+    stream = {"version_id": "x", "mimetype": "Audio/X-WAV", "version": "1"}
+    other = {"version_id": "y", "mimetype": "audio/mpeg", "version": "1"}
+    table = _container_stream_grades([
+        {"mimetype": "video/MP4", "version": "1",
+         "grade": Grades.ACCEPTABLE, "audio_streams": [stream, other],
+         "video_streams": []},
+        {"mimetype": "video/mp4", "version": "1",
+         "grade": Grades.RECOMMENDED, "audio_streams": [stream],
+         "video_streams": []},
+    ])
+
+    assert table == {("video/mp4", "1"): {
+        ("audio/x-wav", "1"): Grades.RECOMMENDED,
+        ("audio/mpeg", "1"): Grades.ACCEPTABLE,
+    }}
+
+
+def test_dispatch_table():
+    """Test that the dispatch table lists the graders of each lowercased
+    mimetype, cheapest first.
+    """
+    table = dispatch_table()
+
+    assert table["text/plain"] == (NotContainerStreamsGrader, MIMEGrader,
+                                   TextGrader)
+    assert table["video/x-matroska"] == (MIMEGrader,
+                                         ContainerStreamsGrader)
+    assert table["image/gif"] == (MIMEGrader,)
+    assert "foo/bar" not in table
+    assert dispatch_table() is table
+
+
+def test_register_grader(monkeypatch):
+    """Test that registered graders are dispatched by their supported
+    mimetypes, or by is_supported when the mimetypes are not known.
+    """
+    monkeypatch.setattr(graders, "GRADERS", list(graders.GRADERS))
+
+    @register_grader
+    class PdfGrader(BaseGrader):
+        """Grader rejecting all PDF files."""
+
+        @classmethod
+        def is_supported(cls, mimetype):
+            return mimetype.lower() == "application/pdf"
+
+        @classmethod
+        def supported_mimetypes(cls):
+            return ["application/pdf"]
+
+        def grade(self):
+            return Grades.UNACCEPTABLE
+
+    @register_grader
+    class FooGrader(BaseGrader):
+        """Grader accepting a mimetype missing from the registry."""
+
+        @classmethod
+        def is_supported(cls, mimetype):
+            return mimetype.lower() == "foo/bar"
+
+        def grade(self):
+            return Grades.BIT_LEVEL
+
+    assert register_grader(PdfGrader) is PdfGrader
+    assert graders.GRADERS.count(PdfGrader) == 1
+    # Graders of the default cost are run last
+    assert dispatch_table()["application/pdf"][-1] is PdfGrader
+    assert "foo/bar" not in dispatch_table()
+
+    assert grade("application/pdf", "A-1a", {}) == Grades.UNACCEPTABLE
+    assert grade("Foo/Bar", "1", {}) == Grades.BIT_LEVEL
+    assert grade("foo/baz", "1", {}) == Grades.UNACCEPTABLE
+
+
+def test_grade_short_circuit(monkeypatch):
+    """Test that graders are run cheapest first and skipped once a file is
+    unacceptable.
+    """
+    calls = []
+    for grader in (MIMEGrader, TextGrader, NotContainerStreamsGrader):
+        def record(self, _grade=grader.grade, _name=grader.__name__):
+            calls.append(_name)
+            return _grade(self)
+        monkeypatch.setattr(grader, "grade", record)
+
+    streams = {0: {"mimetype": "text/plain", "version": "(:unap)",
+                   "charset": "UTF-8"}}
+    assert grade("text/plain", "(:unap)", streams) == Grades.RECOMMENDED
+    assert calls == ["NotContainerStreamsGrader", "MIMEGrader",
+                     "TextGrader"]
+
+    calls.clear()
+    assert grade("text/plain", "(:unap)",
+                 {**streams, 1: streams[0]}) == Grades.UNACCEPTABLE
+    assert calls == ["NotContainerStreamsGrader"]
+
+    calls.clear()
+    assert grade("text/plain", "2", streams) == Grades.UNACCEPTABLE
+    assert calls == ["NotContainerStreamsGrader", "MIMEGrader"]
+
+
+def test_grade_cache():
+    """Test that cached grades are returned and counted."""
+    enable_grade_cache(maxsize=2)
+    try:
+        assert grade("audio/mpeg", "2", {}) == Grades.ACCEPTABLE
+        assert grade("audio/mpeg", "2", {}) == Grades.ACCEPTABLE
+        assert grade("non/existent", "1.0", {}) == Grades.UNACCEPTABLE
+        info = grade_cache_info()
+        assert (info.hits, info.misses, info.currsize) == (1, 2, 2)
+    finally:
+        disable_grade_cache()
+    assert grade_cache_info() is None
+
+
+def test_grade_cache_eviction():
+    """Test that the least recently used grade is evicted."""
+    cache = GradeCache(maxsize=2)
+    cache.put(("a",), Grades.RECOMMENDED)
+    cache.put(("b",), Grades.ACCEPTABLE)
+    assert cache.get(("a",)) == Grades.RECOMMENDED
+    cache.put(("c",), Grades.BIT_LEVEL)
+
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == Grades.RECOMMENDED
+    assert cache.get(("c",)) == Grades.BIT_LEVEL
+
+
+def test_grade_cache_cleared_on_write():
+    """Test that writing the file format data clears the cache."""
+    cache = GradeCache()
+    cache.put(("a",), Grades.RECOMMENDED)
+
+    add_format(mimetype="yyy/zzz",
+               content_type="TEXT",
+               format_name_long="Test file format",
+               format_name_short="XYZ")
+
+    assert cache.get(("a",)) is None
+    assert cache.info().currsize == 0
+
+    with pytest.raises(ValueError):
+        GradeCache(maxsize=0)
+
+
+def test_grade_cache_cleared_on_grading_changes(monkeypatch):
+    """Test that registering a grader and resetting the registry clear
+    the cache.
+    """
+    monkeypatch.setattr(graders, "GRADERS", list(graders.GRADERS))
+    tiff = ("image/tiff", "6.0", {})
+    enable_grade_cache()
+    try:
+        assert grade(*tiff) == Grades.RECOMMENDED
+
+        @register_grader
+        class TiffGrader(BaseGrader):  # pylint: disable=unused-variable
+            """Grader rejecting all TIFF files."""
+
+            @classmethod
+            def is_supported(cls, mimetype):
+                return mimetype.lower() == "image/tiff"
+
+            def grade(self):
+                return Grades.UNACCEPTABLE
+
+        assert grade(*tiff) == Grades.UNACCEPTABLE
+
+        cache = GradeCache()
+        cache.put(("a",), Grades.RECOMMENDED)
+        REGISTRY.reset()
+        assert cache.get(("a",)) is None
+    finally:
+        disable_grade_cache()
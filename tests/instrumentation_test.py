@@ -0,0 +1,127 @@
+"""Tests for the instrumentation of grading and registry loads."""
+import pytest
+
+from dpres_file_formats import add_format, grade, grade_many, instrumentation
+from dpres_file_formats.defaults import Grades
+from dpres_file_formats.graders import disable_grade_cache, enable_grade_cache
+from dpres_file_formats.instrumentation import (
+    Histogram,
+    disable_instrumentation,
+    enable_instrumentation,
+    snapshot,
+    write_prometheus,
+)
+from dpres_file_formats.registry import REGISTRY
+
+STREAMS = {0: {"mimetype": "aaa/bbb", "version": "2"}}
+
+
+@pytest.fixture(autouse=True)
+def fixture_disable_instrumentation():
+    """Disable the instrumentation and the grade cache after each test."""
+    yield
+    disable_instrumentation()
+    disable_grade_cache()
+
+
+def test_disabled_by_default():
+    """Test that nothing is recorded unless instrumentation is enabled."""
+    assert instrumentation.active is None
+    grade("aaa/bbb", "2", STREAMS)
+    assert snapshot() is None
+    with pytest.raises(RuntimeError):
+        instrumentation.add_callback(print)
+
+
+def test_grader_calls():
+    """Test that grade() and grader calls are counted and timed."""
+    enable_instrumentation()
+
+    assert grade("aaa/bbb", "2", STREAMS) == Grades.RECOMMENDED
+    assert grade("aaa/bbb", "2", {**STREAMS, 1: STREAMS[0]}) == \
+        Grades.UNACCEPTABLE
+
+    values = snapshot()
+    assert values["grade"]["count"] == 2
+    assert values["grade"]["grades"] == {Grades.RECOMMENDED: 1,
+                                         Grades.UNACCEPTABLE: 1}
+    # The second file is unacceptable after the stream count
+    assert values["graders"]["NotContainerStreamsGrader"]["count"] == 2
+    assert values["graders"]["MIMEGrader"]["count"] == 1
+    assert values["graders"]["MIMEGrader"]["sum"] > 0
+    assert values["graders"]["MIMEGrader"]["buckets"]["+Inf"] == 1
+
+
+def test_cache_hit_rates():
+    """Test that the lookups from the grade caches are counted."""
+    enable_instrumentation()
+    enable_grade_cache()
+
+    for _ in range(4):
+        grade("aaa/bbb", "2", STREAMS)
+    list(grade_many([("aaa/bbb", "2", STREAMS)] * 2))
+
+    assert snapshot()["caches"] == {
+        "grade": {"hits": 3, "misses": 1, "hit_rate": 0.75},
+        "grade_many": {"hits": 1, "misses": 1, "hit_rate": 0.5},
+    }
+
+
+def test_registry_events():
+    """Test that registry builds, resets and data loads are passed to the
+    callbacks.
+    """
+    events = []
+    enable_instrumentation()
+    instrumentation.add_callback(events.append)
+
+    grade("aaa/bbb", "2", STREAMS)
+    add_format(mimetype="yyy/zzz", content_type="TEXT",
+               format_name_long="Test file format", format_name_short="XYZ")
+    REGISTRY.reset()
+
+    kinds = {(event.kind, event.name) for event in events}
+    assert ("registry_build", "format_index") in kinds
+    assert ("data_load", "file_formats.json") in kinds
+    assert ("registry_reset", "") in kinds
+    registry = snapshot()["registry"]
+    assert registry["resets"] == 1
+    assert registry["builds"]["format_index"]["count"] == 1
+    assert registry["data_loads"]["file_formats.json:json"]["count"] == 1
+
+    instrumentation.active.remove_callback(events.append)
+    events.clear()
+    grade("aaa/bbb", "2", STREAMS)
+    assert not events
+
+
+def test_histogram():
+    """Test that the histogram counts are cumulative."""
+    histogram = Histogram([0.1, 0.01])
+    for seconds in (0.005, 0.01, 0.05, 1.0):
+        histogram.observe(seconds)
+
+    assert histogram.cumulative_counts() == [
+        (0.01, 2), (0.1, 3), (float("inf"), 4)]
+    assert histogram.sum == pytest.approx(1.065)
+
+
+def test_write_prometheus(tmp_path):
+    """Test writing the recorded values in the Prometheus text format."""
+    with pytest.raises(RuntimeError):
+        write_prometheus(tmp_path / "dpres.prom")
+
+    enable_instrumentation(buckets=[0.001, 1.0])
+    grade("aaa/bbb", "2", STREAMS)
+    path = tmp_path / "dpres.prom"
+    write_prometheus(path)
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert "# TYPE dpres_grade_duration_seconds histogram" in lines
+    assert 'dpres_grade_duration_seconds_bucket{le="+Inf"} 1' in lines
+    assert "dpres_grade_duration_seconds_count 1" in lines
+    assert ('dpres_grades_total{grade="fi-dpres-recommended-file-format"} 1'
+            in lines)
+    assert ('dpres_grader_duration_seconds_count{grader="MIMEGrader"} 1'
+            in lines)
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,185 @@
+"""Tests for the memory-mapped registry."""
+import pytest
+
+from dpres_file_formats import (
+    av_container_grading,
+    file_formats,
+    grade,
+    read_file_formats,
+)
+from dpres_file_formats.mmap_registry import MmapRegistry, write_mmap_registry
+from dpres_file_formats.registry import (
+    REGISTRY,
+    FormatIndex,
+    use_mmap_registry,
+)
+from tests.conftest import packaged_data
+from tests.graders_test import GRADE_CASES
+
+
+@pytest.fixture(scope='function')
+def file_formats_data_fx():
+    """Use a copy of the packaged file formats data."""
+    return packaged_data("file_formats.json")
+
+
+@pytest.fixture(scope='function')
+def av_container_grading_data_fx():
+    """Use a copy of the packaged AV container grading data."""
+    return packaged_data("av_container_grading.json")
+
+
+@pytest.fixture(scope='function')
+def mmap_registry_fx(tmp_path):
+    """Write a registry file and map it."""
+    path = tmp_path / "registry.bin"
+    write_mmap_registry(path)
+    registry = MmapRegistry(path)
+    yield registry
+    registry.close()
+
+
+# pylint: disable=redefined-outer-name
+def test_lookups(mmap_registry_fx):
+    """Test that the lookups match the format index built from the JSON
+    file.
+    """
+    index = FormatIndex(file_formats(unofficial=True))
+
+    assert set(mmap_registry_fx.mimetypes) == index.mimetypes
+    assert set(mmap_registry_fx.text_mimetypes) == index.text_mimetypes
+    assert "text/csv" in mmap_registry_fx.text_mimetypes
+    assert "image/png" not in mmap_registry_fx.text_mimetypes
+    assert "non/existent" not in mmap_registry_fx.mimetypes
+
+    for file_format in file_formats(deprecated=True, unofficial=True):
+        mimetype = file_format["mimetype"].lower()
+        version = file_format["version"]
+        assert mmap_registry_fx.grade(mimetype, version) == \
+            index.grade(mimetype, version)
+        streams = [{"charset": "UTF-8"}]
+        assert mmap_registry_fx.text_grade(mimetype, version, streams) == \
+            index.text_grade(mimetype, version, streams)
+    assert mmap_registry_fx.grade("application/pdf", "foo") is None
+
+
+@pytest.mark.parametrize(("deprecated", "unofficial"),
+                         [(False, False), (True, True)])
+@pytest.mark.parametrize("versions_separately", [True, False])
+def test_file_formats(mmap_registry_fx, deprecated, unofficial,
+                      versions_separately):
+    """Test that the registry file outputs the same file formats."""
+    assert mmap_registry_fx.file_formats(
+        deprecated, unofficial, versions_separately) == \
+        file_formats(deprecated, unofficial, versions_separately)
+    assert mmap_registry_fx.av_container_grading() == av_container_grading()
+
+
+def test_grade_with_mmap_registry(tmp_path):
+    """Test that grading gives the same grades with the registry file."""
+    path = tmp_path / "registry.bin"
+    write_mmap_registry(path)
+
+    use_mmap_registry(path)
+    try:
+        assert REGISTRY.backend is not None
+        for mimetype, version, streams, expected in GRADE_CASES:
+            assert grade(mimetype, version, streams) == expected
+    finally:
+        use_mmap_registry(None)
+    assert REGISTRY.backend is None
+
+
+@pytest.mark.parametrize("versions_separately", [True, False])
+def test_file_formats_from_mmap_registry(tmp_path, monkeypatch,
+                                         versions_separately):
+    """Test that file_formats and av_container_grading read the registry
+    file in use instead of the JSON files.
+    """
+    path = tmp_path / "registry.bin"
+    write_mmap_registry(path)
+    expected = (file_formats(True, True, versions_separately),
+                file_formats(versions_separately=versions_separately,
+                             as_of="1.10.0"),
+                av_container_grading())
+
+    use_mmap_registry(path)
+    try:
+        def fail():
+            raise AssertionError("JSON file read")
+        monkeypatch.setattr(read_file_formats, "shared_file_formats_json",
+                            fail)
+        monkeypatch.setattr(read_file_formats,
+                            "shared_container_streams_json", fail)
+
+        assert (file_formats(True, True, versions_separately),
+                file_formats(versions_separately=versions_separately,
+                             as_of="1.10.0"),
+                av_container_grading()) == expected
+        assert [list(view) for view in file_formats(
+            True, True, versions_separately, views=True)] \
+            == [list(format_dict) for format_dict in expected[0]]
+        records = file_formats(True, True, versions_separately,
+                               records=True)
+        assert [record.id for record in records] \
+            == [format_dict["_id"] for format_dict in expected[0]]
+    finally:
+        use_mmap_registry(None)
+
+
+@pytest.mark.parametrize("versions_separately", [True, False])
+def test_file_formats_not_decoded(tmp_path, monkeypatch,
+                                  versions_separately):
+    """Test that the file format dicts are decoded from the registry file
+    on each call without decoding the whole registry.
+    """
+    path = tmp_path / "registry.bin"
+    write_mmap_registry(path)
+    expected = (file_formats(versions_separately=versions_separately),
+                av_container_grading())
+
+    use_mmap_registry(path)
+    try:
+        def fail(_self):
+            raise AssertionError("Whole registry decoded")
+        monkeypatch.setattr(MmapRegistry, "file_format_data", fail)
+        monkeypatch.setattr(MmapRegistry, "container_data", fail)
+
+        output = file_formats(versions_separately=versions_separately)
+        assert output == expected[0]
+        assert av_container_grading() == expected[1]
+        output[0]["mimetype"] = "aaa/changed"
+        assert file_formats(
+            versions_separately=versions_separately) == expected[0]
+    finally:
+        use_mmap_registry(None)
+
+
+def test_write_replaces_file(tmp_path):
+    """Test that the registry file is replaced without temporary files
+    left behind, and that a mapped file keeps its content.
+    """
+    path = tmp_path / "registry" / "registry.bin"
+    path.parent.mkdir()
+    write_mmap_registry(path)
+    old_registry = MmapRegistry(path)
+    write_mmap_registry(path, file_formats=[], av_containers=[])
+    new_registry = MmapRegistry(path)
+    try:
+        assert old_registry.file_formats(True, True) \
+            == file_formats(True, True)
+        assert new_registry.file_formats(True, True) == []
+    finally:
+        old_registry.close()
+        new_registry.close()
+    assert [child.name for child in path.parent.iterdir()] \
+        == ["registry.bin"]
+
+
+def test_invalid_file(tmp_path):
+    """Test that a file of other type is rejected."""
+    path = tmp_path / "registry.bin"
+    path.write_bytes(b"{}" * 100)
+
+    with pytest.raises(ValueError):
+        MmapRegistry(path)
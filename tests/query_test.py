@@ -0,0 +1,66 @@
+"""Unit tests for the query module."""
+
+from dpres_file_formats import add_format, add_version_to_format, query
+from dpres_file_formats.defaults import ContentTypes
+
+
+def _ids(records):
+    """Return the IDs of the records."""
+    return [record.id for record in records]
+
+
+def test_by_puid():
+    """Test looking up versions by PRONOM PUID."""
+    assert _ids(query.by_puid("key_002")) \
+        == ["TEST_MIMETYPE_1_2", "TEST_MIMETYPE_1_3"]
+    assert _ids(query.by_puid(" key_004")) == ["TEST_MIMETYPE_4_1"]
+    assert query.by_puid("fmt/1") == ()
+
+
+def test_by_mimetype():
+    """Test looking up formats by mimetype, case-insensitively."""
+    assert _ids(query.by_mimetype("AAA/bbb")) \
+        == ["TEST_MIMETYPE_1", "TEST_MIMETYPE_4"]
+    assert query.by_mimetype("xxx/yyy") == ()
+
+
+def test_by_content_type():
+    """Test looking up formats by content type member or value."""
+    assert _ids(query.by_content_type(ContentTypes.VIDEOCONTAINER)) \
+        == ["TEST_MIMETYPE_3"]
+    assert _ids(query.by_content_type("audio")) == ["TEST_MIMETYPE_1"]
+    assert query.by_content_type(ContentTypes.WARC) == ()
+
+
+def test_by_version_id():
+    """Test looking up a version by ID, and that its format is the same
+    record as returned by the format lookups.
+    """
+    version = query.by_version_id("TEST_MIMETYPE_1_3")
+    assert version.version == "3"
+    assert version.file_format is query.by_mimetype("aaa/bbb")[0]
+    assert query.by_version_id("TEST_MIMETYPE_1_4") is None
+
+
+def test_indexes_rebuilt_after_write():
+    """Test the extension and PUID lookups of a format added after the
+    indexes were built.
+    """
+    assert query.by_extension("xyz") == ()
+
+    format_id = add_format(mimetype="yyy/zzz",
+                           content_type="TEXT",
+                           format_name_long="Test file format",
+                           format_name_short="XYZ",
+                           typical_extensions=[".xyz", ".XY"])
+    add_version_to_format(format_id=format_id,
+                          version="1",
+                          grade="RECOMMENDED",
+                          support_in_dps_ingest=True,
+                          active=True,
+                          format_registry_key="fmt/1, fmt/2")
+
+    assert _ids(query.by_extension("XYZ")) == [format_id]
+    assert _ids(query.by_extension(".xy")) == [format_id]
+    assert _ids(query.by_puid("fmt/2")) == [f"{format_id}_1"]
+    assert {"fmt/1", "fmt/2", "key_001"} <= query.query_index().puids
@@ -1,11 +1,19 @@
 """Unit tests for the read file formats module."""
 
+import copy
+import hashlib
 import json
 
 import pytest
 
-from dpres_file_formats import file_formats
-from dpres_file_formats.json_handler import read_file_formats_json
+from dpres_file_formats import add_format, av_container_grading, file_formats
+from dpres_file_formats import json_handler
+from dpres_file_formats.defaults import UnknownValue
+from dpres_file_formats.json_handler import (
+    read_file_formats_json,
+    shared_file_formats_json,
+    write_snapshot,
+)
 
 
 @pytest.mark.parametrize(
@@ -75,3 +83,240 @@ def test_file_formats_custom_data():
         file_format["mimetype"] == "aaa/bbb" for file_format
         in dps_formats
     ]) == 0
+
+
+# DPS spec versions where the test versions were added and removed
+SPEC_VERSIONS = {
+    "TEST_MIMETYPE_1_1": ("1.3.0", "1.10.0"),
+    "TEST_MIMETYPE_1_2": ("1.11.0", ""),
+    "TEST_MIMETYPE_2_1": ("1.5.0", ""),
+}
+
+
+@pytest.mark.parametrize(
+    ("as_of", "unofficial", "expected"),
+    [
+        (None, False, {"TEST_MIMETYPE_1_1": False, "TEST_MIMETYPE_1_2": True,
+                       "TEST_MIMETYPE_2_1": True, "TEST_MIMETYPE_3_1": False,
+                       "TEST_MIMETYPE_4_1": True}),
+        ("1.4.0", False, {"TEST_MIMETYPE_1_1": True,
+                          "TEST_MIMETYPE_3_1": False,
+                          "TEST_MIMETYPE_4_1": True}),
+        ("1.9.0", False, {"TEST_MIMETYPE_1_1": True,
+                          "TEST_MIMETYPE_2_1": True,
+                          "TEST_MIMETYPE_3_1": False,
+                          "TEST_MIMETYPE_4_1": True}),
+        ("V10", True, {"TEST_MIMETYPE_1_1": False, "TEST_MIMETYPE_1_3": True,
+                       "TEST_MIMETYPE_2_1": True, "TEST_MIMETYPE_3_1": False,
+                       "TEST_MIMETYPE_4_1": True}),
+    ],
+    ids=["Current", "Before a version was added", "Before a version was "
+         "removed", "After a version was removed, with unofficial"]
+)
+@pytest.mark.parametrize("records", [False, True])
+def test_file_formats_as_of(as_of, unofficial, expected, records):
+    """Test that file_formats returns the versions of a DPS spec version
+    with their status in it, and that the views and records of each spec
+    version are shared between the calls.
+    """
+    data = read_file_formats_json()
+    for file_format in data:
+        for version in file_format["versions"]:
+            if version["_id"] in SPEC_VERSIONS:
+                added, removed = SPEC_VERSIONS[version["_id"]]
+                version["added_in_dps_spec"] = added
+                version["removed_in_dps_spec"] = removed
+                version["active"] = not removed
+    json_handler.update_file_formats_json(file_formats=data)
+
+    versions = file_formats(deprecated=True, unofficial=unofficial,
+                            views=not records, records=records, as_of=as_of)
+
+    if records:
+        assert {version.id: version.active for version in versions} \
+            == expected
+        grades = {version.id: version.grade for version in versions}
+    else:
+        assert {version["_id"]: version["active"] for version in versions} \
+            == expected
+        grades = {version["_id"]: version["grade"] for version in versions}
+    # The grades of versions removed after the spec version are unknown
+    if expected.get("TEST_MIMETYPE_1_1"):
+        assert grades["TEST_MIMETYPE_1_1"] == UnknownValue.UNAV
+    assert grades["TEST_MIMETYPE_4_1"] != UnknownValue.UNAV
+    assert file_formats(deprecated=True, unofficial=unofficial,
+                        views=not records, records=records,
+                        as_of=as_of)[0] is versions[0]
+    assert len(file_formats(as_of=as_of, versions_separately=False)) \
+        == len({version_id.rsplit("_", 1)[0]
+                for version_id, active in expected.items()
+                if active and version_id != "TEST_MIMETYPE_1_3"})
+
+
+def test_file_formats_as_of_unknown():
+    """Test that an unknown DPS spec version is not accepted."""
+    with pytest.raises(ValueError, match="Unknown DPS spec version"):
+        file_formats(as_of="1.2.0")
+
+
+def test_file_formats_parsed_once(file_formats_path_fx, monkeypatch):
+    """Test that the file formats are parsed again only when the file
+    content changes.
+    """
+    loads_calls = []
+    original_loads = json.loads
+
+    def counting_loads(*args, **kwargs):
+        loads_calls.append(1)
+        return original_loads(*args, **kwargs)
+
+    monkeypatch.setattr(json, "loads", counting_loads)
+
+    file_formats()
+    file_formats(deprecated=True)
+    av_container_grading()
+    assert len(loads_calls) == 2
+
+    # Rewriting the same content does not cause parsing
+    content = file_formats_path_fx.read_text(encoding="UTF-8")
+    file_formats_path_fx.write_text(content + " ", encoding="UTF-8")
+    file_formats()
+    assert len(loads_calls) == 3
+
+    data = original_loads(content)
+    data["file_formats"][0]["mimetype"] = "aaa/changed"
+    file_formats_path_fx.write_text(json.dumps(data), encoding="UTF-8")
+    assert file_formats(deprecated=True)[0]["mimetype"] == "aaa/changed"
+    assert len(loads_calls) == 4
+
+
+def test_shared_file_formats_read_only():
+    """Test that the shared file formats can not be modified."""
+    shared_formats = shared_file_formats_json()
+    assert shared_formats is shared_file_formats_json()
+
+    with pytest.raises(TypeError):
+        shared_formats.append({})
+    with pytest.raises(TypeError):
+        shared_formats[0]["mimetype"] = "aaa/changed"
+    with pytest.raises(TypeError):
+        shared_formats[0]["versions"].clear()
+
+    # The output can be serialized and compared like plain JSON data
+    assert json.loads(json.dumps(shared_formats)) == shared_formats
+
+
+def test_file_formats_mutable_copies():
+    """Test that the default output is a mutable copy, which does not
+    change the shared data, and that copies of the shared data are plain
+    lists and dicts.
+    """
+    format_dict = file_formats(versions_separately=False)[0]
+    format_dict["charsets"].append("UTF-8")
+    format_dict["versions"][0]["grade"] = "changed"
+
+    assert file_formats(versions_separately=False)[0] != format_dict
+
+    shared_format = shared_file_formats_json()[0]
+    for copied in (copy.copy(shared_format), copy.deepcopy(shared_format)):
+        assert type(copied) is dict
+        assert copied == shared_format
+    copied = copy.deepcopy(shared_format)
+    assert type(copied["versions"]) is list
+    copied["versions"].append({})
+
+
+def test_file_formats_custom_data_not_modified():
+    """Test that the custom data given to file_formats is not modified."""
+    file_format_data = read_file_formats_json()
+    versions = [len(file_format["versions"])
+                for file_format in file_format_data]
+
+    file_formats(data={"file_formats": file_format_data},
+                 versions_separately=False)
+
+    assert versions == [len(file_format["versions"])
+                        for file_format in file_format_data]
+
+
+@pytest.mark.parametrize("versions_separately", [True, False])
+def test_file_formats_views(versions_separately):
+    """Test that views have the same content as the dicts and are shared
+    between the calls.
+    """
+    format_dicts = file_formats(True, True, versions_separately)
+    format_views = file_formats(True, True, versions_separately, views=True)
+
+    assert format_views == format_dicts
+    assert [list(view) for view in format_views] == \
+        [list(format_dict) for format_dict in format_dicts]
+    assert all(first is second for first, second in zip(
+        format_views,
+        file_formats(True, True, versions_separately, views=True)))
+
+    with pytest.raises(TypeError):
+        format_views[0]["mimetype"] = "aaa/changed"
+
+
+def test_file_formats_flattened_keys():
+    """Test that flattened versions have the version _id and no versions.
+    """
+    format_view = file_formats(views=True)[0]
+
+    assert format_view["_id"] == "TEST_MIMETYPE_1_2"
+    assert "versions" not in format_view
+    with pytest.raises(KeyError):
+        format_view["versions"]  # pylint: disable=pointless-statement
+
+
+def test_snapshot_used(file_formats_path_fx, monkeypatch):
+    """Test that an up to date snapshot is used instead of the JSON file,
+    and that a stale snapshot is ignored.
+    """
+    expected = file_formats()
+    snapshot = write_snapshot(file_formats_path_fx)
+    assert snapshot == file_formats_path_fx.with_suffix(".marshal")
+
+    def fail_loads(*args, **kwargs):
+        raise AssertionError("JSON file was parsed")
+
+    monkeypatch.setattr(json_handler, "_shared_files", {})
+    with monkeypatch.context() as json_patch:
+        json_patch.setattr(json, "loads", fail_loads)
+        assert file_formats() == expected
+
+    # Changing the JSON file makes the snapshot stale
+    data = json.loads(file_formats_path_fx.read_text(encoding="UTF-8"))
+    data["file_formats"][0]["mimetype"] = "aaa/changed"
+    file_formats_path_fx.write_text(json.dumps(data), encoding="UTF-8")
+    assert file_formats(deprecated=True)[0]["mimetype"] == "aaa/changed"
+
+
+def test_broken_snapshot_ignored(file_formats_path_fx):
+    """Test that the JSON file is parsed when the snapshot is broken, and
+    that the data read from a snapshot is read-only.
+    """
+    expected = file_formats()
+    snapshot = write_snapshot(file_formats_path_fx)
+
+    json_handler._shared_files.clear()  # pylint: disable=protected-access
+    with pytest.raises(TypeError):
+        json_handler.shared_file_formats_json()[0]["versions"].clear()
+
+    snapshot.write_bytes(snapshot.read_bytes()[:-10])
+    json_handler._shared_files.clear()  # pylint: disable=protected-access
+    assert file_formats() == expected
+
+
+def test_snapshot_updated_on_write(file_formats_path_fx):
+    """Test that writing the data file updates an existing snapshot."""
+    write_snapshot(file_formats_path_fx)
+    add_format(mimetype="yyy/zzz",
+               content_type="TEXT",
+               format_name_long="Test file format",
+               format_name_short="XYZ")
+
+    digest = hashlib.sha256(file_formats_path_fx.read_bytes()).hexdigest()
+    data = json_handler._read_snapshot(  # pylint: disable=protected-access
+        file_formats_path_fx, digest)
+    assert data[-1]["mimetype"] == "yyy/zzz"
@@ -0,0 +1,109 @@
+"""Tests for the file format records."""
+import copy
+import pickle
+
+import pytest
+
+from dpres_file_formats import av_container_grading, file_formats
+from dpres_file_formats.records import ContainerRule, FileFormat
+from tests.conftest import packaged_data
+
+
+def test_file_format_round_trip():
+    """Test that records convert back to the dicts of the JSON file."""
+    data = packaged_data("file_formats.json")["file_formats"]
+
+    assert [FileFormat.from_dict(format_dict).to_dict()
+            for format_dict in data] == data
+
+
+def test_container_rule_round_trip():
+    """Test that container rules convert back to the dicts of the JSON
+    file.
+    """
+    data = packaged_data("av_container_grading.json")["file_formats"]
+
+    assert [ContainerRule.from_dict(container).to_dict()
+            for container in data] == data
+
+
+def test_flat_dict():
+    """Test that a flattened version matches the file_formats output."""
+    format_dict = packaged_data("file_formats.json")["file_formats"][0]
+    file_format = FileFormat.from_dict(format_dict)
+    flat_dict = file_format.versions[0].to_flat_dict()
+
+    assert flat_dict == file_formats(
+        data={"file_formats": [format_dict]}, deprecated=True,
+        unofficial=True)[0]
+    assert list(flat_dict) == list(file_formats(
+        data={"file_formats": [format_dict]}, deprecated=True,
+        unofficial=True)[0])
+
+
+def test_strings_interned():
+    """Test that repeated strings are shared between records."""
+    data = packaged_data("file_formats.json")["file_formats"]
+    grades = {id(version.grade)
+              for format_dict in data
+              for version in FileFormat.from_dict(format_dict).versions}
+
+    assert len(grades) <= 5
+
+
+@pytest.mark.parametrize(
+    ("deprecated", "unofficial", "versions_separately"),
+    [(False, False, True), (True, True, True), (False, True, False)]
+)
+def test_file_formats_records(deprecated, unofficial, versions_separately):
+    """Test that file_formats returns the same formats as records."""
+    format_dicts = file_formats(deprecated, unofficial, versions_separately)
+    format_records = file_formats(deprecated, unofficial, versions_separately,
+                                  records=True)
+
+    assert [record.id for record in format_records] == \
+        [format_dict["_id"] for format_dict in format_dicts]
+    if not versions_separately:
+        assert [[version.id for version in record.versions]
+                for record in format_records] == \
+            [[version["_id"] for version in format_dict["versions"]]
+             for format_dict in format_dicts]
+    else:
+        assert format_records[0].mimetype == format_dicts[0]["mimetype"]
+    assert file_formats(deprecated, unofficial, versions_separately,
+                        records=True)[0] is format_records[0]
+
+
+def test_file_formats_records_and_views():
+    """Test that records and views can not be requested at once."""
+    with pytest.raises(ValueError):
+        file_formats(records=True, views=True)
+
+
+def test_av_container_grading_records():
+    """Test that container rules are returned as records."""
+    assert av_container_grading(records=True) == []
+
+
+def test_records_read_only():
+    """Test that the shared records can not be modified, and that copies
+    of them are equal records.
+    """
+    version = file_formats(records=True)[0]
+    container = ContainerRule.from_dict(
+        packaged_data("av_container_grading.json")["file_formats"][0])
+
+    for record, name in ((version, "grade"), (version.file_format, "id"),
+                         (container, "grade")):
+        with pytest.raises(AttributeError):
+            setattr(record, name, "changed")
+        with pytest.raises(AttributeError):
+            delattr(record, name)
+
+    for copied in (copy.copy(version), copy.deepcopy(version),
+                   pickle.loads(pickle.dumps(version))):
+        assert copied.to_flat_dict() == version.to_flat_dict()
+    assert pickle.loads(pickle.dumps(container)).to_dict() \
+        == container.to_dict()
+    assert version.with_active(False).active is False
+    assert version.active is True
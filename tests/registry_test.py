@@ -0,0 +1,61 @@
+"""Tests for the shared registry."""
+import subprocess
+import sys
+
+from dpres_file_formats import add_format
+from dpres_file_formats.registry import REGISTRY, Registry
+
+
+def test_import_does_not_read_data():
+    """Test that importing the package does not read the data files."""
+    code = ("import dpres_file_formats.registry as registry; "
+            "assert not registry.REGISTRY._values")
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_derived_value_built_once():
+    """Test that a derived value is built only once."""
+    registry = Registry()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return object()
+
+    value = registry.derived("value", build)
+    assert registry.derived("value", build) is value
+    assert len(calls) == 1
+
+    registry.reset()
+    assert registry.derived("value", build) is not value
+    assert len(calls) == 2
+
+
+def test_registry_reloaded_after_write():
+    """Test that the registry reads the data again after it is written."""
+    formats = REGISTRY.formats
+    assert REGISTRY.formats is formats
+
+    add_format(mimetype="yyy/zzz",
+               content_type="TEXT",
+               format_name_long="Test file format",
+               format_name_short="XYZ")
+
+    assert REGISTRY.formats is not formats
+
+
+def test_registry_for_spec():
+    """Test that the registry of a DPS spec version is shared, holds the
+    file formats of the spec version and is reset with the registry.
+    """
+    registry = REGISTRY.for_spec("V10")
+    assert REGISTRY.for_spec("1.10.0") is registry
+    assert registry.as_of == "1.10.0"
+    assert REGISTRY.as_of is None
+
+    formats = registry.formats
+    assert registry.formats is formats
+    assert formats is not REGISTRY.formats
+
+    REGISTRY.reset()
+    assert registry.formats is not formats
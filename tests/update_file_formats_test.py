@@ -1,11 +1,16 @@
 """Unit tests for the update file formats module."""
 
+import contextlib
 import json
+import multiprocessing
+
 import pytest
 from dpres_file_formats import (
     add_av_container,
     add_format,
     add_version_to_format,
+    edit_registry,
+    json_handler,
     replace_format
 )
 
@@ -128,3 +133,299 @@ def test_add_av_container_file(version_id,
                          grade="RECOMMENDED",
                          video_streams=video_streams,
                          audio_streams=audio_streams)
+
+
+def test_edit_registry(file_formats_path_fx, av_container_grading_path_fx,
+                       monkeypatch):
+    """Test that the changes of a transaction are written once, and that
+    later changes see the earlier ones.
+    """
+    writes = []
+    write = json_handler._write
+    monkeypatch.setattr(json_handler, "_write",
+                        lambda path, data: writes.append(path)
+                        or write(path, data))
+
+    with edit_registry() as registry:
+        format_id = registry.add_format(mimetype="yyy/zzz",
+                                        content_type="VIDEO",
+                                        format_name_long="Test file format",
+                                        format_name_short="XYZ")
+        registry.add_version_to_format(format_id=format_id,
+                                       version="1",
+                                       grade="RECOMMENDED",
+                                       support_in_dps_ingest=True,
+                                       active=True)
+        registry.add_version_to_format(format_id=format_id,
+                                       version="2",
+                                       grade="ACCEPTABLE",
+                                       support_in_dps_ingest=True,
+                                       active=True)
+        registry.add_av_container(version_id="TEST_MIMETYPE_3_1",
+                                  grade="RECOMMENDED",
+                                  video_streams=[f"{format_id}_2"])
+        assert not writes
+
+    assert sorted(writes) == sorted([file_formats_path_fx,
+                                     av_container_grading_path_fx])
+    found_format = _find_format(file_formats_path_fx, "yyy/zzz")
+    assert [version["version"] for version in found_format["versions"]] \
+        == ["1", "2"]
+    found_container = _find_format(av_container_grading_path_fx, "fff/ggg")
+    assert found_container["video_streams"][0]["mimetype"] == "yyy/zzz"
+
+
+def test_edit_registry_indexes_new_formats(file_formats_path_fx):
+    """Test that formats added in a transaction are counted in the IDs of
+    later formats and can be superseded in the same transaction.
+    """
+    with edit_registry() as registry:
+        format_ids = [
+            registry.add_format(mimetype=f"yyy/zzz{number}",
+                                content_type="TEXT",
+                                format_name_long="Test file format",
+                                format_name_short="XYZ")
+            for number in range(3)
+        ]
+        registry.add_version_to_format(format_id=format_ids[0],
+                                       version="1",
+                                       grade="RECOMMENDED",
+                                       support_in_dps_ingest=True,
+                                       active=True)
+        registry.replace_format(superseded_format=format_ids[0],
+                                superseding_format=format_ids[2],
+                                dps_spec_version="V11")
+
+    assert format_ids == ["FI_DPRES_XYZ_1", "FI_DPRES_XYZ_2",
+                          "FI_DPRES_XYZ_3"]
+    superseded = _find_format(file_formats_path_fx, "yyy/zzz0")
+    assert superseded["relations"][0]["_id"] == "FI_DPRES_XYZ_3"
+    assert superseded["versions"][0]["active"] is False
+    superseding = _find_format(file_formats_path_fx, "yyy/zzz2")
+    assert superseding["relations"][0]["_id"] == "FI_DPRES_XYZ_1"
+
+
+def test_edit_registry_only_changed_files(av_container_grading_path_fx):
+    """Test that a transaction writes only the changed data files."""
+    content = av_container_grading_path_fx.read_bytes()
+    with edit_registry() as registry:
+        registry.add_format(mimetype="yyy/zzz",
+                            content_type="TEXT",
+                            format_name_long="Test file format",
+                            format_name_short="XYZ")
+    assert av_container_grading_path_fx.read_bytes() == content
+
+
+def test_edit_registry_rollback(file_formats_path_fx):
+    """Test that nothing is written if the transaction fails."""
+    content = file_formats_path_fx.read_bytes()
+
+    with pytest.raises(ValueError):
+        with edit_registry() as registry:
+            registry.add_format(mimetype="yyy/zzz",
+                                content_type="TEXT",
+                                format_name_long="Test file format",
+                                format_name_short="XYZ")
+            registry.add_version_to_format(format_id="TEST_MIMETYPE_1",
+                                           version="1",
+                                           grade="RECOMMENDED",
+                                           support_in_dps_ingest=True,
+                                           active=True)
+
+    assert file_formats_path_fx.read_bytes() == content
+
+
+def test_edit_registry_failed_change_not_applied(file_formats_path_fx):
+    """Test that a change raising an error is not written even if the
+    error is handled in the transaction.
+    """
+    with edit_registry() as registry:
+        with pytest.raises(KeyError):
+            registry.add_version_to_format(format_id="TEST_MIMETYPE_1",
+                                           version="4",
+                                           grade="UNKNOWN",
+                                           support_in_dps_ingest=True,
+                                           active=True)
+        registry.add_version_to_format(format_id="TEST_MIMETYPE_1",
+                                       version="5",
+                                       grade="RECOMMENDED",
+                                       support_in_dps_ingest=True,
+                                       active=True)
+
+    versions = _find_format(file_formats_path_fx, "aaa/bbb")["versions"]
+    assert [version["version"] for version in versions] == \
+        ["1", "2", "3", "5"]
+
+
+def test_edit_registry_ended():
+    """Test that the editor can not be used after the transaction."""
+    with edit_registry() as registry:
+        pass
+    with pytest.raises(RuntimeError):
+        registry.add_format(mimetype="yyy/zzz",
+                            content_type="TEXT",
+                            format_name_long="Test file format",
+                            format_name_short="XYZ")
+
+
+def _add_versions(file_formats_path, process_number, count):
+    """Add versions to TEST_MIMETYPE_1 using the given file formats JSON,
+    half of them in transactions.
+    """
+    @contextlib.contextmanager
+    def resource_path(_module, _resource_name):
+        yield file_formats_path
+
+    json_handler.resource_path = resource_path
+    for number in range(count):
+        version = f"{process_number}.{number}"
+        if number % 2:
+            add_version_to_format(format_id="TEST_MIMETYPE_1",
+                                  version=version,
+                                  grade="RECOMMENDED",
+                                  support_in_dps_ingest=True,
+                                  active=True)
+        else:
+            with edit_registry() as registry:
+                registry.add_version_to_format(format_id="TEST_MIMETYPE_1",
+                                               version=version,
+                                               grade="RECOMMENDED",
+                                               support_in_dps_ingest=True,
+                                               active=True)
+
+
+def test_parallel_writers(file_formats_path_fx):
+    """Test that no update is lost when many processes update the file
+    formats at the same time.
+    """
+    processes = [
+        multiprocessing.Process(target=_add_versions,
+                                args=(file_formats_path_fx, number, 10))
+        for number in range(8)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    versions = {version["version"] for version
+                in _find_format(file_formats_path_fx, "aaa/bbb")["versions"]}
+    assert versions == {"1", "2", "3"} | {
+        f"{process}.{number}" for process in range(8) for number in range(10)}
+    assert not list(file_formats_path_fx.parent.glob("*.tmp"))
+
+
+def test_interrupted_write(file_formats_path_fx, monkeypatch):
+    """Test that the data file is left intact if writing it fails."""
+    content = file_formats_path_fx.read_bytes()
+
+    def fail(*_args, **_kwargs):
+        raise OSError("Disk full")
+
+    monkeypatch.setattr(json_handler.os, "fsync", fail)
+    with pytest.raises(OSError):
+        add_format(mimetype="yyy/zzz",
+                   content_type="TEXT",
+                   format_name_long="Test file format",
+                   format_name_short="XYZ")
+
+    assert file_formats_path_fx.read_bytes() == content
+    assert not list(file_formats_path_fx.parent.glob("*.tmp"))
+
+
+def _edit_sample(version):
+    """Make a sample of each kind of change in one transaction."""
+    with edit_registry() as registry:
+        format_id = registry.add_format(mimetype="yyy/zzz",
+                                        content_type="VIDEO",
+                                        format_name_long="Test file format",
+                                        format_name_short="XYZ")
+        registry.add_version_to_format(format_id=format_id,
+                                       version="1",
+                                       grade="RECOMMENDED",
+                                       support_in_dps_ingest=True,
+                                       active=True)
+        registry.add_version_to_format(format_id="TEST_MIMETYPE_1",
+                                       version=version,
+                                       grade="ACCEPTABLE",
+                                       support_in_dps_ingest=True,
+                                       active=True)
+        registry.replace_format(superseded_format="TEST_MIMETYPE_4",
+                                superseding_format=format_id,
+                                dps_spec_version="V14")
+        registry.add_av_container(version_id="TEST_MIMETYPE_3_1",
+                                  grade="RECOMMENDED",
+                                  video_streams=[f"{format_id}_1"])
+
+
+def test_journal(file_formats_path_fx, av_container_grading_path_fx,
+                 monkeypatch):
+    """Test that changes are appended to the journals, that readers see
+    them, and that compacting writes the same data files as writing the
+    changes directly.
+    """
+    paths = (file_formats_path_fx, av_container_grading_path_fx)
+    originals = [path.read_bytes() for path in paths]
+    _edit_sample("4")
+    _edit_sample("5")
+    expected = [path.read_bytes() for path in paths]
+    for path, content in zip(paths, originals):
+        path.write_bytes(content)
+
+    monkeypatch.setattr(json_handler, "USE_JOURNAL", True)
+    _edit_sample("4")
+    file_formats = json_handler.shared_file_formats_json()
+    assert file_formats[-1]["_id"] == "FI_DPRES_XYZ_1"
+    _edit_sample("5")
+
+    assert [path.read_bytes() for path in paths] == originals
+    # Only the added version of an existing format is in the journal
+    journal = json_handler.journal_path(file_formats_path_fx).read_bytes()
+    assert b"TEST_MIMETYPE_1_5" in journal
+    assert b"TEST_MIMETYPE_1_1" not in journal
+
+    file_formats = json_handler.shared_file_formats_json()
+    assert file_formats[-1]["_id"] == "FI_DPRES_XYZ_2"
+    assert file_formats[0]["versions"][-1]["_id"] == "TEST_MIMETYPE_1_5"
+    assert file_formats[3]["relations"][-1]["_id"] == "FI_DPRES_XYZ_2"
+    with pytest.raises(TypeError):
+        file_formats[0]["versions"].append({})
+    container = json_handler.shared_container_streams_json()[-1]
+    assert container["video_streams"][0]["version_id"] == "FI_DPRES_XYZ_2_1"
+
+    assert json_handler.compact() == list(paths)
+    assert [path.read_bytes() for path in paths] == expected
+    assert not list(file_formats_path_fx.parent.glob("*.journal"))
+    assert json_handler.compact() == []
+
+
+def test_journal_interrupted(file_formats_path_fx, monkeypatch):
+    """Test that an incomplete last record of the journal and a journal of
+    an earlier version of the data file are ignored.
+    """
+    monkeypatch.setattr(json_handler, "USE_JOURNAL", True)
+    journal = json_handler.journal_path(file_formats_path_fx)
+    add_format(mimetype="yyy/zzz",
+               content_type="TEXT",
+               format_name_long="Test file format",
+               format_name_short="XYZ")
+
+    journal.write_bytes(journal.read_bytes()
+                        + b'{"set": [[[5], {"_id": "broken"')
+    file_formats = json_handler.shared_file_formats_json()
+    assert file_formats[-1]["_id"] == "FI_DPRES_XYZ_1"
+    add_format(mimetype="yyy/zzz",
+               content_type="TEXT",
+               format_name_long="Test file format",
+               format_name_short="XYZ")
+    file_formats = json_handler.shared_file_formats_json()
+    assert [file_format["_id"] for file_format in file_formats[-2:]] \
+        == ["FI_DPRES_XYZ_1", "FI_DPRES_XYZ_2"]
+
+    # Writing the data file without removing the journal, as when
+    # interrupted, leaves a journal of another version of the file
+    file_formats_path_fx.write_bytes(file_formats_path_fx.read_bytes()
+                                     + b"\n")
+    file_formats = json_handler.shared_file_formats_json()
+    assert file_formats[-1]["_id"] == "TEST_MIMETYPE_4"